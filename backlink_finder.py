@@ -1,7 +1,7 @@
 import os
 import json
 import time
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 import click
 import requests
 from bs4 import BeautifulSoup
@@ -16,6 +16,19 @@ import aiohttp
 from tqdm import tqdm
 import pandas as pd
 from urllib.parse import urlparse, urljoin
+from fetch_scheduler import RetryScheduler, classify_exception, classify_status
+from streaming_fetch import decode_body, is_html
+from transport import TRANSPORTS, AiohttpTransport, make_transport
+from multiprocess_scrape import scrape_in_processes
+from robots_cache import HostRateLimiter, RobotsCache
+from url_record import url_record
+from site_records import SiteRecord, SiteTable
+from persistence import flush_json, write_json
+from parse_stage import ParseStage, link_is_dofollow, parse_page
+from link_graph import EdgeRecorder
+from near_duplicates import cluster_sites
+from dns_stage import CachingResolver, DnsStage
+from distributed import HttpLeaseClient, LeaseStore, default_worker_id, run_worker, serve_coordinator, wait_for_workers
 
 # Initialize Rich console for better CLI output
 console = Console()
@@ -40,7 +53,17 @@ class SourceManager:
     def __init__(self):
         self.delay = 2  # Delay between requests in seconds
         self.max_concurrent = 5  # Maximum concurrent requests
+        self.stream_fetch = True  # Gate on Content-Type and stop reading after max_body_bytes
+        self.max_body_bytes = 256 * 1024
+        self.parse_stage = None  # ParseStage, or None to parse inline on the event loop
+        self.fetch_busy = 0.0  # Seconds spent inside fetch slots, for utilization reports
+        self.robots = None  # RobotsCache; None skips robots.txt and sleeps a fixed delay per fetch
+        self.rate_limiter = HostRateLimiter()
+        self.transport = None  # Transport; None fetches through the caller's aiohttp session
+        self.link_graph = None  # EdgeRecorder for outbound links, or None to not record them
+        self.dns = None  # DnsStage resolving hosts before fetching, or None to leave DNS to the connector
         self.sources = self.load_sources()
+        self.retry_scheduler = RetryScheduler()
     
     def load_sources(self) -> Dict[str, List[str]]:
         """Load sources from sources.json"""
@@ -51,65 +74,93 @@ class SourceManager:
             console.print(f"[red]Error loading sources: {str(e)}")
             return {}
     
+    def session(self) -> aiohttp.ClientSession:
+        """Client session whose connector reuses the addresses the DNS stage already looked up"""
+        if self.dns is None:
+            return aiohttp.ClientSession()
+        return aiohttp.ClientSession(connector=aiohttp.TCPConnector(resolver=CachingResolver(self.dns)))
+
     async def is_dofollow(self, session: aiohttp.ClientSession, soup: BeautifulSoup, link: str) -> bool:
         """Check if a link is dofollow"""
         try:
-            link_tag = soup.find('a', href=link)
-            if not link_tag:
-                return False
-            return 'nofollow' not in link_tag.get('rel', [])
+            return link_is_dofollow(soup, link)
         except Exception:
             return False
 
     async def fetch_with_delay(self, session: aiohttp.ClientSession, url: str, semaphore: asyncio.Semaphore) -> Optional[str]:
         """Fetch URL content with rate limiting"""
+        if self.robots is not None:
+            # robots.txt is consulted before taking a slot, and Crawl-delay sets the per-host rate
+            await self.robots.ensure(session, url)
+            if not self.robots.can_fetch(url):
+                console.print(f"[yellow]Skipping {url}: disallowed by robots.txt")
+                return None
+            await self.rate_limiter.wait(url, max(self.delay, self.robots.crawl_delay(url) or 0))
+        
         async with semaphore:
+            started = time.monotonic()
             try:
                 headers = {
                     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
                     'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
                     'Accept-Language': 'en-US,en;q=0.5',
                 }
-                await asyncio.sleep(self.delay)
-                async with session.get(url, headers=headers, timeout=30) as response:
+                if self.robots is None:
+                    await asyncio.sleep(self.delay)
+                transport = self.transport or AiohttpTransport(session)
+                async with transport.request(url, headers=headers, timeout=30) as response:
                     if response.status == 200:
-                        return await response.text()
+                        if not self.stream_fetch:
+                            return await response.text()
+                        # Check the type before touching the body, then read only the head of the page
+                        if not is_html(response.headers.get('Content-Type')):
+                            console.print(f"[yellow]Skipping non-HTML response from {url}")
+                            return None
+                        raw = await response.read(self.max_body_bytes)
+                        return decode_body(raw, response.charset)
+                    error = classify_status(url, response.status, response.headers)
             except Exception as e:
-                console.print(f"[red]Error fetching {url}: {str(e)}")
+                error = classify_exception(url, e)
+            finally:
+                self.fetch_busy += time.monotonic() - started
+        # Transient failures go back to the retry scheduler, outside the semaphore
+        if error.retryable:
+            raise error
+        console.print(f"[red]Error fetching {url}: {error.reason}")
         return None
 
     async def check_dofollow_status(self, session: aiohttp.ClientSession, url: str, semaphore: asyncio.Semaphore) -> Dict:
         """Check if a URL provides dofollow links"""
-        content = await self.fetch_with_delay(session, url, semaphore)
-        if not content:
-            return None
+        if self.parse_stage is None:
+            content = await self.fetch_with_delay(session, url, semaphore)
+            if not content:
+                return None
+            page = parse_page(content, url)
+        else:
+            # The slot is held from fetch to parse, so a backed-up parse stage pauses fetching
+            async with self.parse_stage.reserve():
+                content = await self.fetch_with_delay(session, url, semaphore)
+                if not content:
+                    return None
+                page = await self.parse_stage.parse(url, content)
         
-        soup = BeautifulSoup(content, 'html.parser')
+        record = url_record(url)
+        if self.link_graph is not None:
+            self.link_graph.add(record.hostname, page['links'])
         result = {
             'url': url,
-            'title': soup.title.string if soup.title else url,
-            'is_dofollow': await self.is_dofollow(session, soup, url),
-            'domain': urlparse(url).netloc,
-            'type': self.categorize_site(url)
+            'title': page['title'],
+            'is_dofollow': page['is_dofollow'],
+            'domain': record.netloc,
+            'type': record.site_type,
+            'fingerprint': page['fingerprint'],
         }
         return result
 
     def categorize_site(self, url: str) -> str:
         """Categorize the type of website"""
-        domain = urlparse(url).netloc.lower()
-        
-        if '.edu' in domain:
-            return 'Educational'
-        elif '.gov' in domain:
-            return 'Government'
-        elif any(forum in domain for forum in ['forum', 'community', 'discuss']):
-            return 'Forum'
-        elif any(blog in domain for blog in ['blog', 'wordpress', 'medium']):
-            return 'Blog'
-        elif any(social in domain for social in ['linkedin', 'facebook', 'twitter']):
-            return 'Social'
-        else:
-            return 'General'
+        # Rules live in site_rules.json, in priority order
+        return url_record(url).site_type
 
 class BacklinkFinder:
     def __init__(self):
@@ -118,17 +169,21 @@ class BacklinkFinder:
         self.sites_data = self.load_existing_data()
         self.source_manager = SourceManager()
 
-    def load_existing_data(self) -> List[Dict]:
+    def load_existing_data(self) -> SiteTable:
         """Load existing data from JSON file if it exists."""
         if os.path.exists(self.data_file):
-            with open(self.data_file, 'r') as f:
-                return json.load(f)
-        return []
+            return SiteTable.load(self.data_file)
+        return SiteTable()
+
+    def set_sites(self, sites: List[Dict]) -> int:
+        """Replace the table with scraped sites, one per cluster of duplicate pages; returns the duplicates dropped"""
+        kept, _ = cluster_sites(sites)
+        self.sites_data = SiteTable.from_json(kept)
+        return len(sites) - len(kept)
 
     def save_data(self):
-        """Save scraped data to JSON file."""
-        with open(self.data_file, 'w') as f:
-            json.dump(self.sites_data, f, indent=2)
+        """Queue scraped data to be written to the JSON file in the background."""
+        write_json(self.data_file, self.sites_data.to_json(), indent=2)
 
     def get_headers(self):
         """Generate random headers for requests."""
@@ -171,9 +226,9 @@ class BacklinkFinder:
             'description': 'Create a company profile on Crunchbase'
         }]
 
-    def filter_by_niche(self, niche: str) -> List[Dict]:
+    def filter_by_niche(self, niche: str) -> List[SiteRecord]:
         """Filter sites by selected niche."""
-        return [site for site in self.sites_data if site['niche'].lower() == niche.lower()]
+        return [self.sites_data.record(row) for row in self.sites_data.rows_in_niche(niche)]
 
     async def scrape_web_directories(self) -> List[Dict]:
         """Scrape web directories for dofollow backlink opportunities"""
@@ -212,19 +267,37 @@ class BacklinkFinder:
     async def scrape_category(self, session: aiohttp.ClientSession, category: str, urls: List[str], semaphore: asyncio.Semaphore) -> List[Dict]:
         """Scrape a category of websites"""
         console.print(f"\n[yellow]Scraping {category}...")
-        results = []
-        tasks = [self.source_manager.check_dofollow_status(session, url, semaphore) for url in urls]
-        completed = await asyncio.gather(*tasks)
+        sites = await self.scrape_urls(session, [(category, url) for url in urls], semaphore)
+        return [site for site in sites if site]
+
+    async def scrape_urls(self, session: aiohttp.ClientSession, pairs: List[Tuple[str, str]], semaphore: asyncio.Semaphore) -> List[Optional[Dict]]:
+        """Scrape (category, url) pairs, returning a site entry or None for each pair"""
+        urls = [url for _, url in pairs]
+        dead = set()
+        if self.source_manager.dns is not None:
+            # Hosts that do not exist are dropped before they can hold a fetch slot until a timeout
+            dead = await self.source_manager.dns.unresolvable(urls)
+            if dead:
+                console.print(f"[yellow]Skipping {len(dead)} URLs whose hosts do not resolve")
+        live = [url for url in urls if url not in dead]
+        fetched = iter(await self.source_manager.retry_scheduler.run(
+            live, lambda url: self.source_manager.check_dofollow_status(session, url, semaphore)
+        ))
+        completed = [None if url in dead else next(fetched) for url in urls]
         
-        for result in completed:
+        results = []
+        for (category, _), result in zip(pairs, completed):
             if result and result.get('is_dofollow'):
                 results.append({
                     'site_name': result['title'],
                     'url': result['url'],
                     'niche': category,
                     'type': result['type'],
-                    'description': f"{category} site with dofollow links - {result['domain']}"
+                    'description': f"{category} site with dofollow links - {result['domain']}",
+                    'fingerprint': result['fingerprint'],
                 })
+            else:
+                results.append(None)
         
         return results
 
@@ -242,13 +315,61 @@ class BacklinkFinder:
                 progress.update(task, advance=1)
                 
                 # Save intermediate results
-                self.sites_data = all_results
+                self.set_sites(all_results)
                 self.save_data()
+                if self.source_manager.link_graph:
+                    self.source_manager.link_graph.save()
                 
                 console.print(f"[green]Found {len(results)} dofollow opportunities in {category}")
         
         return all_results
 
+def apply_scrape_options(finder: BacklinkFinder, options: Dict):
+    """Apply scrape command options to a finder (also used inside worker processes)"""
+    finder.source_manager.stream_fetch = options['stream']
+    finder.source_manager.max_body_bytes = options['max_body_bytes']
+    finder.source_manager.retry_scheduler.max_attempts = options['max_attempts']
+    finder.source_manager.retry_scheduler.max_retries_per_run = options['retry_budget']
+    if options['transport'] != 'aiohttp':
+        finder.source_manager.transport = make_transport(options['transport'])
+    if options['robots']:
+        finder.source_manager.robots = RobotsCache()
+    if options['resolve']:
+        finder.source_manager.dns = DnsStage()
+    if options['link_graph']:
+        finder.source_manager.link_graph = EdgeRecorder()
+    if options['parse_workers'] > 0:
+        finder.source_manager.parse_stage = ParseStage(
+            options['parse_workers'], options['parse_queue'], options['parse_executor']
+        )
+
+def report_retries(scheduler: RetryScheduler):
+    """Print how many fetches were retried and why URLs were finally given up on"""
+    if scheduler.stats:
+        console.print(f"[yellow]Retried {scheduler.run_retries} fetches; failures by reason: {scheduler.stats}")
+    if scheduler.given_up:
+        console.print(f"[red]Gave up on {sum(scheduler.given_up.values())} URLs:")
+        for reason, count in sorted(scheduler.given_up.items(), key=lambda item: -item[1]):
+            console.print(f"[red]  {count:>6}  {reason}")
+
+def scrape_options(command):
+    """Click options read by apply_scrape_options, shared by scrape and scrape-worker"""
+    for option in reversed([
+        click.option('--max-attempts', type=int, default=4, help='Attempts per URL before giving up on transient errors'),
+        click.option('--retry-budget', type=int, default=1000, help='Maximum number of retries for the whole run, split across --processes (per worker for scrape-worker)'),
+        click.option('--max-body-bytes', type=int, default=256 * 1024, help='Stop reading each page after this many bytes'),
+        click.option('--stream/--no-stream', default=True, help='Stream pages with Content-Type gating and a byte budget'),
+        click.option('--parse-workers', type=int, default=2, help='Parser pool size; 0 parses inline on the event loop'),
+        click.option('--parse-executor', type=click.Choice(['thread', 'process']), default='thread'),
+        click.option('--parse-queue', type=int, default=32, help='Fetched pages allowed to wait for a parser'),
+        click.option('--robots/--no-robots', default=True, help='Honor robots.txt rules and Crawl-delay'),
+        click.option('--transport', type=click.Choice(list(TRANSPORTS)), default='aiohttp', help='HTTP client; httpx multiplexes requests to a host over HTTP/2'),
+        click.option('--link-graph/--no-link-graph', default=True, help='Record outbound links for link_graph.py authority scores'),
+        click.option('--resolve/--no-resolve', default=True, help='Resolve hosts first and skip those that do not exist'),
+    ]):
+        command = option(command)
+    return command
+
 @click.group()
 def cli():
     """Backlink Profile Finder CLI"""
@@ -256,12 +377,39 @@ def cli():
 
 @cli.command()
 @click.option('--category', type=click.Choice(['all'] + list(SourceManager().sources.keys())), default='all')
-def scrape(category):
+@click.option('--processes', type=int, default=1, help='Shard URLs by host across this many worker processes')
+@scrape_options
+def scrape(category, processes, **options):
     """Scrape websites for backlink opportunities"""
     finder = BacklinkFinder()
+    apply_scrape_options(finder, options)
+    
+    if processes > 1:
+        sources = finder.source_manager.sources
+        if category != 'all':
+            sources = {category: sources.get(category, [])}
+        pairs = [(name, url) for name, urls in sources.items() for url in urls]
+        
+        with Progress() as progress:
+            task = progress.add_task(f"[cyan]Scraping with {processes} processes...", total=len(pairs))
+            duplicates = finder.set_sites(scrape_in_processes(
+                pairs, processes, options, on_progress=lambda count: progress.update(task, advance=count),
+                source_manager=finder.source_manager,
+            ))
+        finder.save_data()
+        if finder.source_manager.robots:
+            finder.source_manager.robots.save()
+        if finder.source_manager.dns:
+            finder.source_manager.dns.save()
+        flush_json()
+        console.print(f"\n[green]Successfully scraped {len(finder.sites_data)} sites!")
+        if duplicates:
+            console.print(f"[yellow]Dropped {duplicates} duplicate or near-duplicate pages (see page_clusters.json)")
+        report_retries(finder.source_manager.retry_scheduler)
+        return
     
     async def run_scraper():
-        async with aiohttp.ClientSession() as session:
+        async with finder.source_manager.session() as session:
             semaphore = asyncio.Semaphore(finder.source_manager.max_concurrent)
             
             if category == 'all':
@@ -270,11 +418,101 @@ def scrape(category):
                 urls = finder.source_manager.sources.get(category, [])
                 results = await finder.scrape_category(session, category, urls, semaphore)
             
-            finder.sites_data = results
+            duplicates = finder.set_sites(results)
             finder.save_data()
+            if finder.source_manager.robots:
+                finder.source_manager.robots.save()
+            if finder.source_manager.link_graph:
+                finder.source_manager.link_graph.save()
+            if finder.source_manager.dns:
+                finder.source_manager.dns.save()
+            if finder.source_manager.transport:
+                await finder.source_manager.transport.close()
             console.print(f"\n[green]Successfully scraped {len(finder.sites_data)} sites!")
+            if duplicates:
+                console.print(f"[yellow]Dropped {duplicates} duplicate or near-duplicate pages (see page_clusters.json)")
+            
+            report_retries(finder.source_manager.retry_scheduler)
+            
+            stage = finder.source_manager.parse_stage
+            if stage:
+                report = stage.report(finder.source_manager.fetch_busy, finder.source_manager.max_concurrent)
+                console.print(f"[cyan]Pipeline: {report}")
+                await stage.close()
+    
+    asyncio.run(run_scraper())
+    flush_json()
+
+@cli.command('scrape-coordinator')
+@click.option('--category', type=click.Choice(['all'] + list(SourceManager().sources.keys())), default='all')
+@click.option('--queue', 'queue_path', default='scrape_queue.db', help='SQLite file holding shards, leases and results')
+@click.option('--shards', type=int, default=64, help='Number of host-hashed shards to lease out')
+@click.option('--serve', default=None, help='HOST:PORT to expose the queue over HTTP for remote workers')
+@click.option('--resume', is_flag=True, help='Keep the existing queue instead of re-partitioning the sources')
+def scrape_coordinator(category, queue_path, shards, serve, resume):
+    """Partition sources for scrape-worker processes and merge their results"""
+    finder = BacklinkFinder()
+    store = LeaseStore(queue_path)
+    
+    if not (resume and store.is_loaded()):
+        sources = finder.source_manager.sources
+        if category != 'all':
+            sources = {category: sources.get(category, [])}
+        store.load(sources, shards)
+    
+    if serve:
+        host, port = serve.rsplit(':', 1)
+        serve_coordinator(store, host, int(port))
+        console.print(f"[cyan]Coordinator listening on http://{serve}")
+    
+    async def run_coordinator():
+        with Progress() as progress:
+            task = progress.add_task("[cyan]Waiting for workers...", total=sum(store.progress().values()))
+            await wait_for_workers(store, lambda counts: progress.update(task, completed=counts['done']))
+    
+    asyncio.run(run_coordinator())
+    
+    duplicates = finder.set_sites(store.merged_results())
+    finder.save_data()
+    flush_json()
+    console.print(f"\n[green]Merged {len(finder.sites_data)} sites from workers into {finder.data_file}")
+    if duplicates:
+        console.print(f"[yellow]Dropped {duplicates} duplicate or near-duplicate pages (see page_clusters.json)")
+
+@cli.command('scrape-worker')
+@click.option('--queue', 'queue_path', default='scrape_queue.db', help='SQLite queue shared with the coordinator')
+@click.option('--coordinator', default=None, help='Coordinator URL, e.g. http://10.0.0.5:8765, instead of a shared file')
+@click.option('--worker-id', default=None, help='Defaults to hostname-pid')
+@click.option('--lease-ttl', type=float, default=120, help='Seconds before an un-renewed lease is handed to another worker')
+@scrape_options
+def scrape_worker(queue_path, coordinator, worker_id, lease_ttl, **options):
+    """Lease shards from a coordinator and scrape them"""
+    finder = BacklinkFinder()
+    apply_scrape_options(finder, options)
+    queue = HttpLeaseClient(coordinator) if coordinator else LeaseStore(queue_path)
+    worker_id = worker_id or default_worker_id()
+    
+    async def run_scraper():
+        async with finder.source_manager.session() as session:
+            semaphore = asyncio.Semaphore(finder.source_manager.max_concurrent)
+            completed = await run_worker(
+                queue, worker_id, lambda pairs: finder.scrape_urls(session, pairs, semaphore), ttl=lease_ttl
+            )
+            if finder.source_manager.parse_stage:
+                await finder.source_manager.parse_stage.close()
+            if finder.source_manager.robots:
+                finder.source_manager.robots.save()
+            if finder.source_manager.link_graph:
+                finder.source_manager.link_graph.save()
+            if finder.source_manager.dns:
+                finder.source_manager.dns.save()
+            if finder.source_manager.transport:
+                await finder.source_manager.transport.close()
+            console.print(f"[green]Worker {worker_id} completed {completed} shards")
+            report_retries(finder.source_manager.retry_scheduler)
     
     asyncio.run(run_scraper())
+    flush_json()
 
 @cli.command()
 @click.option('--niche', type=click.Choice(['all'] + list(SourceManager().sources.keys()), case_sensitive=False), prompt='Select your niche')
@@ -286,10 +524,7 @@ def find(niche):
         console.print("[yellow]No data available. Please run 'scrape' command first.")
         return
     
-    filtered_sites = finder.sites_data if niche == 'all' else [
-        site for site in finder.sites_data 
-        if site['niche'].lower() == niche.lower()
-    ]
+    filtered_sites = list(finder.sites_data) if niche == 'all' else finder.filter_by_niche(niche)
     
     if not filtered_sites:
         console.print(f"[yellow]No sites found for niche: {niche}")
@@ -303,10 +538,10 @@ def find(niche):
     
     for site in filtered_sites:
         table.add_row(
-            site['site_name'],
-            site['url'],
-            site['type'],
-            site['description']
+            site.site_name,
+            site.url,
+            site.type,
+            site.description
         )
     
     console.print(table)
@@ -0,0 +1,351 @@
+import argparse
+import glob
+import os
+import random
+import re
+import sys
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from bs4 import BeautifulSoup
+
+from metric_extractors import EXTRACTORS, extract_smallseotools_token
+
+
+# Reference parsers: the BeautifulSoup code the free_metrics scrapers used before
+# metric_extractors, minus the HTTP requests. The benchmark checks the extractors
+# against these, page by page.
+
+def legacy_websiteseochecker(text: str) -> Optional[Dict]:
+    soup = BeautifulSoup(text, 'html.parser')
+    results = soup.select('.result-table tr, .results-table tr, table.results tr, .domain-metrics tr')
+    da = None
+    pa = None
+    spam_score = None
+    for row in results:
+        cells = row.select('td')
+        if len(cells) >= 2:
+            label = cells[0].get_text().strip().lower()
+            value = cells[1].get_text().strip()
+            if 'domain authority' in label or 'da' in label:
+                try:
+                    da = int(re.search(r'\d+', value).group())
+                except:
+                    pass
+            elif 'page authority' in label or 'pa' in label:
+                try:
+                    pa = int(re.search(r'\d+', value).group())
+                except:
+                    pass
+            elif 'spam score' in label or 'spam' in label:
+                try:
+                    spam_score = int(re.search(r'\d+', value).group())
+                except:
+                    if '%' in value:
+                        try:
+                            percentage = float(re.search(r'\d+', value).group())
+                            spam_score = int((percentage / 100) * 14)
+                        except:
+                            pass
+    if da is None:
+        for element in soup.select('[data-metric="da"], .da-score, .domain-authority, .metric-da'):
+            try:
+                da = int(re.search(r'\d+', element.get_text()).group())
+                break
+            except:
+                pass
+    if pa is None:
+        for element in soup.select('[data-metric="pa"], .pa-score, .page-authority, .metric-pa'):
+            try:
+                pa = int(re.search(r'\d+', element.get_text()).group())
+                break
+            except:
+                pass
+    if spam_score is None:
+        for element in soup.select('[data-metric="spam"], .spam-score, .spam-metric, .metric-spam'):
+            try:
+                spam_score = int(re.search(r'\d+', element.get_text()).group())
+                break
+            except:
+                pass
+    if da is None:
+        da_matches = re.search(r'domain authority.*?(\d+)', text, re.IGNORECASE)
+        if da_matches:
+            da = int(da_matches.group(1))
+    if pa is None:
+        pa_matches = re.search(r'page authority.*?(\d+)', text, re.IGNORECASE)
+        if pa_matches:
+            pa = int(pa_matches.group(1))
+    if da is None:
+        da = 0
+    if pa is None:
+        pa = 0
+    if spam_score is None:
+        spam_score = 0
+    if da == 0 and pa == 0 and spam_score == 0:
+        if re.search(r'no data|not found|no results', text, re.IGNORECASE):
+            return None
+    return {"da": da, "pa": pa, "spam_score": spam_score}
+
+
+def legacy_seositecheckup(text: str) -> Optional[Dict]:
+    soup = BeautifulSoup(text, 'html.parser')
+    da = 0
+    pa = 0
+    spam_score = 0
+    for element in soup.select('.domain-authority, .page-authority, [data-metric="authority"]'):
+        element_text = element.get_text().lower()
+        if 'domain authority' in element_text or 'da:' in element_text:
+            try:
+                da = int(re.search(r'\d+', element_text).group())
+            except:
+                pass
+        elif 'page authority' in element_text or 'pa:' in element_text:
+            try:
+                pa = int(re.search(r'\d+', element_text).group())
+            except:
+                pass
+    if da == 0:
+        da_match = re.search(r'domain authority.*?(\d+)', text, re.IGNORECASE)
+        if da_match:
+            da = int(da_match.group(1))
+    if pa == 0:
+        pa_match = re.search(r'page authority.*?(\d+)', text, re.IGNORECASE)
+        if pa_match:
+            pa = int(pa_match.group(1))
+    if da > 0:
+        spam_score = max(0, 14 - int(da / 7))
+    if da == 0 and pa == 0:
+        return None
+    return {"da": da, "pa": pa, "spam_score": spam_score}
+
+
+def legacy_smallseotools_token(text: str) -> str:
+    soup = BeautifulSoup(text, 'html.parser')
+    token_input = soup.select_one('input[name="token"]')
+    return token_input['value'] if token_input else ""
+
+
+def legacy_smallseotools(text: str) -> Optional[Dict]:
+    soup = BeautifulSoup(text, 'html.parser')
+    result_container = soup.select_one('.resultBox, .result-container, .da-results')
+    if not result_container:
+        return None
+    da = 0
+    pa = 0
+    spam_score = 0
+    da_element = result_container.select_one('.da-score, .domain-authority, [data-metric="da"]')
+    if da_element:
+        try:
+            da = int(re.search(r'\d+', da_element.get_text()).group())
+        except:
+            pass
+    pa_element = result_container.select_one('.pa-score, .page-authority, [data-metric="pa"]')
+    if pa_element:
+        try:
+            pa = int(re.search(r'\d+', pa_element.get_text()).group())
+        except:
+            pass
+    if da == 0:
+        da_match = re.search(r'domain authority.*?(\d+)', result_container.get_text(), re.IGNORECASE)
+        if da_match:
+            da = int(da_match.group(1))
+    if pa == 0:
+        pa_match = re.search(r'page authority.*?(\d+)', result_container.get_text(), re.IGNORECASE)
+        if pa_match:
+            pa = int(pa_match.group(1))
+    if da > 0:
+        spam_score = max(0, 14 - int(da / 7))
+    if da == 0 and pa == 0:
+        return None
+    return {"da": da, "pa": pa, "spam_score": spam_score}
+
+
+def legacy_semrush(text: str) -> Optional[Dict]:
+    soup = BeautifulSoup(text, 'html.parser')
+    for element in soup.select('.cl-overview-domain__authority-score, .domain-score, .authority-score'):
+        try:
+            authority_score = int(re.search(r'\d+', element.get_text()).group())
+            return {"da": authority_score, "pa": max(0, authority_score - 5),
+                    "spam_score": max(0, 14 - int(authority_score / 7))}
+        except:
+            pass
+    authority_match = re.search(r'authority score.*?(\d+)', text, re.IGNORECASE)
+    if authority_match:
+        authority_score = int(authority_match.group(1))
+        return {"da": authority_score, "pa": max(0, authority_score - 5),
+                "spam_score": max(0, 14 - int(authority_score / 7))}
+    return None
+
+
+LEGACY: Dict[str, Callable[[str], Optional[Dict]]] = {
+    'websiteseochecker': legacy_websiteseochecker,
+    'seositecheckup': legacy_seositecheckup,
+    'smallseotools': legacy_smallseotools,
+    'semrush': legacy_semrush,
+    'smallseotools_token': legacy_smallseotools_token,
+}
+NEW: Dict[str, Callable[[str], object]] = dict(EXTRACTORS, smallseotools_token=extract_smallseotools_token)
+
+
+# Synthetic fixtures: provider-shaped result markup buried in ordinary page
+# chrome, with the decoys the fallbacks have to get right (numbers in scripts
+# and comments, labels without numbers, rows outside result tables, nesting)
+
+LABELS = ['Domain Authority', 'DA', 'Page Authority', 'PA', 'Spam Score', 'Spam', 'Updated', 'Moz Rank', 'Backlinks']
+VALUES = ['45', ' 45/100 ', '3%', 'n/a', '12', '0', '100', '<b>67</b>', '7 (low)', '']
+INLINE = ['Domain Authority: {n}', 'domain authority is\n{n}', 'Page Authority <span>{n}</span>',
+          'PAGE AUTHORITY - {n}', 'Authority Score {n}', 'authority score</span> <b>{n}</b>',
+          'No data found for this domain', 'da: {n}', 'PA: {n}', 'Domain Authority unavailable']
+
+
+def filler(rng: random.Random, size: int) -> str:
+    parts = []
+    total = 0
+    while total < size:
+        kind = rng.randrange(6)
+        if kind == 0:
+            chunk = '<nav class="menu"><ul>' + ''.join(
+                f'<li><a href="/p{rng.randrange(999)}">Item {rng.randrange(99)}</a></li>' for _ in range(8)) + '</ul></nav>'
+        elif kind == 1:
+            chunk = f'<p class="text">Lorem ipsum dolor sit amet &amp; consectetur {rng.randrange(10000)} adipiscing elit.<br>Sed do eiusmod.</p>'
+        elif kind == 2:
+            chunk = f'<script>var stats = {{"domain authority": {rng.randrange(100)}}};</script>'
+        elif kind == 3:
+            chunk = f'<!-- page authority {rng.randrange(100)} --><div class="card"><img src="/i.png"><span>Card</span></div>'
+        elif kind == 4:
+            chunk = '<table class="pricing"><tr><td>DA checker</td><td>99</td></tr></table>'
+        else:
+            chunk = '<div class="footer"><div><div><span>&copy; 2024</span></div></div></div>\n'
+        parts.append(chunk)
+        total += len(chunk)
+    return ''.join(parts)
+
+
+def metric_block(rng: random.Random, provider: str) -> str:
+    n = lambda: rng.randrange(0, 101)
+    blocks = []
+    if provider == 'websiteseochecker':
+        container = rng.choice(['div class="result-table"', 'div class="results-table"', 'table class="results"',
+                                'div class="domain-metrics"', 'div class="other"'])
+        rows = ''.join(f'<tr><td> {rng.choice(LABELS)} </td><td>{rng.choice(VALUES)}</td>'
+                       + ('<td>extra 5</td>' if rng.random() < 0.2 else '') + '</tr>'
+                       for _ in range(rng.randrange(0, 5)))
+        if rng.random() < 0.2:
+            rows += '<tr><td>Domain Authority</td></tr>'
+        tag = container.split()[0]
+        inner = rows if tag == 'table' else f'<table>{rows}</table>'
+        blocks.append(f'<{container}>{inner}</{tag}>')
+        for cls in ['da-score', 'domain-authority', 'pa-score', 'metric-pa', 'spam-score', 'metric-spam']:
+            if rng.random() < 0.25:
+                blocks.append(f'<div class="{cls}">{rng.choice(["score ", ""])}{rng.choice([str(n()), "none"])}</div>')
+        if rng.random() < 0.2:
+            blocks.append(f'<span data-metric="{rng.choice(["da", "pa", "spam"])}">{n()}</span>')
+    elif provider == 'seositecheckup':
+        for _ in range(rng.randrange(0, 4)):
+            cls = rng.choice(['domain-authority', 'page-authority'])
+            text = rng.choice(['Domain Authority: {n}', 'DA: {n}', 'Page Authority {n}', 'PA: {n}', 'Authority', 'da: none'])
+            blocks.append(f'<div class="{cls}"><h4>{text.format(n=n())}</h4></div>')
+        if rng.random() < 0.2:
+            blocks.append(f'<div data-metric="authority"><span class="domain-authority">DA: {n()}</span> PA: {n()}</div>')
+    elif provider == 'smallseotools':
+        if rng.random() < 0.5:
+            blocks.append(f'<form><input type="hidden" name="token" value="tok{rng.randrange(10**6)}"><input name="domain"></form>')
+        if rng.random() < 0.8:
+            cls = rng.choice(['resultBox', 'result-container', 'da-results'])
+            inner = ''
+            if rng.random() < 0.7:
+                inner += f'<div class="{rng.choice(["da-score", "domain-authority"])}">{rng.choice([str(n()), "-"])}</div>'
+            if rng.random() < 0.7:
+                inner += f'<div data-metric="pa">{rng.choice([str(n()), "-"])}</div>'
+            if rng.random() < 0.4:
+                inner += f'<p>{rng.choice(INLINE).format(n=n())}</p>'
+            blocks.append(f'<div class="{cls}">{inner}</div>')
+            if rng.random() < 0.3:
+                blocks.append(f'<div class="resultBox"><div class="da-score">{n()}</div></div>')
+        if rng.random() < 0.3:
+            blocks.append(f'<div class="da-score">{n()}</div>')
+    elif provider == 'semrush':
+        for _ in range(rng.randrange(0, 3)):
+            cls = rng.choice(['cl-overview-domain__authority-score', 'domain-score', 'authority-score'])
+            content = rng.choice([str(n()), 'loading', f'<span class="authority-score">{n()}</span>',
+                                  f'AS <b>{n()}</b>'])
+            blocks.append(f'<div class="{cls}">{content}</div>')
+    for _ in range(rng.randrange(0, 3)):
+        blocks.append(f'<p>{rng.choice(INLINE).format(n=n())}</p>')
+    rng.shuffle(blocks)
+    return ''.join(blocks)
+
+
+def make_fixtures(count: int, size: int, seed: int) -> Dict[str, List[Tuple[str, str]]]:
+    """count pages of roughly size bytes per provider, as (name, html)"""
+    rng = random.Random(seed)
+    fixtures: Dict[str, List[Tuple[str, str]]] = {}
+    for provider in EXTRACTORS:
+        pages = []
+        for i in range(count):
+            head = '<!DOCTYPE html><html><head><title>Checker</title><style>.da-score{color:red}</style></head><body>'
+            before = filler(rng, rng.randrange(size // 2 + 1))
+            after = filler(rng, size - len(before))
+            pages.append((f"{provider}-{i}", head + before + metric_block(rng, provider) + after + '</body></html>'))
+        fixtures[provider] = pages
+    fixtures['smallseotools_token'] = fixtures['smallseotools']
+    return fixtures
+
+
+def load_fixtures(directory: str) -> Dict[str, List[Tuple[str, str]]]:
+    """Saved pages named <provider>-*.html (or .htm) from a directory"""
+    fixtures: Dict[str, List[Tuple[str, str]]] = {}
+    for path in sorted(glob.glob(os.path.join(directory, '*.htm*'))):
+        name = os.path.basename(path)
+        provider = name.split('-', 1)[0]
+        if provider in EXTRACTORS:
+            with open(path, encoding='utf-8', errors='replace') as f:
+                fixtures.setdefault(provider, []).append((name, f.read()))
+    if 'smallseotools' in fixtures:
+        fixtures['smallseotools_token'] = fixtures['smallseotools']
+    return fixtures
+
+
+def timed(parse: Callable[[str], object], pages: List[Tuple[str, str]], repeat: int) -> Tuple[float, List]:
+    """Best per-page seconds over repeat runs, and the results of the last run"""
+    best = float('inf')
+    results: List = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        results = []
+        for _, html in pages:
+            try:
+                results.append(parse(html))
+            except Exception as e:
+                results.append(f"{type(e).__name__}: {e}")
+        best = min(best, (time.perf_counter() - start) / max(1, len(pages)))
+    return best, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check metric extractors against the BeautifulSoup parsers and time both')
+    parser.add_argument('--fixtures', default=None, help='Directory of saved <provider>-*.html pages instead of synthetic ones')
+    parser.add_argument('--pages', type=int, default=40, help='Synthetic pages per provider')
+    parser.add_argument('--size', type=int, default=40000, help='Synthetic page size in bytes')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=2, help='Timing runs; the best is reported')
+    args = parser.parse_args()
+
+    fixtures = load_fixtures(args.fixtures) if args.fixtures else make_fixtures(args.pages, args.size, args.seed)
+    mismatches = 0
+    print(f"{'provider':<22}{'pages':>6}{'legacy ms':>11}{'new ms':>9}{'speedup':>9}{'mismatch':>10}")
+    for provider, pages in fixtures.items():
+        legacy_time, expected = timed(LEGACY[provider], pages, args.repeat)
+        new_time, actual = timed(NEW[provider], pages, args.repeat)
+        wrong = [(name, want, got) for (name, _), want, got in zip(pages, expected, actual) if want != got]
+        mismatches += len(wrong)
+        print(f"{provider:<22}{len(pages):>6}{legacy_time * 1000:>11.2f}{new_time * 1000:>9.2f}"
+              f"{legacy_time / new_time:>8.1f}x{len(wrong):>10}")
+        for name, want, got in wrong[:5]:
+            print(f"  {name}: expected {want}, got {got}")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+import argparse
+import asyncio
+import statistics
+import time
+from typing import Dict, List, Optional
+
+from transport import TRANSPORTS, make_transport
+
+try:
+    from hypercorn.asyncio import serve
+    from hypercorn.config import Config
+except ImportError:
+    serve = None
+
+
+class BenchServer:
+    """Local HTTP/1.1 + h2c server returning a fixed page after a fixed delay.
+
+    Counts distinct client connections, so the report can show how many
+    sockets each transport needed for the same batch.
+    """
+
+    def __init__(self, latency: float, size: int):
+        self.latency = latency
+        self.body = (b'<html><head><title>bench</title></head><body>'
+                     + b'x' * max(0, size - 64) + b'</body></html>')
+        self.connections = set()
+        self.shutdown = asyncio.Event()
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return
+        self.connections.add(tuple(scope['client'] or ()))
+        await asyncio.sleep(self.latency)
+        await send({'type': 'http.response.start', 'status': 200,
+                    'headers': [(b'content-type', b'text/html; charset=utf-8')]})
+        await send({'type': 'http.response.body', 'body': self.body})
+
+    async def start(self, port: int) -> asyncio.Task:
+        if serve is None:
+            raise ImportError("the local benchmark server needs: pip install hypercorn (or pass --url)")
+        config = Config()
+        config.bind = [f"127.0.0.1:{port}"]
+        config.loglevel = 'WARNING'
+        config.keep_alive_timeout = 60
+        task = asyncio.ensure_future(serve(self, config, shutdown_trigger=self.shutdown.wait))
+        await asyncio.sleep(0.5)
+        return task
+
+
+async def run_batch(name: str, url: str, requests: int, concurrency: int, connections: int) -> Dict:
+    """Fetch url `requests` times with `concurrency` in flight through one transport"""
+    if name == 'aiohttp':
+        transport = make_transport(name, limit_per_host=connections)
+    else:
+        transport = make_transport(name, max_connections=connections, prior_knowledge=url.startswith('http://'))
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    versions = set()
+    errors = 0
+
+    async def fetch_one(index: int):
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                async with transport.request(f"{url}?n={index}") as response:
+                    await response.read()
+                    versions.add(response.http_version)
+            except Exception:
+                errors += 1
+                return
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(fetch_one(i) for i in range(requests)))
+    finally:
+        await transport.close()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'transport': name,
+        'protocol': '/'.join(sorted(versions)) or '-',
+        'seconds': elapsed,
+        'req_per_s': len(latencies) / elapsed if elapsed else 0.0,
+        'p50_ms': statistics.median(latencies) * 1000 if latencies else 0.0,
+        'p95_ms': latencies[int(len(latencies) * 0.95) - 1] * 1000 if latencies else 0.0,
+        'errors': errors,
+    }
+
+
+async def main(args):
+    server: Optional[BenchServer] = None
+    url = args.url
+    if url is None:
+        server = BenchServer(args.latency, args.size)
+        server_task = await server.start(args.port)
+        url = f"http://127.0.0.1:{args.port}/page"
+
+    print(f"{args.requests} requests to {url}, {args.concurrency} in flight, "
+          f"at most {args.connections} connections per transport")
+    print(f"{'transport':<10}{'protocol':<12}{'seconds':>9}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'errors':>8}{'conns':>7}")
+    try:
+        for name in args.transports:
+            if server:
+                server.connections.clear()
+            result = await run_batch(name, url, args.requests, args.concurrency, args.connections)
+            connections = len(server.connections) if server else '-'
+            print(f"{result['transport']:<10}{result['protocol']:<12}{result['seconds']:>9.2f}{result['req_per_s']:>9.0f}"
+                  f"{result['p50_ms']:>9.1f}{result['p95_ms']:>9.1f}{result['errors']:>8}{connections:>7}")
+    finally:
+        if server:
+            server.shutdown.set()
+            await server_task
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Compare HTTP transports on a batch of same-host requests')
+    parser.add_argument('--url', default=None, help='Benchmark against this URL instead of a local server')
+    parser.add_argument('--transports', nargs='+', choices=list(TRANSPORTS), default=list(TRANSPORTS))
+    parser.add_argument('--requests', type=int, default=500, help='Requests per transport')
+    parser.add_argument('--concurrency', type=int, default=100, help='Requests in flight at once')
+    parser.add_argument('--connections', type=int, default=6, help='Connection limit per transport, like a browser')
+    parser.add_argument('--latency', type=float, default=0.05, help='Local server delay per response in seconds')
+    parser.add_argument('--size', type=int, default=20000, help='Local server page size in bytes')
+    parser.add_argument('--port', type=int, default=8443, help='Port for the local server')
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,167 @@
+import asyncio
+import heapq
+import itertools
+import json
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+from persistence import write_json
+from seen_filter import BloomFilter
+from source_store import canonical_url
+from url_record import url_record
+
+# Keywords that tie a host or link to a sources.json category
+CATEGORY_KEYWORDS = {
+    'edu_domains': ('.edu', 'university', 'college'),
+    'forums': ('forum', 'community', 'discuss'),
+    'blog_platforms': ('blog', 'wordpress', 'medium', 'tumblr'),
+}
+
+# Pages that tend to link out to many candidates
+HUB_KEYWORDS = ('list', 'directory', 'directories', 'universities', 'colleges', 'forums', 'blogs')
+
+
+def classify_host(host: str) -> Optional[str]:
+    """Category a newly discovered host belongs to, if any"""
+    host = host.lower()
+    if host.endswith('.edu') or '.edu.' in host:
+        return 'edu_domains'
+    for category in ('forums', 'blog_platforms'):
+        if any(keyword in host for keyword in CATEGORY_KEYWORDS[category]):
+            return category
+    return None
+
+
+def relevance(url: str, anchor: str = '') -> int:
+    """Number of category and hub keywords in a link and its anchor text"""
+    text = f"{url} {anchor}".lower()
+    score = sum(text.count(keyword) for keywords in CATEGORY_KEYWORDS.values() for keyword in keywords)
+    return score + sum(keyword in text for keyword in HUB_KEYWORDS)
+
+
+class CrawlFrontier:
+    """Priority crawl frontier with per-host queues and politeness.
+
+    URLs are scored by keyword relevance minus a depth penalty. Each host has its
+    own queue and may only be fetched once every host_delay seconds; among ready
+    hosts, the one with the best URL goes first. Crawled URLs go into a
+    file-backed Bloom filter at seen_path, and pending URLs and per-host page
+    counts are snapshotted to frontier_path, so an interrupted crawl resumes where it left off.
+    """
+
+    def __init__(self, max_depth: int = 2, max_pages_per_host: int = 20, host_delay: float = 2.0,
+                 seen_path: str = 'crawl_seen.bloom', frontier_path: str = 'crawl_frontier.json',
+                 seen_capacity: int = 10_000_000):
+        self.max_depth = max_depth
+        self.max_pages_per_host = max_pages_per_host
+        self.host_delay = host_delay
+        self.seen_path = seen_path
+        self.frontier_path = frontier_path
+        self.counter = itertools.count()
+        self.host_queues: Dict[str, List[Tuple[float, int, str, int]]] = {}
+        self.host_pages: Dict[str, int] = {}
+        self.next_allowed: Dict[str, float] = {}
+        self.host_delays: Dict[str, float] = {}
+        self.ready: List[Tuple[float, int, str]] = []
+        self.waiting: List[Tuple[float, int, str]] = []
+        self.scheduled_hosts = set()
+        self.queued = set()
+        self.seen = BloomFilter(seen_capacity, path=seen_path)
+        self._load_frontier()
+
+    def _load_frontier(self):
+        if not os.path.exists(self.frontier_path):
+            return
+        with open(self.frontier_path) as f:
+            snapshot = json.load(f)
+        # Older snapshots are a bare list of pending URLs
+        if isinstance(snapshot, list):
+            snapshot = {'pending': snapshot}
+        for url, depth, priority in snapshot['pending']:
+            self._push(url, depth, priority)
+        # Pages already crawled count towards the cap too, not just the pending ones
+        self.host_pages.update(snapshot.get('host_pages', {}))
+
+    def __len__(self) -> int:
+        return len(self.queued)
+
+    def priority(self, url: str, depth: int, anchor: str = '') -> float:
+        return relevance(url, anchor) * 10 - depth * 5
+
+    def add(self, url: str, depth: int, anchor: str = '') -> bool:
+        """Queue a URL unless it is too deep, already seen, or its host is at its cap"""
+        if depth > self.max_depth or not url.startswith('http'):
+            return False
+        key = canonical_url(url)
+        if key in self.seen or key in self.queued:
+            return False
+        host = url_record(url).canonical_host
+        if self.host_pages.get(host, 0) >= self.max_pages_per_host:
+            return False
+        self._push(url, depth, self.priority(url, depth, anchor))
+        return True
+
+    def set_host_delay(self, url: str, delay: float):
+        """Space fetches to url's host further apart than host_delay, e.g. for a robots.txt Crawl-delay"""
+        self.host_delays[url_record(url).canonical_host] = max(self.host_delay, delay)
+
+    def _push(self, url: str, depth: int, priority: float):
+        record = url_record(url)
+        key = record.canonical
+        host = record.canonical_host
+        self.queued.add(key)
+        self.host_pages[host] = self.host_pages.get(host, 0) + 1
+        heapq.heappush(self.host_queues.setdefault(host, []), (-priority, next(self.counter), url, depth))
+        self._schedule(host)
+
+    def _schedule(self, host: str):
+        if host in self.scheduled_hosts or not self.host_queues.get(host):
+            return
+        self.scheduled_hosts.add(host)
+        ready_at = self.next_allowed.get(host, 0)
+        if ready_at <= time.monotonic():
+            heapq.heappush(self.ready, (self.host_queues[host][0][0], next(self.counter), host))
+        else:
+            heapq.heappush(self.waiting, (ready_at, next(self.counter), host))
+
+    def pop(self) -> Tuple[Optional[Tuple[str, int]], Optional[float]]:
+        """Best URL on a host that may be fetched now, or the seconds until one can be"""
+        now = time.monotonic()
+        while self.waiting and self.waiting[0][0] <= now:
+            _, _, host = heapq.heappop(self.waiting)
+            heapq.heappush(self.ready, (self.host_queues[host][0][0], next(self.counter), host))
+        if not self.ready:
+            return None, (self.waiting[0][0] - now if self.waiting else None)
+
+        _, _, host = heapq.heappop(self.ready)
+        self.scheduled_hosts.discard(host)
+        _, _, url, depth = heapq.heappop(self.host_queues[host])
+        self.next_allowed[host] = now + self.host_delays.get(host, self.host_delay)
+        self._schedule(host)
+
+        key = canonical_url(url)
+        self.queued.discard(key)
+        self.seen.add(key)
+        return (url, depth), None
+
+    async def get(self) -> Optional[Tuple[str, int]]:
+        """Wait for the next URL that politeness allows; None once the frontier is empty"""
+        while True:
+            item, wait = self.pop()
+            if item is not None:
+                return item
+            if wait is None:
+                return None
+            await asyncio.sleep(wait)
+
+    def save(self):
+        """Flush the seen filter and snapshot pending URLs and per-host page counts for a later resume"""
+        self.seen.flush()
+        pending = [[url, depth, -priority] for queue in self.host_queues.values()
+                   for priority, _, url, depth in queue]
+        write_json(self.frontier_path, {'pending': pending, 'host_pages': dict(self.host_pages)})
+
+    def close(self):
+        self.save()
+        self.seen.close()
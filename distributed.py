@@ -0,0 +1,258 @@
+import asyncio
+import bisect
+import hashlib
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from url_record import url_record
+
+
+def host_of(url: str) -> str:
+    """Host part of a URL, used as the partitioning key"""
+    return url_record(url).host
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class HashRing:
+    """Consistent hash ring mapping keys onto a fixed set of nodes"""
+
+    def __init__(self, nodes: List[int], replicas: int = 64):
+        self.ring: List[Tuple[int, int]] = sorted(
+            (self._hash(f"{node}:{i}"), node) for node in nodes for i in range(replicas)
+        )
+        self.positions = [position for position, _ in self.ring]
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], 'big')
+
+    def node_for(self, key: str) -> int:
+        index = bisect.bisect(self.positions, self._hash(key)) % len(self.ring)
+        return self.ring[index][1]
+
+
+class LeaseStore:
+    """Work queue of host-sharded URLs with leases, kept in one SQLite file.
+
+    Used directly by workers on the same box, or behind serve_coordinator()
+    for workers on other machines.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS shards (
+                id INTEGER PRIMARY KEY, state TEXT NOT NULL DEFAULT 'pending',
+                worker TEXT, lease_expires REAL, attempts INTEGER NOT NULL DEFAULT 0);
+            CREATE TABLE IF NOT EXISTS urls (
+                seq INTEGER PRIMARY KEY, shard INTEGER NOT NULL, category TEXT NOT NULL, url TEXT NOT NULL);
+            CREATE INDEX IF NOT EXISTS urls_shard ON urls (shard);
+            CREATE TABLE IF NOT EXISTS results (
+                seq INTEGER PRIMARY KEY, shard INTEGER NOT NULL, worker TEXT, payload TEXT NOT NULL);
+        """)
+
+    def is_loaded(self) -> bool:
+        return self.db.execute("SELECT COUNT(*) FROM shards").fetchone()[0] > 0
+
+    def load(self, sources: Dict[str, List[str]], shard_count: int = 64):
+        """Partition URLs into shards by consistent hash of host, replacing any previous run"""
+        ring = HashRing(list(range(shard_count)))
+        rows = []
+        for category, urls in sources.items():
+            for url in urls:
+                rows.append((ring.node_for(host_of(url)), category, url))
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            self.db.execute("DELETE FROM shards")
+            self.db.execute("DELETE FROM urls")
+            self.db.execute("DELETE FROM results")
+            self.db.executemany("INSERT INTO urls (shard, category, url) VALUES (?, ?, ?)", rows)
+            self.db.executemany("INSERT INTO shards (id) VALUES (?)",
+                                [(shard,) for shard in sorted({row[0] for row in rows})])
+            self.db.execute("COMMIT")
+
+    def lease(self, worker: str, ttl: float) -> Optional[Dict]:
+        """Hand out a pending or expired shard, or None if nothing is available"""
+        now = time.time()
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            row = self.db.execute(
+                "SELECT id FROM shards WHERE state = 'pending' OR (state = 'leased' AND lease_expires < ?) "
+                "ORDER BY attempts, id LIMIT 1", (now,)
+            ).fetchone()
+            if row is None:
+                self.db.execute("COMMIT")
+                return None
+            shard = row[0]
+            self.db.execute(
+                "UPDATE shards SET state = 'leased', worker = ?, lease_expires = ?, attempts = attempts + 1 "
+                "WHERE id = ?", (worker, now + ttl, shard)
+            )
+            urls = self.db.execute(
+                "SELECT seq, category, url FROM urls WHERE shard = ? ORDER BY seq", (shard,)
+            ).fetchall()
+            self.db.execute("COMMIT")
+        return {'shard': shard, 'urls': [list(url) for url in urls]}
+
+    def heartbeat(self, worker: str, shard: int, ttl: float) -> bool:
+        """Extend a lease; False means it expired and was handed to someone else"""
+        with self.lock:
+            cursor = self.db.execute(
+                "UPDATE shards SET lease_expires = ? WHERE id = ? AND worker = ? AND state = 'leased'",
+                (time.time() + ttl, shard, worker)
+            )
+        return cursor.rowcount == 1
+
+    def complete(self, worker: str, shard: int, results: List[Tuple[int, Dict]]) -> bool:
+        """Store a shard's results, unless the lease was lost in the meantime"""
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            owned = self.db.execute(
+                "SELECT 1 FROM shards WHERE id = ? AND worker = ? AND state = 'leased'", (shard, worker)
+            ).fetchone()
+            if owned:
+                self.db.executemany(
+                    "INSERT OR REPLACE INTO results (seq, shard, worker, payload) VALUES (?, ?, ?, ?)",
+                    [(seq, shard, worker, json.dumps(payload)) for seq, payload in results]
+                )
+                self.db.execute("UPDATE shards SET state = 'done' WHERE id = ?", (shard,))
+            self.db.execute("COMMIT")
+        return owned is not None
+
+    def progress(self) -> Dict[str, int]:
+        counts = {'pending': 0, 'leased': 0, 'done': 0}
+        with self.lock:
+            for state, count in self.db.execute("SELECT state, COUNT(*) FROM shards GROUP BY state"):
+                counts[state] = count
+        return counts
+
+    def merged_results(self) -> List[Dict]:
+        """All worker results in original source order"""
+        with self.lock:
+            rows = self.db.execute("SELECT payload FROM results ORDER BY seq").fetchall()
+        return [json.loads(payload) for payload, in rows]
+
+
+class HttpLeaseClient:
+    """Talks to a coordinator started with serve_coordinator(); same interface as LeaseStore"""
+
+    def __init__(self, base_url: str, timeout: float = 30):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+    def _call(self, endpoint: str, payload: Optional[Dict] = None):
+        data = json.dumps(payload or {}).encode()
+        request = urllib.request.Request(f"{self.base_url}/{endpoint}", data=data,
+                                         headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return json.loads(response.read())
+
+    def lease(self, worker: str, ttl: float) -> Optional[Dict]:
+        return self._call('lease', {'worker': worker, 'ttl': ttl})
+
+    def heartbeat(self, worker: str, shard: int, ttl: float) -> bool:
+        return self._call('heartbeat', {'worker': worker, 'shard': shard, 'ttl': ttl})
+
+    def complete(self, worker: str, shard: int, results: List[Tuple[int, Dict]]) -> bool:
+        return self._call('complete', {'worker': worker, 'shard': shard, 'results': results})
+
+    def progress(self) -> Dict[str, int]:
+        return self._call('progress')
+
+
+def serve_coordinator(store: LeaseStore, host: str, port: int) -> ThreadingHTTPServer:
+    """Expose a LeaseStore over HTTP in a background thread"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            body = json.loads(self.rfile.read(length) or b'{}')
+            endpoint = self.path.strip('/')
+            if endpoint == 'lease':
+                reply = store.lease(body['worker'], body['ttl'])
+            elif endpoint == 'heartbeat':
+                reply = store.heartbeat(body['worker'], body['shard'], body['ttl'])
+            elif endpoint == 'complete':
+                reply = store.complete(body['worker'], body['shard'], body['results'])
+            elif endpoint == 'progress':
+                reply = store.progress()
+            else:
+                self.send_error(404)
+                return
+            data = json.dumps(reply).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+async def run_worker(queue, worker_id: str,
+                     scrape_urls: Callable[[List[Tuple[str, str]]], Awaitable[List[Optional[Dict]]]],
+                     ttl: float = 120, idle_poll: float = 5) -> int:
+    """Lease shards until the queue is drained; returns the number of shards completed.
+
+    scrape_urls receives (category, url) pairs and returns one result (or None)
+    per pair, in order.
+    """
+    completed = 0
+    while True:
+        lease = await asyncio.to_thread(queue.lease, worker_id, ttl)
+        if lease is None:
+            progress = await asyncio.to_thread(queue.progress)
+            if not progress.get('pending') and not progress.get('leased'):
+                return completed
+            # Another worker holds the remaining shards; wait in case its lease expires
+            await asyncio.sleep(idle_poll)
+            continue
+
+        shard = lease['shard']
+        lost = asyncio.Event()
+
+        async def keep_alive():
+            while True:
+                await asyncio.sleep(ttl / 3)
+                if not await asyncio.to_thread(queue.heartbeat, worker_id, shard, ttl):
+                    lost.set()
+                    return
+
+        heartbeat = asyncio.ensure_future(keep_alive())
+        try:
+            results = await scrape_urls([(category, url) for _, category, url in lease['urls']])
+        finally:
+            heartbeat.cancel()
+        if lost.is_set():
+            continue
+        found = [(seq, result) for (seq, _, _), result in zip(lease['urls'], results) if result]
+        if await asyncio.to_thread(queue.complete, worker_id, shard, found):
+            completed += 1
+
+
+async def wait_for_workers(queue, on_progress: Callable[[Dict[str, int]], None], poll: float = 2):
+    """Block until every shard is done, reporting progress along the way"""
+    while True:
+        progress = await asyncio.to_thread(queue.progress)
+        on_progress(progress)
+        if not progress.get('pending') and not progress.get('leased'):
+            return
+        await asyncio.sleep(poll)
@@ -0,0 +1,311 @@
+import argparse
+import asyncio
+import ipaddress
+import json
+import os
+import random
+import socket
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from aiohttp.abc import AbstractResolver
+
+try:
+    import aiodns
+except ImportError:
+    aiodns = None
+
+from persistence import flush_json, write_json
+from url_record import url_record
+
+DNS_CACHE_FILE = 'dns_cache.json'
+
+# Reserved name that always resolves; a resolver that says it does not exist is broken
+CANARY_HOST = 'example.com'
+
+# (address family, address)
+Address = Tuple[int, str]
+
+# getaddrinfo errors that mean the name does not exist or has no addresses
+NOT_FOUND_ERRORS = {socket.EAI_NONAME} | {getattr(socket, name) for name in ('EAI_NODATA', 'EAI_ADDRFAMILY')
+                                          if hasattr(socket, name)}
+
+
+class HostNotFound(Exception):
+    """NXDOMAIN, or a name with no A or AAAA records"""
+
+
+class GetaddrinfoBackend:
+    """The system resolver, run on the event loop's thread pool; it reports no TTLs"""
+
+    async def lookup(self, host: str) -> Tuple[List[Address], Optional[float]]:
+        try:
+            infos = await asyncio.get_running_loop().getaddrinfo(host, None, type=socket.SOCK_STREAM)
+        except socket.gaierror as e:
+            if e.errno in NOT_FOUND_ERRORS:
+                raise HostNotFound(host) from e
+            raise
+        return list(dict.fromkeys((family, sockaddr[0]) for family, _, _, _, sockaddr in infos)), None
+
+
+class AiodnsBackend:
+    """c-ares through aiodns: queries run on the event loop itself and answers carry their TTLs"""
+
+    def __init__(self, nameservers: Optional[List[str]] = None, timeout: float = 5.0):
+        self.resolver = aiodns.DNSResolver(nameservers=nameservers, timeout=timeout, tries=2)
+
+    @staticmethod
+    def _not_found(error: Exception) -> bool:
+        return isinstance(error, aiodns.error.DNSError) and error.args[0] in (
+            aiodns.error.ARES_ENOTFOUND, aiodns.error.ARES_ENODATA)
+
+    async def lookup(self, host: str) -> Tuple[List[Address], Optional[float]]:
+        answers = await asyncio.gather(self.resolver.query(host, 'A'), self.resolver.query(host, 'AAAA'),
+                                       return_exceptions=True)
+        addresses, ttls, errors = [], [], []
+        for family, answer in zip((socket.AF_INET, socket.AF_INET6), answers):
+            if isinstance(answer, Exception):
+                errors.append(answer)
+                continue
+            for record in answer:
+                addresses.append((family, record.host))
+                ttls.append(record.ttl)
+        if addresses:
+            return addresses, min(ttls)
+        if all(self._not_found(error) for error in errors):
+            raise HostNotFound(host)
+        raise errors[0]
+
+
+class StubBackend:
+    """Answers from a table instead of the network, after a fixed latency; for checks and benchmarks.
+
+    Hosts missing from records are NXDOMAIN; hosts mapped to None fail as if
+    the nameserver timed out.
+    """
+
+    def __init__(self, records: Dict[str, Optional[List[str]]], latency: float = 0.0, ttl: float = 300):
+        self.records = records
+        self.latency = latency
+        self.ttl = ttl
+        self.queries = 0
+
+    async def lookup(self, host: str) -> Tuple[List[Address], Optional[float]]:
+        self.queries += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if host not in self.records:
+            raise HostNotFound(host)
+        addresses = self.records[host]
+        if addresses is None:
+            raise asyncio.TimeoutError(host)
+        return [(socket.AF_INET6 if ':' in address else socket.AF_INET, address) for address in addresses], self.ttl
+
+
+def default_backend():
+    return AiodnsBackend() if aiodns is not None else GetaddrinfoBackend()
+
+
+class DnsStage:
+    """Resolves hosts ahead of fetching, so hosts that do not exist never take a fetch slot.
+
+    Answers are cached for their TTL (default_ttl when the backend gives
+    none). NXDOMAIN and no-address answers are cached for negative_ttl. Hosts
+    whose lookup fails for any other reason, such as a timeout, are not cached
+    and are left to the HTTP fetch. Concurrent lookups of one host share a
+    single query. The cache is persisted between runs, like robots_cache.json.
+
+    Before the first not-found answer is trusted, the canary host is looked
+    up. If the canary does not resolve either, DNS itself is down or filtered,
+    so not-found answers are treated as failures and nothing is skipped.
+    """
+
+    def __init__(self, backend=None, path: Optional[str] = DNS_CACHE_FILE, concurrency: int = 64,
+                 timeout: float = 10.0, default_ttl: float = 300, min_ttl: float = 60, negative_ttl: float = 6 * 3600,
+                 canary: Optional[str] = CANARY_HOST):
+        # aiodns binds to the running loop, so the default backend is made on first use
+        self.backend = backend
+        self.path = path
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.default_ttl = default_ttl
+        self.min_ttl = min_ttl
+        self.negative_ttl = negative_ttl
+        self.canary = canary
+        self.canary_check: Optional[asyncio.Future] = None
+        # host -> {'addresses': [[family, address], ...], 'expires': unix time}; no addresses means dead
+        self.entries: Dict[str, Dict] = self._load()
+        self.pending: Dict[str, asyncio.Task] = {}
+        self.slots: Optional[asyncio.Semaphore] = None
+        self.dirty = False
+        self.stats = {'lookups': 0, 'cache_hits': 0, 'dead': 0, 'failed': 0}
+
+    def _load(self) -> Dict[str, Dict]:
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path) as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        now = time.time()
+        return {host: entry for host, entry in entries.items() if entry['expires'] > now}
+
+    def save(self):
+        if self.path and self.dirty:
+            now = time.time()
+            write_json(self.path, {host: entry for host, entry in self.entries.items() if entry['expires'] > now})
+            self.dirty = False
+
+    def cached(self, host: str) -> Optional[List[Address]]:
+        """Cached addresses ([] for a dead host), or None if the host is not cached or has expired"""
+        entry = self.entries.get(host)
+        if entry is None or entry['expires'] <= time.time():
+            return None
+        return [tuple(address) for address in entry['addresses']]
+
+    async def resolve(self, host: str) -> Optional[List[Address]]:
+        """Addresses of host, [] if it does not exist or has none, or None if the lookup failed"""
+        host = host.lower().rstrip('.')
+        try:
+            address = ipaddress.ip_address(host.strip('[]'))
+            return [(socket.AF_INET6 if address.version == 6 else socket.AF_INET, str(address))]
+        except ValueError:
+            pass
+        cached = self.cached(host)
+        if cached is not None:
+            self.stats['cache_hits'] += 1
+            return cached
+        # The lookup runs in its own task and every caller shields it, so a caller
+        # that is cancelled never cancels the query the others are waiting on
+        task = self.pending.get(host)
+        if task is None:
+            task = self.pending[host] = asyncio.ensure_future(self._lookup(host))
+            task.add_done_callback(lambda _: self.pending.pop(host, None))
+        return await asyncio.shield(task)
+
+    async def _lookup(self, host: str) -> Optional[List[Address]]:
+        if self.backend is None:
+            self.backend = default_backend()
+        if self.slots is None:
+            self.slots = asyncio.Semaphore(self.concurrency)
+        async with self.slots:
+            self.stats['lookups'] += 1
+            try:
+                addresses, ttl = await asyncio.wait_for(self.backend.lookup(host), self.timeout)
+            except HostNotFound:
+                if not await self.resolver_works():
+                    self.stats['failed'] += 1
+                    return None
+                self.stats['dead'] += 1
+                addresses, ttl = [], self.negative_ttl
+            except Exception:
+                self.stats['failed'] += 1
+                return None
+        if addresses:
+            ttl = max(self.min_ttl, self.default_ttl if ttl is None else ttl)
+        self.entries[host] = {'addresses': [list(address) for address in addresses], 'expires': time.time() + ttl}
+        self.dirty = True
+        return addresses
+
+    async def resolver_works(self) -> bool:
+        """True if the canary host resolves; checked once per stage"""
+        if self.canary is None:
+            return True
+        if self.canary_check is None:
+            self.canary_check = asyncio.ensure_future(self._check_canary())
+        return await asyncio.shield(self.canary_check)
+
+    async def _check_canary(self) -> bool:
+        try:
+            addresses, _ = await asyncio.wait_for(self.backend.lookup(self.canary), self.timeout)
+        except Exception:
+            return False
+        return bool(addresses)
+
+    async def resolve_all(self, hosts: Iterable[str]) -> Dict[str, Optional[List[Address]]]:
+        hosts = list(dict.fromkeys(hosts))
+        return dict(zip(hosts, await asyncio.gather(*(self.resolve(host) for host in hosts))))
+
+    async def unresolvable(self, urls: Iterable[str]) -> Set[str]:
+        """The URLs whose hosts do not exist or have no addresses"""
+        urls = list(urls)
+        hosts = {url: url_record(url).hostname for url in urls}
+        answers = await self.resolve_all(host for host in hosts.values() if host)
+        return {url for url, host in hosts.items() if host and answers[host] == []}
+
+
+class CachingResolver(AbstractResolver):
+    """aiohttp resolver answering from a DnsStage, so connections reuse the addresses found before fetching.
+
+    Use it with aiohttp.TCPConnector(resolver=CachingResolver(stage)).
+    """
+
+    def __init__(self, stage: DnsStage):
+        self.stage = stage
+
+    async def resolve(self, host: str, port: int = 0, family: int = socket.AF_INET) -> List[Dict]:
+        addresses = await self.stage.resolve(host)
+        if addresses is None:
+            raise OSError(f"DNS lookup failed for {host}")
+        addresses = [(found, address) for found, address in addresses if family in (socket.AF_UNSPEC, found)]
+        if not addresses:
+            raise socket.gaierror(socket.EAI_NONAME, f"{host} does not resolve")
+        return [{'hostname': host, 'host': address, 'port': port, 'family': found, 'proto': 0,
+                 'flags': socket.AI_NUMERICHOST | socket.AI_NUMERICSERV} for found, address in addresses]
+
+    async def close(self):
+        pass
+
+
+def stub_records(hosts: List[str], dead_fraction: float, seed: int = 0) -> Dict[str, Optional[List[str]]]:
+    """Stub answers for hosts: dead_fraction of them NXDOMAIN, the rest in 192.0.2.0/24 (TEST-NET-1)"""
+    rng = random.Random(seed)
+    return {host: [f"192.0.2.{rng.randrange(1, 255)}"] for host in hosts if rng.random() >= dead_fraction}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Resolve the hosts in sources.json and report which ones are dead')
+    parser.add_argument('--sources', default='sources.json')
+    parser.add_argument('--category', default=None, help='Only this category of sources')
+    parser.add_argument('--concurrency', type=int, default=64, help='Lookups in flight at once')
+    parser.add_argument('--no-cache', action='store_true', help='Ignore and do not update dns_cache.json')
+    parser.add_argument('--stub', type=float, metavar='DEAD_FRACTION', default=None,
+                        help='Answer from a local stub with this fraction of NXDOMAIN hosts instead of real DNS')
+    parser.add_argument('--stub-latency', type=float, default=0.05, help='Seconds per stub lookup')
+    parser.add_argument('--show-dead', action='store_true', help='List the hosts that do not resolve')
+    args = parser.parse_args()
+
+    with open(args.sources) as f:
+        sources = json.load(f)
+    if args.category:
+        sources = {args.category: sources.get(args.category, [])}
+    hosts = [url_record(url).hostname for urls in sources.values() for url in urls]
+    hosts = list(dict.fromkeys(host for host in hosts if host))
+
+    backend = None
+    if args.stub is not None:
+        backend = StubBackend(stub_records(hosts, args.stub), latency=args.stub_latency)
+    stage = DnsStage(backend, path=None if args.no_cache or backend else DNS_CACHE_FILE, concurrency=args.concurrency,
+                     canary=None if backend else CANARY_HOST)
+    print(f"Resolving {len(hosts)} hosts{' with the stub resolver' if backend else ''}...")
+
+    started = time.monotonic()
+    answers = asyncio.run(stage.resolve_all(hosts))
+    elapsed = time.monotonic() - started
+    stage.save()
+    flush_json()
+
+    dead = sorted(host for host, addresses in answers.items() if addresses == [])
+    failed = sum(addresses is None for addresses in answers.values())
+    print(f"{len(hosts) - len(dead) - failed} resolved, {len(dead)} dead, {failed} failed in {elapsed:.2f}s "
+          f"({stage.stats['lookups']} lookups, {stage.stats['cache_hits']} from cache)")
+    if stage.canary_check is not None and not stage.canary_check.result():
+        print(f"Warning: {CANARY_HOST} does not resolve either, so no host was marked dead; check the DNS setup")
+    if args.show_dead:
+        for host in dead:
+            print(f"- {host}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+import hashlib
+from typing import Iterator, List, Sequence, Tuple, Union
+
+# A layout is a format string with one {} per part, plus the word list for each part
+Layout = Tuple[str, Sequence[Sequence[str]]]
+
+MASK64 = (1 << 64) - 1
+
+
+class FeistelPermutation:
+    """Seeded bijection over range(size), evaluated in O(1) per index.
+
+    A balanced Feistel network permutes the smallest even power of two that
+    covers size; indexes that land outside range(size) are walked forward
+    through the network until they come back inside (cycle walking).
+    """
+
+    def __init__(self, size: int, seed: Union[int, str] = 0, rounds: int = 4):
+        self.size = size
+        self.rounds = rounds
+        self.half_bits = max(1, ((max(size - 1, 1)).bit_length() + 1) // 2)
+        self.mask = (1 << self.half_bits) - 1
+        seed_bytes = hashlib.blake2b(str(seed).encode(), digest_size=8 * rounds).digest()
+        self.round_keys = [int.from_bytes(seed_bytes[8 * i:8 * i + 8], 'little') for i in range(rounds)]
+
+    def _round(self, value: int, round_index: int) -> int:
+        # splitmix64 finaliser: cheap, well mixed, and keyed per round
+        value = ((value ^ self.round_keys[round_index]) * 0x9E3779B97F4A7C15) & MASK64
+        value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+        value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & MASK64
+        return (value ^ (value >> 31)) & self.mask
+
+    def _encrypt(self, value: int) -> int:
+        left, right = value >> self.half_bits, value & self.mask
+        for round_index in range(self.rounds):
+            left, right = right, left ^ self._round(right, round_index)
+        return (left << self.half_bits) | right
+
+    def __getitem__(self, index: int) -> int:
+        if not 0 <= index < self.size:
+            raise IndexError(index)
+        value = self._encrypt(index)
+        while value >= self.size:
+            value = self._encrypt(value)
+        return value
+
+
+class DomainSpace:
+    """Every domain a set of layouts can produce, visited once each in seeded random order"""
+
+    def __init__(self, layouts: List[Layout], seed: Union[int, str] = 0):
+        self.layouts = layouts
+        self.layout_sizes = []
+        for _, parts in layouts:
+            size = 1
+            for words in parts:
+                size *= len(words)
+            self.layout_sizes.append(size)
+        self.size = sum(self.layout_sizes)
+        self.permutation = FeistelPermutation(self.size, seed)
+        self.position = 0
+
+    def remaining(self) -> int:
+        """How many domains have not been produced yet"""
+        return self.size - self.position
+
+    def domain_at(self, index: int) -> str:
+        """Decode a combination index into its domain (mixed radix over the layout's parts)"""
+        for (template, parts), size in zip(self.layouts, self.layout_sizes):
+            if index < size:
+                words = []
+                for options in reversed(parts):
+                    index, choice = divmod(index, len(options))
+                    words.append(options[choice])
+                return template.format(*reversed(words))
+            index -= size
+        raise IndexError(index)
+
+    def __iter__(self) -> Iterator[str]:
+        while self.position < self.size:
+            index = self.permutation[self.position]
+            self.position += 1
+            yield self.domain_at(index)
@@ -0,0 +1,172 @@
+import asyncio
+import heapq
+import itertools
+import random
+import socket
+import time
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import aiohttp
+
+from url_record import url_record
+
+# HTTP statuses worth another attempt later; everything else is final
+RETRYABLE_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+
+
+class FetchError(Exception):
+    """Raised by a fetch when the failure should be considered for a retry"""
+
+    def __init__(self, url: str, reason: str, retryable: bool, status: Optional[int] = None,
+                 retry_after: Optional[float] = None):
+        super().__init__(f"{reason} while fetching {url}")
+        self.url = url
+        self.reason = reason
+        self.retryable = retryable
+        self.status = status
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Convert a Retry-After header (seconds or HTTP date) into a delay in seconds"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at is None:
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+def classify_status(url: str, status: int, headers=None) -> FetchError:
+    """Build a FetchError for a non-200 response"""
+    retry_after = parse_retry_after(headers.get('Retry-After')) if headers else None
+    return FetchError(url, f"HTTP {status}", status in RETRYABLE_STATUSES, status=status,
+                      retry_after=retry_after)
+
+
+def classify_exception(url: str, exc: BaseException) -> FetchError:
+    """Decide whether a transport exception is transient or permanent"""
+    if isinstance(exc, FetchError):
+        return exc
+    if isinstance(exc, aiohttp.ClientResponseError):
+        return classify_status(url, exc.status, exc.headers)
+    if isinstance(exc, (aiohttp.InvalidURL, aiohttp.ClientSSLError, aiohttp.TooManyRedirects)):
+        return FetchError(url, type(exc).__name__, False)
+    if isinstance(exc, aiohttp.ClientConnectorError):
+        # Refused or reset connections recover; unknown hosts do not
+        return FetchError(url, type(exc).__name__, not isinstance(exc.os_error, socket.gaierror))
+    if isinstance(exc, (asyncio.TimeoutError, aiohttp.ServerDisconnectedError,
+                        aiohttp.ClientOSError, aiohttp.ClientPayloadError)):
+        return FetchError(url, type(exc).__name__, True)
+    return FetchError(url, type(exc).__name__, False)
+
+
+class RetryScheduler:
+    """Re-runs failed fetches from a delayed priority queue.
+
+    Waiting retries sit in a heap keyed by their due time, outside of any
+    semaphore, so they never occupy a concurrency slot or delay other hosts.
+    Budgets are enforced per URL, per host and for the whole run. stats counts
+    every failure by reason; given_up counts the URLs that failed for good, by
+    their last error and what stopped further attempts.
+    """
+
+    def __init__(self, max_attempts: int = 4, base_delay: float = 1.0, max_delay: float = 60.0,
+                 max_retries_per_host: int = 20, max_retries_per_run: int = 1000):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_retries_per_host = max_retries_per_host
+        self.max_retries_per_run = max_retries_per_run
+        self.host_retries: Dict[str, int] = {}
+        self.run_retries = 0
+        self.stats: Dict[str, int] = {}
+        self.given_up: Dict[str, int] = {}
+
+    def backoff_delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Exponential backoff with full jitter, never shorter than Retry-After (take_budget refuses
+        retries whose Retry-After is over max_delay)"""
+        ceiling = min(self.max_delay, self.base_delay * (2 ** attempt))
+        delay = random.uniform(0, ceiling)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_delay))
+        return delay
+
+    def take_budget(self, url: str, attempt: int, error: FetchError) -> bool:
+        """Return True if another attempt is allowed, consuming budget if so; otherwise record why not"""
+        self.stats[error.reason] = self.stats.get(error.reason, 0) + 1
+        host = url_record(url).host
+        if not error.retryable:
+            stopped = 'not retryable'
+        elif attempt + 1 >= self.max_attempts:
+            stopped = f"after {attempt + 1} attempts"
+        elif error.retry_after is not None and error.retry_after > self.max_delay:
+            # Retrying sooner than the server asked would only spend budget on another refusal
+            stopped = f"Retry-After {error.retry_after:.0f}s is over the {self.max_delay:.0f}s limit"
+        elif self.run_retries >= self.max_retries_per_run:
+            stopped = 'run retry budget used up'
+        elif self.host_retries.get(host, 0) >= self.max_retries_per_host:
+            stopped = 'host retry budget used up'
+        else:
+            self.run_retries += 1
+            self.host_retries[host] = self.host_retries.get(host, 0) + 1
+            return True
+        final = f"{error.reason}, {stopped}"
+        self.given_up[final] = self.given_up.get(final, 0) + 1
+        return False
+
+    async def run(self, urls: List[str], worker: Callable[[str], Awaitable]) -> List:
+        """Run worker over urls, retrying FetchErrors; results keep the input order, one per input"""
+        loop = asyncio.get_running_loop()
+        counter = itertools.count()
+        # (due time, tie-breaker, input index, attempt)
+        delayed: List[Tuple[float, int, int, int]] = []
+        completed: asyncio.Queue = asyncio.Queue()
+        # Keyed by input index, so a URL listed twice gets a result in both places
+        results: List = [None] * len(urls)
+        in_flight = 0
+
+        def launch(index: int, attempt: int):
+            nonlocal in_flight
+            in_flight += 1
+            task = asyncio.ensure_future(worker(urls[index]))
+            task.add_done_callback(lambda t: completed.put_nowait((t, index, attempt)))
+
+        for index in range(len(urls)):
+            launch(index, 0)
+
+        while in_flight or delayed:
+            timeout = max(0.0, delayed[0][0] - loop.time()) if delayed else None
+            if in_flight:
+                try:
+                    task, index, attempt = await asyncio.wait_for(completed.get(), timeout)
+                except asyncio.TimeoutError:
+                    task = None
+            else:
+                await asyncio.sleep(timeout)
+                task = None
+
+            if task is not None:
+                in_flight -= 1
+                exc = task.exception()
+                if exc is None:
+                    results[index] = task.result()
+                else:
+                    error = classify_exception(urls[index], exc)
+                    if self.take_budget(urls[index], attempt, error):
+                        due = loop.time() + self.backoff_delay(attempt, error.retry_after)
+                        heapq.heappush(delayed, (due, next(counter), index, attempt + 1))
+
+            now = loop.time()
+            while delayed and delayed[0][0] <= now:
+                _, _, index, attempt = heapq.heappop(delayed)
+                launch(index, attempt)
+
+        return results
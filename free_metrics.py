@@ -5,9 +5,12 @@ import os
 import random
 import hashlib
 from urllib.parse import urlparse
-from bs4 import BeautifulSoup
 import argparse
-import re
+from persistence import flush_json, write_json
+from near_duplicates import load_clusters
+from refresh_planner import RefreshPlanner, parse_quotas
+from metric_extractors import (extract_seositecheckup, extract_semrush, extract_smallseotools,
+                               extract_smallseotools_token, extract_websiteseochecker)
 
 def validate_metrics(metrics):
     """
@@ -83,108 +86,13 @@ def get_websiteseochecker_metrics(domain):
             print(f"Failed to check domain: {response.status_code}")
             return None
         
-        # Parse results
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        # Look for results in various table formats
-        results = soup.select('.result-table tr, .results-table tr, table.results tr, .domain-metrics tr')
-        
-        da = None
-        pa = None
-        spam_score = None
-        
-        # First try to find metrics in the result tables
-        for row in results:
-            cells = row.select('td')
-            if len(cells) >= 2:
-                label = cells[0].get_text().strip().lower()
-                value = cells[1].get_text().strip()
-                
-                if 'domain authority' in label or 'da' in label:
-                    try:
-                        da = int(re.search(r'\d+', value).group())
-                    except:
-                        pass
-                elif 'page authority' in label or 'pa' in label:
-                    try:
-                        pa = int(re.search(r'\d+', value).group())
-                    except:
-                        pass
-                elif 'spam score' in label or 'spam' in label:
-                    try:
-                        spam_score = int(re.search(r'\d+', value).group())
-                    except:
-                        # If spam score is shown as percentage
-                        if '%' in value:
-                            try:
-                                percentage = float(re.search(r'\d+', value).group())
-                                spam_score = int((percentage / 100) * 14)  # Scale to 0-14
-                            except:
-                                pass
-        
-        # If we couldn't find metrics in tables, look for them elsewhere in the page
-        if da is None:
-            # Look for domain authority in any element
-            da_elements = soup.select('[data-metric="da"], .da-score, .domain-authority, .metric-da')
-            for element in da_elements:
-                try:
-                    da = int(re.search(r'\d+', element.get_text()).group())
-                    break
-                except:
-                    pass
-        
-        if pa is None:
-            # Look for page authority in any element
-            pa_elements = soup.select('[data-metric="pa"], .pa-score, .page-authority, .metric-pa')
-            for element in pa_elements:
-                try:
-                    pa = int(re.search(r'\d+', element.get_text()).group())
-                    break
-                except:
-                    pass
-        
-        if spam_score is None:
-            # Look for spam score in any element
-            spam_elements = soup.select('[data-metric="spam"], .spam-score, .spam-metric, .metric-spam')
-            for element in spam_elements:
-                try:
-                    spam_score = int(re.search(r'\d+', element.get_text()).group())
-                    break
-                except:
-                    pass
-        
-        # If we still couldn't find metrics, check for inline text mentions
-        if da is None:
-            da_matches = re.search(r'domain authority.*?(\d+)', response.text, re.IGNORECASE)
-            if da_matches:
-                da = int(da_matches.group(1))
-        
-        if pa is None:
-            pa_matches = re.search(r'page authority.*?(\d+)', response.text, re.IGNORECASE)
-            if pa_matches:
-                pa = int(pa_matches.group(1))
-        
-        # Default values if we couldn't find anything
-        if da is None:
-            da = 0
-        if pa is None:
-            pa = 0
-        if spam_score is None:
-            spam_score = 0
-        
-        # If all values are 0, the API might have failed
-        if da == 0 and pa == 0 and spam_score == 0:
-            # Try one more check - does the page say "no data" or similar?
-            if re.search(r'no data|not found|no results', response.text, re.IGNORECASE):
-                print(f"WebsiteSEOChecker reported no data for {domain}")
-                return None
+        # Result tables, metric elements and inline text, in one pass over the page
+        metrics = extract_websiteseochecker(response.text)
+        if metrics is None:
+            print(f"WebsiteSEOChecker reported no data for {domain}")
+            return None
         
         # Validate metrics before returning
-        metrics = {
-            "da": da,
-            "pa": pa,
-            "spam_score": spam_score
-        }
         return validate_metrics(metrics)
     except Exception as e:
         print(f"Error with WebsiteSEOChecker: {e}")
@@ -207,54 +115,10 @@ def get_seositecheckup_metrics(domain):
             print(f"Failed to access SEO Site Checkup: {response.status_code}")
             return None
         
-        # Parse HTML to extract metrics
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        # Find domain authority
-        da = 0
-        pa = 0
-        spam_score = 0
-        
-        # Look for authority metrics in the page
-        authority_elements = soup.select('.domain-authority, .page-authority, [data-metric="authority"]')
-        for element in authority_elements:
-            text = element.get_text().lower()
-            if 'domain authority' in text or 'da:' in text:
-                try:
-                    da = int(re.search(r'\d+', text).group())
-                except:
-                    pass
-            elif 'page authority' in text or 'pa:' in text:
-                try:
-                    pa = int(re.search(r'\d+', text).group())
-                except:
-                    pass
-        
-        # If we couldn't find specific elements, try regular expressions
-        if da == 0:
-            da_match = re.search(r'domain authority.*?(\d+)', response.text, re.IGNORECASE)
-            if da_match:
-                da = int(da_match.group(1))
-        
-        if pa == 0:
-            pa_match = re.search(r'page authority.*?(\d+)', response.text, re.IGNORECASE)
-            if pa_match:
-                pa = int(pa_match.group(1))
-        
-        # Calculate an approximation for spam score based on other metrics
-        if da > 0:
-            spam_score = max(0, 14 - int(da / 7))
-        
-        # If we couldn't get any metrics, return None
-        if da == 0 and pa == 0:
-            return None
+        # Extract metrics in one pass; None if the page has no DA or PA
+        metrics = extract_seositecheckup(response.text)
         
         # Validate metrics before returning
-        metrics = {
-            "da": da,
-            "pa": pa,
-            "spam_score": spam_score
-        }
         return validate_metrics(metrics)
     except Exception as e:
         print(f"Error with SEO Site Checkup: {e}")
@@ -341,9 +205,7 @@ def get_smallseotools_metrics(domain):
             print(f"Failed to access SmallSEOTools: {response.status_code}")
             return None
         
-        soup = BeautifulSoup(response.text, 'html.parser')
-        token_input = soup.select_one('input[name="token"]')
-        token = token_input['value'] if token_input else ""
+        token = extract_smallseotools_token(response.text)
         
         # Now submit the domain for checking
         headers = {
@@ -364,59 +226,10 @@ def get_smallseotools_metrics(domain):
             print(f"Failed to check domain with SmallSEOTools: {response.status_code}")
             return None
         
-        # Parse HTML response
-        soup = BeautifulSoup(response.text, 'html.parser')
-        result_container = soup.select_one('.resultBox, .result-container, .da-results')
-        
-        if not result_container:
-            return None
-        
-        # Extract metrics
-        da = 0
-        pa = 0
-        spam_score = 0
-        
-        # Look for domain authority
-        da_element = result_container.select_one('.da-score, .domain-authority, [data-metric="da"]')
-        if da_element:
-            try:
-                da = int(re.search(r'\d+', da_element.get_text()).group())
-            except:
-                pass
-        
-        # Look for page authority
-        pa_element = result_container.select_one('.pa-score, .page-authority, [data-metric="pa"]')
-        if pa_element:
-            try:
-                pa = int(re.search(r'\d+', pa_element.get_text()).group())
-            except:
-                pass
-        
-        # If no specific elements, try to find values in text
-        if da == 0:
-            da_match = re.search(r'domain authority.*?(\d+)', result_container.get_text(), re.IGNORECASE)
-            if da_match:
-                da = int(da_match.group(1))
-        
-        if pa == 0:
-            pa_match = re.search(r'page authority.*?(\d+)', result_container.get_text(), re.IGNORECASE)
-            if pa_match:
-                pa = int(pa_match.group(1))
-        
-        # Calculate spam score based on DA
-        if da > 0:
-            spam_score = max(0, 14 - int(da / 7))
-        
-        # If we couldn't get any metrics, return None
-        if da == 0 and pa == 0:
-            return None
+        # Extract metrics from the result box in one pass; None if there is none
+        metrics = extract_smallseotools(response.text)
         
         # Validate metrics before returning
-        metrics = {
-            "da": da,
-            "pa": pa,
-            "spam_score": spam_score
-        }
         return validate_metrics(metrics)
     except Exception as e:
         print(f"Error with SmallSEOTools: {e}")
@@ -440,54 +253,11 @@ def get_semrush_metrics(domain):
             print(f"Failed to get SEMrush data: {response.status_code}")
             return None
         
-        # Parse HTML to extract Authority Score
-        soup = BeautifulSoup(response.text, 'html.parser')
+        # Extract the Authority Score and metrics estimated from it in one pass
+        metrics = extract_semrush(response.text)
         
-        # Look for authority score
-        authority_elements = soup.select('.cl-overview-domain__authority-score, .domain-score, .authority-score')
-        for element in authority_elements:
-            try:
-                authority_score = int(re.search(r'\d+', element.get_text()).group())
-                
-                # Scale to match Moz DA (SEMrush uses 0-100 scale)
-                da = authority_score
-                pa = max(0, authority_score - 5)  # Estimate PA as slightly lower than DA
-                
-                # Estimate spam score (inversely related to authority)
-                spam_score = max(0, 14 - int(authority_score / 7))
-                
-                # Validate metrics before returning
-                metrics = {
-                    "da": da,
-                    "pa": pa,
-                    "spam_score": spam_score
-                }
-                return validate_metrics(metrics)
-            except:
-                pass
-        
-        # If we couldn't find it in elements, try searching in the text
-        authority_match = re.search(r'authority score.*?(\d+)', response.text, re.IGNORECASE)
-        if authority_match:
-            try:
-                authority_score = int(authority_match.group(1))
-                
-                # Scale to match Moz DA
-                da = authority_score
-                pa = max(0, authority_score - 5)
-                spam_score = max(0, 14 - int(authority_score / 7))
-                
-                # Validate metrics before returning
-                metrics = {
-                    "da": da,
-                    "pa": pa,
-                    "spam_score": spam_score
-                }
-                return validate_metrics(metrics)
-            except:
-                pass
-        
-        return None
+        # Validate metrics before returning
+        return validate_metrics(metrics)
     except Exception as e:
         print(f"Error with SEMrush: {e}")
         return None
@@ -545,15 +315,57 @@ def generate_consistent_metrics(domain):
             "source": "generated"
         }
 
-def fetch_and_update_metrics(limit=None):
+# Free sources in the order they are tried
+FREE_PROVIDERS = [
+    ('websiteseochecker', get_websiteseochecker_metrics),
+    ('smallseotools', get_smallseotools_metrics),
+    ('linkgraph', get_linkgraph_metrics),
+    ('seositecheckup', get_seositecheckup_metrics),
+    ('semrush', get_semrush_metrics),
+]
+
+def fetch_domain_metrics(domain, quota=None):
     """
-    Fetch metrics using free APIs and update the metrics file
+    Try each free source in turn, skipping any whose daily quota is used up.
+    Returns (source, metrics), or (None, None) if none had data.
+    """
+    for name, fetch in FREE_PROVIDERS:
+        if quota:
+            if not quota.allow(name):
+                continue
+            quota.spend(name)
+        metrics = fetch(domain)
+        if metrics and (metrics['da'] > 0 or metrics['pa'] > 0):
+            metrics['source'] = name
+            return name, validate_metrics(metrics)
+    return None, None
+
+def fetch_and_update_metrics(limit=None, plan=False, quotas=None, input_path='sources_with_metrics.json',
+                             output_path='sources_with_real_metrics.json', delay=2):
+    """
+    Fetch metrics using free APIs and update the metrics file.
+    With plan, refresh the most valuable stale domains first (see refresh_planner)
+    and keep earlier real metrics instead of starting from the simulated ones.
+    delay is the pause between domains, to stay under the sites' rate limits.
     """
     try:
         # Load existing data
-        with open('sources_with_metrics.json', 'r') as f:
+        with open(input_path, 'r') as f:
             data = json.load(f)
         
+        if plan:
+            planner = RefreshPlanner(quotas=quotas)
+            planner.carry_forward(data, output_path)
+            providers = [name for name, _ in FREE_PROVIDERS]
+            api_success_count = planner.refresh(data, fetch_domain_metrics, providers, budget=limit, delay=delay)
+            write_json(output_path, data)
+            flush_json()
+            print(f"\nDone! Results saved to {output_path}")
+            print("\nLookups by source:")
+            for api, count in sorted(api_success_count.items()):
+                print(f"- {api}: {count} domains")
+            return True
+        
         total_domains = 0
         updated_domains = 0
         processed_domains = 0
@@ -568,6 +380,8 @@ def fetch_and_update_metrics(limit=None):
         
         # Create a dictionary to cache metrics for domains we've already checked
         domain_metrics_cache = {}
+        # Duplicate pages found while scraping share their representative's metrics
+        clusters = load_clusters()
         
         # Process each category
         for category, items in data.items():
@@ -577,7 +391,7 @@ def fetch_and_update_metrics(limit=None):
                 if not item.get('url') or not item.get('domain'):
                     continue
                 
-                domain = item['domain']
+                domain = clusters.get(item['domain'], item['domain'])
                 total_domains += 1
                 
                 # Skip if we've already processed this domain
@@ -597,52 +411,9 @@ def fetch_and_update_metrics(limit=None):
                 print(f"Fetching metrics for {domain}... ({i+1}/{len(items)})")
                 
                 # Try each API in sequence until we get results
-                metrics = None
-                
-                # Try WebsiteSEOChecker first
-                if not metrics:
-                    metrics = get_websiteseochecker_metrics(domain)
-                    if metrics and (metrics['da'] > 0 or metrics['pa'] > 0):
-                        metrics['source'] = 'websiteseochecker'
-                        api_success_count['websiteseochecker'] += 1
-                    else:
-                        metrics = None
-                
-                # Try SmallSEOTools if WebsiteSEOChecker failed
-                if not metrics:
-                    metrics = get_smallseotools_metrics(domain)
-                    if metrics and (metrics['da'] > 0 or metrics['pa'] > 0):
-                        metrics['source'] = 'smallseotools'
-                        api_success_count['smallseotools'] += 1
-                    else:
-                        metrics = None
-                
-                # Try LinkGraph if previous failed
-                if not metrics:
-                    metrics = get_linkgraph_metrics(domain)
-                    if metrics and (metrics['da'] > 0 or metrics['pa'] > 0):
-                        metrics['source'] = 'linkgraph'
-                        api_success_count['linkgraph'] += 1
-                    else:
-                        metrics = None
-                
-                # Try SEO Site Checkup if previous failed
-                if not metrics:
-                    metrics = get_seositecheckup_metrics(domain)
-                    if metrics and (metrics['da'] > 0 or metrics['pa'] > 0):
-                        metrics['source'] = 'seositecheckup'
-                        api_success_count['seositecheckup'] += 1
-                    else:
-                        metrics = None
-                
-                # Try SEMrush if all others failed
-                if not metrics:
-                    metrics = get_semrush_metrics(domain)
-                    if metrics and (metrics['da'] > 0 or metrics['pa'] > 0):
-                        metrics['source'] = 'semrush'
-                        api_success_count['semrush'] += 1
-                    else:
-                        metrics = None
+                source, metrics = fetch_domain_metrics(domain)
+                if metrics:
+                    api_success_count[source] += 1
                 
                 # If all APIs failed, generate consistent metrics
                 if not metrics:
@@ -662,18 +433,18 @@ def fetch_and_update_metrics(limit=None):
                     print(f"✓ Updated metrics for {domain}: DA={metrics['da']}, PA={metrics['pa']}, Spam={metrics['spam_score']} (Source: {source})")
                 
                 # Add a delay to avoid rate limiting
-                time.sleep(2)
+                time.sleep(delay)
             
             # Break out of the categories loop if we've hit the limit
             if limit and processed_domains >= limit:
                 break
         
         # Save the updated data
-        with open('sources_with_real_metrics.json', 'w') as f:
-            json.dump(data, f, indent=4)
+        write_json(output_path, data)
+        flush_json()
         
         print(f"\nDone! Updated {updated_domains} out of {processed_domains} domains processed.")
-        print(f"Results saved to sources_with_real_metrics.json")
+        print(f"Results saved to {output_path}")
         
         # Print API success stats
         print("\nAPI Success Statistics:")
@@ -699,7 +470,11 @@ if __name__ == "__main__":
     # Set up command line arguments
     parser = argparse.ArgumentParser(description='Fetch domain metrics using free APIs')
     parser.add_argument('--limit', type=int, help='Limit the number of domains to process (for testing)')
+    parser.add_argument('--plan', action='store_true',
+                        help='Refresh the most valuable stale domains first; --limit is the day\'s budget')
+    parser.add_argument('--quota', action='append', default=[], metavar='NAME=CALLS',
+                        help='Daily call limit for a provider, used with --plan (repeatable)')
     args = parser.parse_args()
     
     # Fetch metrics
-    fetch_and_update_metrics(limit=args.limit) 
\ No newline at end of file
+    fetch_and_update_metrics(limit=args.limit, plan=args.plan, quotas=parse_quotas(args.quota)) 
\ No newline at end of file
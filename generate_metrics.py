@@ -1,7 +1,16 @@
+import argparse
 import json
 import random
 import hashlib
-from urllib.parse import urlparse
+from persistence import flush_json, write_json
+from source_store import canonical_url
+from url_record import url_record
+
+OUTPUT_FILE = 'sources_with_metrics.json'
+# Per-category hashes of the sources.json lists the output was built from, for --incremental
+HASHES_FILE = 'sources_with_metrics.hashes.json'
+# Bump when generate_consistent_metrics changes, so incremental runs recompute everything
+METRICS_VERSION = 1
 
 def generate_consistent_metrics(url):
     """
@@ -10,7 +19,7 @@ def generate_consistent_metrics(url):
     """
     try:
         # Parse domain from URL
-        domain = urlparse(url).netloc.lower()
+        domain = url_record(url).host
         if not domain:
             return None
         
@@ -59,52 +68,108 @@ def generate_consistent_metrics(url):
             'spam_score': 14
         }
 
-def add_metrics_to_sources():
+def build_entry(url):
+    """Metrics entry for one sources.json URL, or None if the URL is skipped"""
+    if url and isinstance(url, str) and url.startswith('http'):
+        try:
+            # Generate metrics for this URL
+            metrics = generate_consistent_metrics(url)
+            
+            # Create enhanced URL object with metrics
+            domain = url_record(url).netloc
+            return {
+                'url': url,
+                'domain': domain,
+                'metrics': metrics
+            }
+        except Exception as e:
+            print(f"Error processing {url}: {e}")
+    else:
+        print(f"Skipping invalid URL: {url}")
+    return None
+
+def category_hash(urls):
+    """Content hash of a category's URL list"""
+    payload = json.dumps(urls, separators=(',', ':'))
+    return hashlib.blake2b(payload.encode(), digest_size=16).hexdigest()
+
+def load_previous_output():
+    """Existing output and the category hashes it was built from; empty if either is missing or stale"""
+    try:
+        with open(HASHES_FILE, 'r') as f:
+            state = json.load(f)
+        if state.get('version') != METRICS_VERSION:
+            return {}, {}
+        with open(OUTPUT_FILE, 'r') as f:
+            return json.load(f), state['categories']
+    except (OSError, ValueError, KeyError):
+        return {}, {}
+
+def add_metrics_to_sources(incremental=False):
     """
     Add domain metrics to sources.json and create a new file
-    with these metrics included
+    with these metrics included.
+    
+    In incremental mode, categories whose URL list hash is unchanged are copied
+    from the previous output as-is, and within changed categories only new or
+    changed URLs get fresh metrics; entries for removed URLs are dropped.
     """
     try:
         # Load the sources.json file
         with open('sources.json', 'r') as f:
             sources = json.load(f)
         
+        previous, previous_hashes = load_previous_output() if incremental else ({}, {})
+        previous_index = None
+        
         # Create a new structured data format with metrics
         enhanced_data = {}
+        hashes = {}
+        computed = reused = skipped_categories = 0
         
         # Process each category
         for category, urls in sources.items():
-            enhanced_data[category] = []
+            hashes[category] = category_hash(urls)
+            if hashes[category] == previous_hashes.get(category) and category in previous:
+                enhanced_data[category] = previous[category]
+                skipped_categories += 1
+                continue
             
+            if incremental and previous_index is None:
+                # Built lazily: a run where every category is unchanged never needs it
+                previous_index = {canonical_url(entry['url']): entry
+                                  for entries in previous.values() for entry in entries if entry.get('url')}
+            
+            enhanced_data[category] = []
             for url in urls:
-                if url and isinstance(url, str) and url.startswith('http'):
-                    try:
-                        # Generate metrics for this URL
-                        metrics = generate_consistent_metrics(url)
-                        
-                        # Create enhanced URL object with metrics
-                        domain = urlparse(url).netloc
-                        enhanced_url = {
-                            'url': url,
-                            'domain': domain,
-                            'metrics': metrics
-                        }
-                        
-                        # Add to the enhanced data
-                        enhanced_data[category].append(enhanced_url)
-                    except Exception as e:
-                        print(f"Error processing {url}: {e}")
+                entry = None
+                if previous_index and isinstance(url, str):
+                    entry = previous_index.get(canonical_url(url))
+                    if entry is not None and entry['url'] != url:
+                        entry = None
+                if entry is not None:
+                    reused += 1
                 else:
-                    print(f"Skipping invalid URL: {url}")
+                    entry = build_entry(url)
+                    if entry is None:
+                        continue
+                    computed += 1
+                
+                # Add to the enhanced data
+                enhanced_data[category].append(entry)
         
-        # Save the enhanced data to a new file
-        with open('sources_with_metrics.json', 'w') as f:
-            json.dump(enhanced_data, f, indent=4)
+        # Save the enhanced data to a new file, then the hashes it was built from; the
+        # writer keeps submission order, so the hashes never land ahead of the data
+        write_json(OUTPUT_FILE, enhanced_data, indent=4)
+        write_json(HASHES_FILE, {'version': METRICS_VERSION, 'categories': hashes}, indent=4)
+        flush_json()
         
         # Count how many URLs were processed
         total_urls = sum(len(urls) for urls in enhanced_data.values())
         print(f"Added metrics to {total_urls} URLs")
-        print("Enhanced data saved to sources_with_metrics.json")
+        if incremental:
+            print(f"Computed {computed}, reused {reused}, skipped {skipped_categories} unchanged categories")
+        print(f"Enhanced data saved to {OUTPUT_FILE}")
         
         return True
     except Exception as e:
@@ -112,4 +177,8 @@ def add_metrics_to_sources():
         return False
 
 if __name__ == "__main__":
-    add_metrics_to_sources() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Add generated metrics to every URL in sources.json')
+    parser.add_argument('--incremental', action='store_true', help='Only compute metrics for new or changed URLs')
+    args = parser.parse_args()
+    
+    add_metrics_to_sources(incremental=args.incremental)
@@ -1,7 +1,12 @@
+import argparse
 import json
 import random
 from collections import defaultdict
-from typing import Dict, List
+from itertools import islice
+from typing import Dict, Iterator, List
+from domain_space import DomainSpace
+from persistence import atomic_write_json
+from seen_filter import make_seen_set
 
 # List of top-level domains (TLDs)
 tlds = ['.com', '.org', '.net', '.edu', '.gov', '.io', '.co', '.info', '.biz', '.us', '.uk', '.ca', '.de', '.fr', '.au']
@@ -71,23 +76,27 @@ common_domains = [
     "xi", "omicron", "pi", "rho", "tau", "upsilon", "phi", "chi", "psi"
 ]
 
+# Name parts for .edu and .gov domains
+edu_names = ["state", "central", "national", "american", "international", "pacific", "atlantic", 
+            "western", "eastern", "northern", "southern", "metropolitan", "regional", "city",
+            "community", "technical", "polytechnic", "liberal", "christian", "catholic"]
+edu_suffixes = ["university", "college", "institute", "school"]
+gov_prefixes = ["city", "county", "state", "department", "office", "bureau", "agency",
+              "division", "admin", "council", "commission", "authority", "board"]
+gov_suffixes = ["gov", "administration", "services", "affairs", "resources", "management"]
+
+country_tlds = ['.uk', '.ca', '.au', '.de', '.fr', '.es', '.it', '.jp', '.br', '.ru', '.in', '.cn']
+
 def generate_domain(category: str) -> str:
     """Generate a random domain for a specific category"""
     if category == "edu_domains":
         # .edu domains have specific formats
-        edu_names = ["state", "central", "national", "american", "international", "pacific", "atlantic", 
-                    "western", "eastern", "northern", "southern", "metropolitan", "regional", "city",
-                    "community", "technical", "polytechnic", "liberal", "christian", "catholic"]
-        edu_suffixes = ["university", "college", "institute", "school"]
         name_part = random.choice(edu_names)
         suffix_part = random.choice(edu_suffixes)
         return f"https://www.{name_part}{suffix_part}.edu"
     
     elif category == "gov_domains":
         # .gov domains have specific formats
-        gov_prefixes = ["city", "county", "state", "department", "office", "bureau", "agency",
-                      "division", "admin", "council", "commission", "authority", "board"]
-        gov_suffixes = ["gov", "administration", "services", "affairs", "resources", "management"]
         prefix = random.choice(gov_prefixes)
         suffix = random.choice(gov_suffixes)
         return f"https://www.{prefix}of{suffix}.gov"
@@ -103,22 +112,44 @@ def generate_domain(category: str) -> str:
         else:
             return f"https://www.{prefix}{domain_word}{tld}"
 
-def add_country_domains(domains: List[str]) -> List[str]:
-    """Add country-specific versions of some domains"""
-    country_tlds = ['.uk', '.ca', '.au', '.de', '.fr', '.es', '.it', '.jp', '.br', '.ru', '.in', '.cn']
+def category_space(category: str, seed: int = 0) -> DomainSpace:
+    """Every domain generate_domain can produce for a category, in seeded random order"""
+    if category == "edu_domains":
+        layouts = [("https://www.{}{}.edu", [edu_names, edu_suffixes])]
+    elif category == "gov_domains":
+        layouts = [("https://www.{}of{}.gov", [gov_prefixes, gov_suffixes])]
+    else:
+        words = all_categories[category]
+        layouts = [
+            ("https://www.{}{}{}", [common_domains, words, tlds]),
+            ("https://www.{}{}{}{}", [common_domains, words, words, tlds]),
+        ]
+    return DomainSpace(layouts, seed=f"{seed}:{category}")
+
+def iter_new_domains(category: str, seen, seed: int = 0) -> Iterator[str]:
+    """Yield unseen domains for a category until its combination space runs out"""
+    for domain in category_space(category, seed):
+        # Different word combinations can still spell the same domain
+        if seen.add(domain):
+            yield domain
+
+def add_country_domains(domains: List[str], rng: random.Random) -> List[str]:
+    """Add country-specific versions of some domains, picking their TLDs with rng"""
     additional_domains = []
     
     for domain in domains[:int(len(domains) * 0.2)]:  # Convert 20% of domains to country versions
         if domain.endswith('.com'):
-            country_tld = random.choice(country_tlds)
+            country_tld = rng.choice(country_tlds)
             new_domain = domain.replace('.com', country_tld)
             additional_domains.append(new_domain)
     
     return domains + additional_domains
 
-def generate_websites(count_per_category: int) -> Dict[str, List[str]]:
+def generate_websites(count_per_category: int, seed: int = 0) -> Dict[str, List[str]]:
     """Generate websites for each category"""
     result = defaultdict(list)
+    # Country TLDs are drawn from this, so one seed always gives the same file
+    rng = random.Random(seed)
     
     # Load existing sources
     try:
@@ -136,14 +167,13 @@ def generate_websites(count_per_category: int) -> Dict[str, List[str]]:
         existing_count = len(existing_domains)
         
         # Generate new domains
-        new_domains = []
-        while len(new_domains) < count_per_category:
-            domain = generate_domain(category)
-            if domain not in existing_domains and domain not in new_domains:
-                new_domains.append(domain)
+        seen = make_seen_set(existing_count + count_per_category, items=existing_domains)
+        new_domains = list(islice(iter_new_domains(category, seen, seed), count_per_category))
+        if len(new_domains) < count_per_category:
+            print(f"Warning: only {len(new_domains)} new domains left for {category}")
         
         # Add country-specific versions
-        new_domains = add_country_domains(new_domains)
+        new_domains = add_country_domains(new_domains, rng)
         
         # Add to result
         result[category] = existing_domains + new_domains
@@ -151,13 +181,56 @@ def generate_websites(count_per_category: int) -> Dict[str, List[str]]:
     return result
 
 def save_sources(sources: Dict[str, List[str]]):
-    """Save sources to JSON file"""
-    with open('sources.json', 'w') as f:
-        json.dump(sources, f, indent=4)
+    """Save sources to JSON file (atomically, so an interrupted run keeps the old file)"""
+    atomic_write_json('sources.json', sources, indent=4)
+
+def stream_websites(count_per_category: int, path: str, seed: int = 0) -> int:
+    """Write generated websites as JSON lines without holding them in memory"""
+    rng = random.Random(seed)
+    try:
+        with open('sources.json', 'r') as f:
+            existing_sources = json.load(f)
+    except Exception:
+        existing_sources = {}
+    
+    written = 0
+    with open(path, 'w') as out:
+        for category in all_categories:
+            existing_domains = existing_sources.get(category, [])
+            seen = make_seen_set(len(existing_domains) + count_per_category * 2, items=existing_domains)
+            for i, domain in enumerate(islice(iter_new_domains(category, seen, seed), count_per_category)):
+                out.write(json.dumps({'category': category, 'url': domain}) + '\n')
+                written += 1
+                # Same share of country versions as add_country_domains
+                if i % 5 == 0 and domain.endswith('.com'):
+                    country_domain = domain.replace('.com', rng.choice(country_tlds))
+                    if seen.add(country_domain):
+                        out.write(json.dumps({'category': category, 'url': country_domain}) + '\n')
+                        written += 1
+    return written
 
 def main():
+    parser = argparse.ArgumentParser(description='Generate synthetic websites for each category')
+    parser.add_argument('--count', type=int, default=100, help='New websites per category')
+    parser.add_argument('--seed', type=int, default=None, help='Seed for a reproducible order (random if omitted)')
+    parser.add_argument('--stream', metavar='PATH', help='Write JSON lines to PATH instead of updating sources.json')
+    parser.add_argument('--capacity', action='store_true', help='Only print how many domains each category can produce')
+    args = parser.parse_args()
+    
+    seed = args.seed if args.seed is not None else random.randrange(2 ** 32)
+    
+    if args.capacity:
+        for category in all_categories:
+            print(f"{category}: {category_space(category, seed).remaining()} possible domains")
+        return
+    
+    if args.stream:
+        written = stream_websites(args.count, args.stream, seed)
+        print(f"Streamed {written} websites to {args.stream} (seed {seed})")
+        return
+    
     # Generate approximately 1000 new websites (about 100 per category)
-    websites = generate_websites(100)
+    websites = generate_websites(args.count, seed)
     
     # Count total websites
     total = sum(len(domains) for domains in websites.values())
@@ -165,7 +238,7 @@ def main():
     # Save to file
     save_sources(websites)
     
-    print(f"Generated {total} websites across {len(websites)} categories")
+    print(f"Generated {total} websites across {len(websites)} categories (seed {seed})")
     
     # Print summary
     for category, domains in websites.items():
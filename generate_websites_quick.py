@@ -1,11 +1,98 @@
+import argparse
+import hashlib
 import json
 import random
-from typing import Dict, List
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from persistence import atomic_write_json
+from seen_filter import make_seen_set
+
+# Categories generated by this script, in output order
+categories = [
+    "directories", "forums", "edu_domains", "blog_platforms",
+    "social_bookmarking", "qa_sites", "local_directories",
+    "industry_directories", "review_sites", "web_2_profiles",
+    "news_sites"
+]
+
+# Base parts for domain construction
+prefixes = ["my", "the", "best", "top", "pro", "all", "free", "online", "digital", "web",
+          "world", "global", "united", "info", "meta", "tech", "expert", "smart", "easy"]
+
+category_keywords = {
+    "directories": ["directory", "list", "catalog", "index", "guide", "lookup", "registry"],
+    "forums": ["forum", "community", "discuss", "board", "talk", "conversation", "chat"],
+    "edu_domains": ["university", "college", "school", "academy", "institute", "education"],
+    "blog_platforms": ["blog", "write", "post", "article", "journal", "diary", "content"],
+    "social_bookmarking": ["bookmark", "save", "share", "recommend", "favorite", "curate", "collect"],
+    "qa_sites": ["questions", "answers", "ask", "query", "solution", "help", "support"],
+    "local_directories": ["local", "city", "region", "area", "town", "location", "place"],
+    "industry_directories": ["industry", "business", "trade", "sector", "niche", "professional"],
+    "review_sites": ["review", "rating", "feedback", "opinion", "experience", "testimonial"],
+    "web_2_profiles": ["profile", "account", "bio", "portfolio", "member", "user", "identity"],
+    "news_sites": ["news", "media", "publication", "press", "journal", "gazette", "times"],
+}
+
+tlds = ['.com', '.org', '.net', '.info', '.biz']
+
+edu_names = ["state", "central", "national", "american", "international",
+            "western", "eastern", "northern", "southern", "metropolitan"]
+edu_suffixes = ["university", "college", "institute", "school"]
+
+# How many generated edu_domains entries are replaced with real-looking .edu domains
+EDU_REPLACEMENTS = 30
+
+def derive_seed(seed: int, category: str, shard: int) -> int:
+    """Independent RNG seed for one (category, shard) piece of the output"""
+    digest = hashlib.blake2b(f"{seed}:{category}:{shard}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'little')
+
+def split_evenly(total: int, parts: int) -> List[int]:
+    """Sizes of `parts` consecutive slices of `total` items"""
+    return [total // parts + (1 if i < total % parts else 0) for i in range(parts)]
+
+def generate_shard(category: str, shard: int, shards: int, domains_per_category: int, seed: int) -> List[str]:
+    """Candidate domains for one shard of a category, drawn from its own RNG stream"""
+    rng = random.Random(derive_seed(seed, category, shard))
+    keywords = category_keywords[category]
+
+    # Create domains for this shard
+    candidates = []
+    for _ in range(split_evenly(domains_per_category, shards)[shard]):
+        prefix = rng.choice(prefixes)
+        keyword = rng.choice(keywords)
+        tld = rng.choice(tlds)
+
+        # 30% chance to have a compound domain
+        if rng.random() < 0.3:
+            second_keyword = rng.choice(keywords)
+            candidates.append(f"https://www.{prefix}{keyword}{second_keyword}{tld}")
+        else:
+            candidates.append(f"https://www.{prefix}{keyword}{tld}")
+
+    # Special handling for edu_domains: replace this shard's share of domains with .edu domains
+    if category == "edu_domains":
+        for i in range(min(len(candidates), split_evenly(EDU_REPLACEMENTS, shards)[shard])):
+            name_part = rng.choice(edu_names)
+            suffix_part = rng.choice(edu_suffixes)
+            candidates[i] = f"https://www.{name_part}{suffix_part}.edu"
+
+    return candidates
+
+def _generate_shard(job: Tuple[str, int, int, int, int]) -> List[str]:
+    return generate_shard(*job)
 
 # Generate domains more efficiently by pre-generating combinations
-def generate_bulk_domains(count: int = 1000):
-    """Generate a large number of domains quickly"""
-    
+def generate_bulk_domains(count: int = 1000, seed: Optional[int] = None, shards: int = 1, workers: int = 1):
+    """Generate a large number of domains quickly.
+
+    Every (category, shard) pair has its own RNG stream derived from the seed,
+    and pieces are merged in a fixed order, so a seed gives the same
+    sources.json whatever the number of workers.
+    """
+    if seed is None:
+        seed = random.randrange(2 ** 32)
+
     # Load existing sources
     try:
         with open('sources.json', 'r') as f:
@@ -13,104 +100,57 @@ def generate_bulk_domains(count: int = 1000):
     except Exception as e:
         print(f"Error loading sources.json: {e}")
         sources = {}
-    
-    # Define categories if they don't exist
-    categories = [
-        "directories", "forums", "edu_domains", "blog_platforms", 
-        "social_bookmarking", "qa_sites", "local_directories",
-        "industry_directories", "review_sites", "web_2_profiles", 
-        "news_sites"
-    ]
-    
+
     # Ensure all categories exist
     for category in categories:
         if category not in sources:
             sources[category] = []
-    
+
     # Count existing domains
     existing_count = sum(len(domains) for domains in sources.values())
     print(f"Found {existing_count} existing domains")
-    
+
     # Calculate how many domains to add per category
     domains_per_category = count // len(categories) + 1
-    
-    # Add domains to each category
+
+    jobs = [(category, shard, shards, domains_per_category, seed)
+            for category in categories for shard in range(shards)]
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pieces = list(pool.map(_generate_shard, jobs, chunksize=max(1, len(jobs) // (workers * 4))))
+    else:
+        pieces = [_generate_shard(job) for job in jobs]
+
+    # Merge pieces in job order, deduplicating against what is already there
     added_count = 0
-    for category in categories:
-        # Base parts for domain construction
-        prefixes = ["my", "the", "best", "top", "pro", "all", "free", "online", "digital", "web", 
-                  "world", "global", "united", "info", "meta", "tech", "expert", "smart", "easy"]
-        
-        if category == "directories":
-            keywords = ["directory", "list", "catalog", "index", "guide", "lookup", "registry"]
-        elif category == "forums":
-            keywords = ["forum", "community", "discuss", "board", "talk", "conversation", "chat"]
-        elif category == "edu_domains":
-            keywords = ["university", "college", "school", "academy", "institute", "education"]
-        elif category == "blog_platforms":
-            keywords = ["blog", "write", "post", "article", "journal", "diary", "content"]
-        elif category == "social_bookmarking":
-            keywords = ["bookmark", "save", "share", "recommend", "favorite", "curate", "collect"]
-        elif category == "qa_sites":
-            keywords = ["questions", "answers", "ask", "query", "solution", "help", "support"]
-        elif category == "local_directories":
-            keywords = ["local", "city", "region", "area", "town", "location", "place"]
-        elif category == "industry_directories":
-            keywords = ["industry", "business", "trade", "sector", "niche", "professional"]
-        elif category == "review_sites":
-            keywords = ["review", "rating", "feedback", "opinion", "experience", "testimonial"]
-        elif category == "web_2_profiles":
-            keywords = ["profile", "account", "bio", "portfolio", "member", "user", "identity"]
-        else:  # news_sites
-            keywords = ["news", "media", "publication", "press", "journal", "gazette", "times"]
-        
-        tlds = ['.com', '.org', '.net', '.info', '.biz']
-        
-        # Create domains for this category
-        new_domains = []
-        for _ in range(domains_per_category):
-            prefix = random.choice(prefixes)
-            keyword = random.choice(keywords)
-            tld = random.choice(tlds)
-            
-            # 30% chance to have a compound domain
-            if random.random() < 0.3:
-                second_keyword = random.choice(keywords)
-                domain = f"https://www.{prefix}{keyword}{second_keyword}{tld}"
-            else:
-                domain = f"https://www.{prefix}{keyword}{tld}"
-            
-            if domain not in sources[category] and domain not in new_domains:
-                new_domains.append(domain)
-        
-        # Special handling for edu_domains
-        if category == "edu_domains":
-            edu_names = ["state", "central", "national", "american", "international", 
-                        "western", "eastern", "northern", "southern", "metropolitan"]
-            edu_suffixes = ["university", "college", "institute", "school"]
-            
-            # Replace some domains with .edu domains
-            for i in range(min(len(new_domains), 30)):
-                name_part = random.choice(edu_names)
-                suffix_part = random.choice(edu_suffixes)
-                edu_domain = f"https://www.{name_part}{suffix_part}.edu"
-                if edu_domain not in sources[category]:
-                    new_domains[i] = edu_domain
-        
+    seen_by_category: Dict[str, object] = {}
+    for (category, _, _, _, _), candidates in zip(jobs, pieces):
+        if category not in seen_by_category:
+            seen_by_category[category] = make_seen_set(len(sources[category]) + domains_per_category,
+                                                       items=sources[category])
+        seen = seen_by_category[category]
+        new_domains = [domain for domain in candidates if seen.add(domain)]
+
         # Add new domains to the category
         sources[category].extend(new_domains)
         added_count += len(new_domains)
-    
+
     # Save updated sources
-    with open('sources.json', 'w') as f:
-        json.dump(sources, f, indent=4)
-    
-    print(f"Added {added_count} new domains")
+    atomic_write_json('sources.json', sources, indent=4)
+
+    print(f"Added {added_count} new domains (seed {seed})")
     print(f"Total domains: {existing_count + added_count}")
-    
+
     # Print summary
     for category in categories:
         print(f"{category}: {len(sources[category])} websites")
 
 if __name__ == "__main__":
-    generate_bulk_domains(1000) 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Quickly generate domains for every category')
+    parser.add_argument('--count', type=int, default=1000, help='Approximate number of domains to add')
+    parser.add_argument('--seed', type=int, default=None, help='Seed for bit-for-bit reproducible output')
+    parser.add_argument('--shards', type=int, default=1, help='Independent RNG streams per category')
+    parser.add_argument('--workers', type=int, default=1, help='Processes used to generate the shards')
+    args = parser.parse_args()
+
+    generate_bulk_domains(args.count, seed=args.seed, shards=args.shards, workers=args.workers)
\ No newline at end of file
@@ -0,0 +1,289 @@
+import argparse
+import json
+import math
+import os
+import sys
+import time
+from array import array
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    from scipy import sparse
+except ImportError:
+    sparse = None
+
+from distributed import default_worker_id
+from persistence import atomic_write_bytes
+from url_record import registrable_domain
+
+GRAPH_DIR = 'link_graph'
+SEGMENT_SUFFIX = '.edges'
+
+# Domains with fewer referring domains than this are left to the other providers
+MIN_REFERRING = 3
+
+
+def link_domain(host: str) -> str:
+    """Graph node for a host: its registrable domain, so www.cs.example.edu and example.edu are one node"""
+    host = host.lower().rstrip('.')
+    return registrable_domain(host[4:] if host.startswith('www.') else host)
+
+
+class EdgeRecorder:
+    """Outbound domain-to-domain links seen while scraping, written as one compact segment.
+
+    Domains are numbered in order of first sight and each edge is a pair of
+    little-endian uint32 ids, so a segment is a JSON list of names on one line
+    followed by 8 bytes per edge. Every scraping process writes its own segment
+    and load_graph merges them, so workers never share ids or files.
+    """
+
+    def __init__(self, directory: str = GRAPH_DIR, name: Optional[str] = None):
+        name = name or f"{default_worker_id()}-{int(time.time())}"
+        self.path = os.path.join(directory, name + SEGMENT_SUFFIX)
+        self.ids: Dict[str, int] = {}
+        self.edges: Set[Tuple[int, int]] = set()
+
+    def _id(self, domain: str) -> int:
+        node = self.ids.get(domain)
+        if node is None:
+            node = self.ids[domain] = len(self.ids)
+        return node
+
+    def add(self, source_host: str, target_domains: Iterable[str]):
+        """Record links from a page on source_host to each target domain"""
+        source = self._id(link_domain(source_host))
+        for domain in target_domains:
+            target = self._id(domain)
+            if target != source:
+                self.edges.add((source, target))
+
+    def save(self):
+        """Rewrite this recorder's segment with everything recorded so far"""
+        if not self.edges:
+            return
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        pairs = array('I')
+        for edge in sorted(self.edges):
+            pairs.extend(edge)
+        if sys.byteorder == 'big':
+            pairs.byteswap()
+        header = json.dumps(list(self.ids), separators=(',', ':')).encode('utf-8') + b'\n'
+        atomic_write_bytes(self.path, header + pairs.tobytes())
+
+
+def segment_paths(directory: str = GRAPH_DIR) -> List[str]:
+    if not os.path.isdir(directory):
+        return []
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(SEGMENT_SUFFIX))
+
+
+def read_segment(path: str) -> Tuple[List[str], bytes]:
+    """(domain names, raw edge bytes) of one segment"""
+    with open(path, 'rb') as f:
+        header, _, edges = f.read().partition(b'\n')
+    return json.loads(header), edges
+
+
+def load_graph(directory: str = GRAPH_DIR):
+    """Merge every segment into (domains, sources, targets), with duplicate edges removed.
+
+    sources and targets are parallel uint32 arrays of indexes into domains
+    (plain lists when NumPy is not installed).
+    """
+    index: Dict[str, int] = {}
+    if np is None:
+        edges = set()
+        for path in segment_paths(directory):
+            names, raw = read_segment(path)
+            remap = [index.setdefault(name, len(index)) for name in names]
+            pairs = array('I', raw)
+            if sys.byteorder == 'big':
+                pairs.byteswap()
+            edges.update((remap[pairs[i]], remap[pairs[i + 1]]) for i in range(0, len(pairs), 2))
+        edges = sorted(edges)
+        return list(index), [s for s, _ in edges], [t for _, t in edges]
+
+    sources, targets = [], []
+    for path in segment_paths(directory):
+        names, raw = read_segment(path)
+        remap = np.fromiter((index.setdefault(name, len(index)) for name in names), dtype=np.uint32, count=len(names))
+        pairs = np.frombuffer(raw, dtype='<u4').reshape(-1, 2)
+        sources.append(remap[pairs[:, 0]])
+        targets.append(remap[pairs[:, 1]])
+    if not sources:
+        return [], np.zeros(0, dtype=np.uint32), np.zeros(0, dtype=np.uint32)
+    # One uint64 key per edge makes dedup a single sort
+    keys = np.unique((np.concatenate(sources).astype(np.uint64) << np.uint64(32)) | np.concatenate(targets))
+    return list(index), (keys >> np.uint64(32)).astype(np.uint32), (keys & np.uint64(0xFFFFFFFF)).astype(np.uint32)
+
+
+def compact(directory: str = GRAPH_DIR) -> int:
+    """Merge all segments into one, dropping duplicate edges; returns the edge count"""
+    paths = segment_paths(directory)
+    domains, sources, targets = load_graph(directory)
+    recorder = EdgeRecorder(directory, name='compacted')
+    recorder.ids = {domain: i for i, domain in enumerate(domains)}
+    recorder.edges = set(zip((int(s) for s in sources), (int(t) for t in targets)))
+    recorder.save()
+    for path in paths:
+        if path != recorder.path:
+            os.remove(path)
+    return len(recorder.edges)
+
+
+def pagerank(sources, targets, count: int, damping: float = 0.85, tol: float = 1e-9, max_iter: int = 100):
+    """PageRank by power iteration over the edge list; scores sum to 1.
+
+    Uses a SciPy sparse matrix when available, otherwise np.bincount, which is
+    also a sparse matrix-vector product. Dangling domains (no outbound links
+    recorded) spread their rank evenly, as if they linked everywhere.
+    """
+    if np is None:
+        return _pagerank_python(sources, targets, count, damping, tol, max_iter)
+    if count == 0:
+        return np.zeros(0)
+    sources = np.asarray(sources, dtype=np.int64)
+    targets = np.asarray(targets, dtype=np.int64)
+    out_degree = np.bincount(sources, minlength=count).astype(np.float64)
+    weights = 1.0 / out_degree[sources]
+    dangling = out_degree == 0
+    if sparse is not None:
+        matrix = sparse.csr_matrix((weights, (targets, sources)), shape=(count, count))
+        spread = matrix.dot
+    else:
+        spread = lambda ranks: np.bincount(targets, weights=ranks[sources] * weights, minlength=count)
+    ranks = np.full(count, 1.0 / count)
+    for _ in range(max_iter):
+        updated = damping * (spread(ranks) + ranks[dangling].sum() / count) + (1 - damping) / count
+        delta = np.abs(updated - ranks).sum()
+        ranks = updated
+        if delta < tol:
+            break
+    return ranks
+
+
+def _pagerank_python(sources, targets, count, damping, tol, max_iter) -> List[float]:
+    if count == 0:
+        return []
+    out_degree = [0] * count
+    for source in sources:
+        out_degree[source] += 1
+    ranks = [1.0 / count] * count
+    for _ in range(max_iter):
+        spread = [0.0] * count
+        for source, target in zip(sources, targets):
+            spread[target] += ranks[source] / out_degree[source]
+        dangling = sum(rank for rank, degree in zip(ranks, out_degree) if degree == 0) / count
+        updated = [damping * (value + dangling) + (1 - damping) / count for value in spread]
+        delta = sum(abs(new - old) for new, old in zip(updated, ranks))
+        ranks = updated
+        if delta < tol:
+            break
+    return ranks
+
+
+def _counts(values, count: int) -> List[int]:
+    if np is not None:
+        return np.bincount(np.asarray(values, dtype=np.int64), minlength=count).tolist()
+    counts = [0] * count
+    for value in values:
+        counts[value] += 1
+    return counts
+
+
+class LinkAuthority:
+    """DA/PA/spam estimates for domains in the recorded link graph.
+
+    DA is PageRank on a log scale, from 1 for a domain nobody links to up to
+    100 for the best-linked domain in the graph; PA is the number of referring
+    domains on a log scale. Scores are relative to what has been scraped, so
+    they firm up as the graph grows.
+    """
+
+    def __init__(self, directory: str = GRAPH_DIR, min_referring: int = MIN_REFERRING):
+        started = time.monotonic()
+        self.domains, sources, targets = load_graph(directory)
+        self.index = {domain: i for i, domain in enumerate(self.domains)}
+        self.edge_count = len(sources)
+        count = len(self.domains)
+        self.ranks = [float(rank) for rank in pagerank(sources, targets, count)]
+        self.referring = _counts(targets, count)
+        self.outbound = _counts(sources, count)
+        self.min_referring = min_referring
+        self.floor = (1 - 0.85) / count if count else 0.0
+        self.top_rank = max(self.ranks, default=0.0)
+        self.top_referring = max(self.referring, default=0)
+        self.seconds = time.monotonic() - started
+
+    def metrics(self, domain: str) -> Optional[Dict]:
+        node = self.index.get(link_domain(domain))
+        if node is None or self.referring[node] < self.min_referring:
+            return None
+        rank_span = math.log(self.top_rank / self.floor) or 1.0
+        da = 1 + 99 * math.log(max(self.ranks[node], self.floor) / self.floor) / rank_span
+        pa = 1 + 99 * math.log1p(self.referring[node]) / (math.log1p(self.top_referring) or 1.0)
+        # Link-farm signal: lots of outbound links, few domains linking back
+        outbound, referring = self.outbound[node], self.referring[node]
+        spam_score = 14 * outbound / (outbound + 5 * referring + 20)
+        return {'da': round(da), 'pa': round(pa), 'spam_score': round(spam_score)}
+
+    def top(self, limit: int) -> List[Tuple[str, Dict]]:
+        order = sorted(range(len(self.domains)), key=lambda node: -self.ranks[node])
+        return [(self.domains[node], self.metrics(self.domains[node])) for node in order[:limit]]
+
+
+@lru_cache(maxsize=None)
+def link_authority(directory: str = GRAPH_DIR) -> LinkAuthority:
+    return LinkAuthority(directory)
+
+
+def link_graph_metrics(domain: str) -> Optional[Dict]:
+    """Metrics provider: scores from the scraped link graph, or None if it has too little on the domain"""
+    return link_authority().metrics(domain)
+
+
+def synthetic_graph(edges: int, seed: int = 0):
+    """A random graph with a power-law in-degree, for timing"""
+    rng = np.random.default_rng(seed)
+    count = max(edges // 10, 2)
+    sources = rng.integers(0, count, edges, dtype=np.uint32)
+    targets = (count * rng.random(edges) ** 3).astype(np.uint32)
+    return sources, targets, count
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Score domains by PageRank over the links recorded while scraping')
+    parser.add_argument('--dir', default=GRAPH_DIR, help='Directory of edge segments written by the scraper')
+    parser.add_argument('--top', type=int, default=20, help='Number of top domains to show')
+    parser.add_argument('--compact', action='store_true', help='Merge the segments into one before scoring')
+    parser.add_argument('--bench', type=int, metavar='EDGES', help='Time PageRank on a random graph of this many edges')
+    args = parser.parse_args()
+
+    if args.bench:
+        if np is None:
+            parser.error('--bench needs NumPy')
+        sources, targets, count = synthetic_graph(args.bench)
+        started = time.monotonic()
+        pagerank(sources, targets, count)
+        print(f"PageRank over {args.bench} edges and {count} domains: {time.monotonic() - started:.2f}s "
+              f"({'scipy' if sparse is not None else 'numpy'})")
+        return
+
+    if args.compact:
+        print(f"Compacted to {compact(args.dir)} edges")
+
+    authority = LinkAuthority(args.dir)
+    print(f"{len(authority.domains)} domains, {authority.edge_count} edges, scored in {authority.seconds:.2f}s")
+    for domain, metrics in authority.top(args.top):
+        print(f"- {domain:<40} referring={authority.referring[authority.index[domain]]:<6} {metrics or 'too few referring domains'}")
+
+
+if __name__ == "__main__":
+    main()
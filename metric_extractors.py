@@ -0,0 +1,405 @@
+import re
+from html.parser import HTMLParser
+from typing import Callable, Dict, List, Optional, Pattern, Sequence, Tuple
+
+Metrics = Dict
+
+DIGITS = re.compile(r'\d+')
+NO_DATA = re.compile(r'no data|not found|no results', re.IGNORECASE)
+AUTHORITY_LABELS = re.compile(r'(domain authority)|(page authority)', re.IGNORECASE)
+AUTHORITY_SCORE_LABEL = re.compile(r'(authority score)', re.IGNORECASE)
+
+# Elements BeautifulSoup closes as soon as they open
+VOID_ELEMENTS = frozenset((
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'keygen', 'link', 'menuitem', 'meta',
+    'param', 'source', 'track', 'wbr', 'basefont', 'bgsound', 'command', 'frame', 'image', 'isindex',
+    'nextid', 'spacer',
+))
+# Elements whose text get_text() leaves out
+HIDDEN_TEXT = frozenset(('script', 'style', 'template', 'rt', 'rp'))
+
+STEP = re.compile(r'^([a-z0-9]*)((?:\.[\w-]+)*)((?:\[[\w-]+="[^"]*"\])*)$')
+ATTRIBUTE = re.compile(r'\[([\w-]+)="([^"]*)"\]')
+
+
+def first_int(text: str) -> Optional[int]:
+    match = DIGITS.search(text)
+    return int(match.group()) if match else None
+
+
+def labelled_numbers(text: str, labels: Pattern, wanted: int) -> List[Optional[int]]:
+    """Same results as re.search(r'<label>.*?(\\d+)', text, re.IGNORECASE) for each label
+    group in `labels`, in one scan of the text: the first number on the rest of the
+    line after the first occurrence of the label that has one."""
+    found: List[Optional[int]] = [None] * wanted
+    missing = wanted
+    for match in labels.finditer(text):
+        index = match.lastindex - 1
+        if found[index] is not None:
+            continue
+        end = text.find('\n', match.end())
+        number = DIGITS.search(text, match.end(), len(text) if end < 0 else end)
+        if number:
+            found[index] = int(number.group())
+            missing -= 1
+            if not missing:
+                break
+    return found
+
+
+class Selector:
+    """A CSS selector from the small subset the providers need.
+
+    Each step is a tag, classes and [attr="value"] tests (`table.results`,
+    `.da-score`, `[data-metric="da"]`), and a selector is one step or an
+    ancestor step followed by a descendant step (`.result-table tr`).
+    """
+
+    def __init__(self, css: str):
+        self.css = css
+        steps = [self._parse(part) for part in css.split()]
+        if len(steps) > 2:
+            raise ValueError(f"unsupported selector: {css}")
+        self.step = steps[-1]
+        self.ancestor = steps[0] if len(steps) == 2 else None
+
+    @staticmethod
+    def _parse(part: str) -> Tuple[str, frozenset, Tuple[Tuple[str, str], ...]]:
+        match = STEP.match(part)
+        if not match or part == '':
+            raise ValueError(f"unsupported selector step: {part}")
+        tag, classes, attributes = match.groups()
+        return tag, frozenset(classes.split('.')[1:]), tuple(ATTRIBUTE.findall(attributes))
+
+    @staticmethod
+    def step_matches(step, tag: str, classes: frozenset, attrs: Dict[str, str]) -> bool:
+        step_tag, step_classes, step_attrs = step
+        return (not step_tag or step_tag == tag) and step_classes <= classes \
+            and all(attrs.get(name) == value for name, value in step_attrs)
+
+    def __repr__(self) -> str:
+        return f"Selector({self.css!r})"
+
+
+class Target:
+    """Elements to capture: any of `selectors`, optionally only inside an open capture of `within`"""
+
+    def __init__(self, name: str, selectors: str, within: Optional[str] = None, first: bool = False):
+        self.name = name
+        self.selectors = [Selector(css.strip()) for css in selectors.split(',')]
+        self.within = within
+        self.first = first
+
+
+class Capture:
+    """A captured element: its attributes, its get_text() and captures of targets nested in it"""
+
+    __slots__ = ('attrs', 'parts', 'children', 'closed')
+
+    def __init__(self, attrs: Dict[str, str]):
+        self.attrs = attrs
+        self.parts: List[str] = []
+        self.children: Dict[str, List['Capture']] = {}
+        self.closed = False
+
+    @property
+    def text(self) -> str:
+        return ''.join(self.parts)
+
+
+class _Stop(Exception):
+    pass
+
+
+class _Scan(HTMLParser):
+    """One pass over a document, building no tree; open elements are tracked the way
+    BeautifulSoup's html.parser builder nests them, so captures match soup.select()."""
+
+    def __init__(self, extractor: 'Extractor', done: Optional[Callable[[Dict[str, List[Capture]]], bool]]):
+        super().__init__(convert_charrefs=True)
+        self.extractor = extractor
+        self.done = done
+        self.results: Dict[str, List[Capture]] = {target.name: [] for target in extractor.targets}
+        # Per open element: (tag, ancestor steps it matches, captures it opened)
+        self.stack: List[Tuple[str, Tuple[int, ...], List[Tuple[str, Capture]]]] = []
+        self.ancestors_open = [0] * len(extractor.ancestor_steps)
+        self.open_captures: Dict[str, List[Capture]] = {target.name: [] for target in extractor.targets}
+        self.text_sinks: List[Capture] = []
+        self.hidden = 0
+
+    def handle_starttag(self, tag, attrs):
+        self._open(tag, attrs)
+        if tag in VOID_ELEMENTS:
+            self._close(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self._open(tag, attrs)
+        self._close(tag)
+
+    def handle_endtag(self, tag):
+        self._close(tag)
+
+    def handle_data(self, data):
+        if not self.hidden:
+            for capture in self.text_sinks:
+                capture.parts.append(data)
+
+    def _open(self, tag: str, attr_list):
+        extractor = self.extractor
+        if tag in HIDDEN_TEXT:
+            self.hidden += 1
+        # Most elements carry nothing any selector looks at: skip matching for them
+        if tag not in extractor.trigger_tags and not any(
+                name in extractor.trigger_attrs or
+                (name == 'class' and value and not extractor.trigger_classes.isdisjoint(value.split()))
+                for name, value in attr_list):
+            self.stack.append((tag, (), []))
+            return
+        attrs = {name: value or '' for name, value in attr_list}
+        classes = frozenset(attrs.get('class', '').split())
+        ancestor_ids = tuple(i for i, step in enumerate(extractor.ancestor_steps)
+                             if Selector.step_matches(step, tag, classes, attrs))
+        opened: List[Tuple[str, Capture]] = []
+        for target in extractor.targets:
+            if target.first and (self.results[target.name] or self.open_captures[target.name]):
+                continue
+            if not any(Selector.step_matches(selector.step, tag, classes, attrs) and
+                       (selector.ancestor is None or
+                        self.ancestors_open[extractor.ancestor_index[selector.ancestor]])
+                       for selector in target.selectors):
+                continue
+            if target.within is None:
+                capture = Capture(attrs)
+                self.results[target.name].append(capture)
+            else:
+                # Descendants only: not a capture opened on this same element
+                parents = [parent for parent in self.open_captures[target.within]
+                           if all(parent is not mine for _, mine in opened)]
+                if not parents:
+                    continue
+                capture = Capture(attrs)
+                for parent in parents:
+                    parent.children.setdefault(target.name, []).append(capture)
+            opened.append((target.name, capture))
+            self.open_captures[target.name].append(capture)
+            self.text_sinks.append(capture)
+        for i in ancestor_ids:
+            self.ancestors_open[i] += 1
+        self.stack.append((tag, ancestor_ids, opened))
+
+    def _close(self, tag: str):
+        for depth in range(len(self.stack) - 1, -1, -1):
+            if self.stack[depth][0] == tag:
+                break
+        else:
+            return
+        closed_any = False
+        while len(self.stack) > depth:
+            open_tag, ancestor_ids, opened = self.stack.pop()
+            for i in ancestor_ids:
+                self.ancestors_open[i] -= 1
+            if open_tag in HIDDEN_TEXT:
+                self.hidden -= 1
+            for name, capture in opened:
+                capture.closed = True
+                self.open_captures[name].remove(capture)
+                self.text_sinks.remove(capture)
+                closed_any = True
+        if closed_any and self.done is not None and self.done(self.results):
+            raise _Stop
+
+
+class Extractor:
+    """Precompiled set of targets captured in a single pass over a document"""
+
+    def __init__(self, targets: Sequence[Target]):
+        self.targets = list(targets)
+        self.ancestor_steps = []
+        self.ancestor_index: Dict[tuple, int] = {}
+        for target in self.targets:
+            for selector in target.selectors:
+                if selector.ancestor is not None and selector.ancestor not in self.ancestor_index:
+                    self.ancestor_index[selector.ancestor] = len(self.ancestor_steps)
+                    self.ancestor_steps.append(selector.ancestor)
+        # An element can only match a step if it has the step's tag, one of its classes or attributes
+        self.trigger_tags = set()
+        self.trigger_classes = set()
+        self.trigger_attrs = set()
+        for step in self.ancestor_steps + [selector.step for target in self.targets for selector in target.selectors]:
+            tag, classes, attributes = step
+            if tag:
+                self.trigger_tags.add(tag)
+            elif classes:
+                self.trigger_classes.update(classes)
+            else:
+                self.trigger_attrs.update(name for name, _ in attributes)
+
+    def scan(self, html: str, done: Optional[Callable[[Dict[str, List[Capture]]], bool]] = None
+             ) -> Dict[str, List[Capture]]:
+        """Captures per target name; stops early once done(results) is true after an element closes"""
+        scan = _Scan(self, done)
+        try:
+            scan.feed(html)
+            scan.close()
+        except _Stop:
+            pass
+        return scan.results
+
+
+def _first_number(captures: List[Capture]) -> Optional[int]:
+    for capture in captures:
+        number = first_int(capture.text)
+        if number is not None:
+            return number
+    return None
+
+
+def _spam_from_da(da: int) -> int:
+    return max(0, 14 - int(da / 7)) if da > 0 else 0
+
+
+WEBSITESEOCHECKER = Extractor([
+    Target('row', '.result-table tr, .results-table tr, table.results tr, .domain-metrics tr'),
+    Target('cell', 'td', within='row'),
+    Target('da', '[data-metric="da"], .da-score, .domain-authority, .metric-da'),
+    Target('pa', '[data-metric="pa"], .pa-score, .page-authority, .metric-pa'),
+    Target('spam', '[data-metric="spam"], .spam-score, .spam-metric, .metric-spam'),
+])
+
+
+def extract_websiteseochecker(html: str) -> Optional[Metrics]:
+    """DA, PA and spam score from a WebsiteSEOChecker result page, or None if it reports no data"""
+    found = WEBSITESEOCHECKER.scan(html)
+    da = pa = spam_score = None
+    # Later rows win, as in a loop over the rows that never breaks
+    for row in found['row']:
+        cells = row.children.get('cell', [])
+        if len(cells) < 2:
+            continue
+        label = cells[0].text.strip().lower()
+        value = first_int(cells[1].text.strip())
+        if 'domain authority' in label or 'da' in label:
+            da = value if value is not None else da
+        elif 'page authority' in label or 'pa' in label:
+            pa = value if value is not None else pa
+        elif 'spam score' in label or 'spam' in label:
+            spam_score = value if value is not None else spam_score
+
+    if da is None:
+        da = _first_number(found['da'])
+    if pa is None:
+        pa = _first_number(found['pa'])
+    if spam_score is None:
+        spam_score = _first_number(found['spam'])
+
+    if da is None or pa is None:
+        text_da, text_pa = labelled_numbers(html, AUTHORITY_LABELS, 2)
+        da = text_da if da is None else da
+        pa = text_pa if pa is None else pa
+
+    metrics = {'da': da or 0, 'pa': pa or 0, 'spam_score': spam_score or 0}
+    if not any(metrics.values()) and NO_DATA.search(html):
+        return None
+    return metrics
+
+
+SEOSITECHECKUP = Extractor([
+    Target('authority', '.domain-authority, .page-authority, [data-metric="authority"]'),
+])
+
+
+def extract_seositecheckup(html: str) -> Optional[Metrics]:
+    """DA and PA from an SEO Site Checkup audit page (spam score estimated from DA)"""
+    da = pa = 0
+    for element in SEOSITECHECKUP.scan(html)['authority']:
+        text = element.text.lower()
+        number = first_int(text)
+        if 'domain authority' in text or 'da:' in text:
+            da = number if number is not None else da
+        elif 'page authority' in text or 'pa:' in text:
+            pa = number if number is not None else pa
+
+    if da == 0 or pa == 0:
+        text_da, text_pa = labelled_numbers(html, AUTHORITY_LABELS, 2)
+        if da == 0 and text_da is not None:
+            da = text_da
+        if pa == 0 and text_pa is not None:
+            pa = text_pa
+
+    if da == 0 and pa == 0:
+        return None
+    return {'da': da, 'pa': pa, 'spam_score': _spam_from_da(da)}
+
+
+SMALLSEOTOOLS_FORM = Extractor([Target('token', 'input[name="token"]', first=True)])
+
+SMALLSEOTOOLS = Extractor([
+    Target('result', '.resultBox, .result-container, .da-results', first=True),
+    Target('da', '.da-score, .domain-authority, [data-metric="da"]', within='result'),
+    Target('pa', '.pa-score, .page-authority, [data-metric="pa"]', within='result'),
+])
+
+
+def extract_smallseotools_token(html: str) -> str:
+    """The form token SmallSEOTools expects back ('' if the form has none)"""
+    inputs = SMALLSEOTOOLS_FORM.scan(html, done=lambda found: bool(found['token']))['token']
+    return inputs[0].attrs['value'] if inputs else ""
+
+
+def extract_smallseotools(html: str) -> Optional[Metrics]:
+    """DA and PA from the first result box of a SmallSEOTools page (spam score estimated from DA)"""
+    found = SMALLSEOTOOLS.scan(html, done=lambda found: bool(found['result']) and found['result'][0].closed)
+    if not found['result']:
+        return None
+    container = found['result'][0]
+    # select_one: only the first matching element counts, digits or not
+    da = pa = 0
+    for key in ('da', 'pa'):
+        elements = container.children.get(key)
+        number = first_int(elements[0].text) if elements else None
+        if number is not None:
+            if key == 'da':
+                da = number
+            else:
+                pa = number
+
+    if da == 0 or pa == 0:
+        text_da, text_pa = labelled_numbers(container.text, AUTHORITY_LABELS, 2)
+        if da == 0 and text_da is not None:
+            da = text_da
+        if pa == 0 and text_pa is not None:
+            pa = text_pa
+
+    if da == 0 and pa == 0:
+        return None
+    return {'da': da, 'pa': pa, 'spam_score': _spam_from_da(da)}
+
+
+SEMRUSH = Extractor([
+    Target('score', '.cl-overview-domain__authority-score, .domain-score, .authority-score'),
+])
+
+
+def extract_semrush(html: str) -> Optional[Metrics]:
+    """Metrics estimated from the SEMrush Authority Score on a domain overview page"""
+    # Stop at the first element with a number once no enclosing match is still open
+    found = SEMRUSH.scan(html, done=lambda found: all(capture.closed for capture in found['score'])
+                         and any(DIGITS.search(capture.text) for capture in found['score']))
+    authority_score = _first_number(found['score'])
+    if authority_score is None:
+        authority_score = labelled_numbers(html, AUTHORITY_SCORE_LABEL, 1)[0]
+    if authority_score is None:
+        return None
+    return {
+        'da': authority_score,
+        'pa': max(0, authority_score - 5),
+        'spam_score': max(0, 14 - int(authority_score / 7)),
+    }
+
+
+EXTRACTORS: Dict[str, Callable[[str], Optional[Metrics]]] = {
+    'websiteseochecker': extract_websiteseochecker,
+    'seositecheckup': extract_seositecheckup,
+    'smallseotools': extract_smallseotools,
+    'semrush': extract_semrush,
+}
@@ -0,0 +1,230 @@
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Sequence
+
+import free_metrics
+import generate_metrics
+import link_graph
+import mock_metrics
+import real_metrics
+from near_duplicates import load_clusters
+from persistence import flush_json, write_json
+from site_records import MetricsTable
+
+Metrics = Dict
+
+
+class Provider:
+    """A source of domain metrics, tried in tier order (lowest first) until one answers.
+
+    Calls are limited to `concurrency` at once and spaced `delay` seconds apart,
+    however many engine workers are asking.
+    """
+
+    def __init__(self, name: str, tier: int, fetch: Callable[[str], Optional[Metrics]],
+                 requires: Sequence[str] = (), concurrency: int = 2, delay: float = 1.0, cache: bool = True):
+        self.name = name
+        self.tier = tier
+        self.fetch = fetch
+        self.requires = tuple(requires)
+        self.delay = delay
+        self.cache = cache
+        self.slots = threading.BoundedSemaphore(concurrency)
+        self.lock = threading.Lock()
+        self.next_allowed = 0.0
+        self.calls = 0
+        self.hits = 0
+
+    def available(self) -> bool:
+        """True if the environment variables the provider needs are set"""
+        return all(os.getenv(var) for var in self.requires)
+
+    def _wait_turn(self):
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_allowed)
+            self.next_allowed = start + self.delay
+        if start > now:
+            time.sleep(start - now)
+
+    def lookup(self, domain: str) -> Optional[Metrics]:
+        with self.slots:
+            self._wait_turn()
+            self.calls += 1
+            try:
+                metrics = self.fetch(domain)
+            except Exception as e:
+                print(f"Error with {self.name} for {domain}: {e}")
+                return None
+        # Same acceptance rule as free_metrics: an all-zero answer means "no data"
+        if not metrics or not (metrics.get('da') or metrics.get('pa')):
+            return None
+        self.hits += 1
+        metrics = free_metrics.validate_metrics(dict(metrics))
+        metrics['source'] = self.name
+        return metrics
+
+
+# Registered metrics providers, by name
+PROVIDERS: Dict[str, Provider] = {}
+
+
+def register_provider(name: str, tier: int, requires: Sequence[str] = (), concurrency: int = 2,
+                      delay: float = 1.0, cache: bool = True):
+    """Register a function taking a domain and returning {'da', 'pa', 'spam_score'} or None"""
+    def decorator(fetch: Callable[[str], Optional[Metrics]]):
+        PROVIDERS[name] = Provider(name, tier, fetch, requires, concurrency, delay, cache)
+        return fetch
+    return decorator
+
+
+# Tier 0: PageRank over the links the scraper recorded; local, so it goes before any paid call.
+# Scores change as the graph grows, so they are not cached
+register_provider('link_graph', 0, concurrency=8, delay=0, cache=False)(link_graph.link_graph_metrics)
+
+# Tier 1: paid APIs with real link data
+register_provider('dataforseo', 1, requires=('DATAFORSEO_LOGIN', 'DATAFORSEO_PASSWORD'))(real_metrics.get_dataforseo_metrics)
+
+# Tier 2: keyed or free metric APIs
+register_provider('webcheck', 2)(real_metrics.get_webcheck_metrics)
+register_provider('seodataapi', 2, requires=('SEODATAAPI_KEY',))(real_metrics.get_seodataapi_metrics)
+register_provider('domcop', 2, requires=('DOMCOP_API_KEY',))(real_metrics.get_domcop_api_metrics)
+
+# Tier 3: free web tools, scraped; slower and more fragile
+register_provider('websiteseochecker', 3, delay=2.0)(free_metrics.get_websiteseochecker_metrics)
+register_provider('smallseotools', 3, delay=2.0)(free_metrics.get_smallseotools_metrics)
+register_provider('linkgraph', 3, delay=2.0)(free_metrics.get_linkgraph_metrics)
+register_provider('seositecheckup', 3, delay=2.0)(free_metrics.get_seositecheckup_metrics)
+register_provider('semrush', 3, delay=2.0)(free_metrics.get_semrush_metrics)
+
+# Tier 9: offline generators. They reseed the global random module, so one call at a time,
+# and they are cheap and deterministic, so not worth caching
+register_provider('generated', 9, concurrency=1, delay=0, cache=False)(free_metrics.generate_consistent_metrics)
+register_provider('mock_realistic', 9, concurrency=1, delay=0, cache=False)(mock_metrics.generate_realistic_metrics)
+
+
+@register_provider('simulated', 9, concurrency=1, delay=0, cache=False)
+def simulated_metrics(domain: str) -> Optional[Metrics]:
+    # generate_metrics works from a URL; the domain is the netloc it would parse out
+    return generate_metrics.generate_consistent_metrics(f"https://{domain}")
+
+
+class MetricsEngine:
+    """One load-compute-write pass over a metrics file with a chain of providers.
+
+    Each distinct domain is looked up once: first in the shared cache, then
+    through the providers in tier order until one answers. Lookups run on a
+    thread pool; each provider enforces its own concurrency and spacing.
+    """
+
+    def __init__(self, providers: List[Provider], cache_path: Optional[str] = 'metrics_cache.json', workers: int = 8,
+                 clusters: Optional[Dict[str, str]] = None):
+        # sorted() is stable, so providers in the same tier keep their given order
+        self.providers = sorted(providers, key=lambda provider: provider.tier)
+        self.cache_path = cache_path
+        self.cache: Dict[str, Metrics] = self._load_cache()
+        self.cache_hits = 0
+        self.workers = workers
+        # Duplicate domain -> representative (see near_duplicates); only representatives are looked up
+        self.clusters = load_clusters() if clusters is None else clusters
+
+    def _load_cache(self) -> Dict[str, Metrics]:
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return {}
+        try:
+            with open(self.cache_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save_cache(self):
+        if self.cache_path:
+            write_json(self.cache_path, dict(self.cache))
+
+    def lookup(self, domain: str) -> Optional[Metrics]:
+        cached = self.cache.get(domain)
+        if cached is not None:
+            self.cache_hits += 1
+            return cached
+        for provider in self.providers:
+            metrics = provider.lookup(domain)
+            if metrics:
+                if provider.cache:
+                    self.cache[domain] = metrics
+                return metrics
+        return None
+
+    def run(self, input_path: str, output_path: str, limit: Optional[int] = None) -> Dict[str, int]:
+        """Look up every domain in input_path and write the updated file to output_path"""
+        # Held as columns rather than nested dicts while the lookups run
+        table = MetricsTable.load(input_path)
+        domains = list(dict.fromkeys(table.domain(row) for row in range(len(table))
+                                     if table.url(row) and table.domain(row)))
+        if limit:
+            domains = domains[:limit]
+        representatives = list(dict.fromkeys(self.clusters.get(domain, domain) for domain in domains))
+        print(f"Looking up {len(representatives)} domains with: {', '.join(p.name for p in self.providers)}")
+        if len(representatives) < len(domains):
+            print(f"({len(domains) - len(representatives)} duplicate domains share their representative's metrics)")
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            found = dict(zip(representatives, pool.map(self.lookup, representatives)))
+        results = {domain: found[self.clusters.get(domain, domain)] for domain in domains}
+
+        by_source: Dict[str, int] = {}
+        for metrics in results.values():
+            source = metrics.get('source', 'unknown') if metrics else 'none'
+            by_source[source] = by_source.get(source, 0) + 1
+        for row in range(len(table)):
+            metrics = results.get(table.domain(row))
+            if metrics:
+                table.set_metrics(row, metrics)
+
+        write_json(output_path, table.to_json())
+        self.save_cache()
+        return by_source
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fetch domain metrics through a chain of providers in one pass')
+    parser.add_argument('--providers', default=None,
+                        help='Comma-separated provider names (default: every available online provider)')
+    parser.add_argument('--input', default='sources_with_metrics.json')
+    parser.add_argument('--output', default='sources_with_real_metrics.json')
+    parser.add_argument('--workers', type=int, default=8, help='Domains looked up at once')
+    parser.add_argument('--limit', type=int, help='Limit the number of domains to process (for testing)')
+    parser.add_argument('--cache', default='metrics_cache.json', help='Shared metrics cache file')
+    parser.add_argument('--no-cache', action='store_true', help='Ignore and do not update the cache')
+    parser.add_argument('--list', action='store_true', help='List providers and exit')
+    args = parser.parse_args()
+
+    if args.list:
+        for provider in sorted(PROVIDERS.values(), key=lambda p: p.tier):
+            status = 'available' if provider.available() else f"needs {', '.join(provider.requires)}"
+            print(f"tier {provider.tier}  {provider.name:<18} {status}")
+        return
+
+    if args.providers:
+        unknown = [name for name in args.providers.split(',') if name not in PROVIDERS]
+        if unknown:
+            parser.error(f"unknown providers: {', '.join(unknown)} (see --list)")
+        providers = [PROVIDERS[name] for name in args.providers.split(',')]
+    else:
+        providers = [p for p in PROVIDERS.values() if p.tier < 9 and p.available()]
+
+    engine = MetricsEngine(providers, cache_path=None if args.no_cache else args.cache, workers=args.workers)
+    by_source = engine.run(args.input, args.output, limit=args.limit)
+    flush_json()
+
+    print(f"\nDone! Results saved to {args.output}")
+    print(f"Cache hits: {engine.cache_hits}")
+    for source, count in sorted(by_source.items()):
+        print(f"- {source}: {count} domains")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,6 +6,8 @@ import time
 from urllib.parse import urlparse
 import re
 import argparse
+from site_rules import domain_keyword_scores
+from persistence import flush_json, write_json
 
 def generate_realistic_metrics(domain):
     """
@@ -86,19 +88,10 @@ def generate_realistic_metrics(domain):
     age_hash = int(domain_hash[:8], 16) % 100
     age_factor = 0.5 + (age_hash / 100)
     
-    # Check if the domain contains common words that might indicate quality
-    quality_words = ['news', 'official', 'university', 'gov', 'edu', 'academic', 'journal', 'research', 'institute']
-    quality_bonus = 0
-    for word in quality_words:
-        if word in domain:
-            quality_bonus += 0.1
-    
-    # Check if the domain contains spammy words
-    spam_words = ['free', 'casino', 'porn', 'sex', 'buy', 'cheap', 'discount', 'pills', 'win', 'prize', 'loan']
-    spam_penalty = 0
-    for word in spam_words:
-        if word in domain:
-            spam_penalty += 0.15
+    # Words that might indicate quality or spam (see site_rules.json)
+    keyword_scores = domain_keyword_scores().score(domain)
+    quality_bonus = keyword_scores['quality']
+    spam_penalty = keyword_scores['spam']
     
     # Calculate base DA score
     base_score = random.randint(20, 60)  # Random starting point
@@ -183,8 +176,8 @@ def create_mock_metrics_file(limit=None):
                 break
         
         # Save the updated data
-        with open('sources_with_real_metrics.json', 'w') as f:
-            json.dump(data, f, indent=4)
+        write_json('sources_with_real_metrics.json', data)
+        flush_json()
         
         print(f"\nDone! Generated realistic metrics for {processed_domains} domains.")
         print(f"Results saved to sources_with_real_metrics.json")
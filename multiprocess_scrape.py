@@ -0,0 +1,146 @@
+import asyncio
+import multiprocessing
+import queue as queue_module
+from typing import Callable, Dict, List, Optional, Tuple
+
+from distributed import HashRing, host_of
+from persistence import flush_json
+
+# Results are streamed back to the parent after every batch
+BATCH_SIZE = 50
+# Batches a worker keeps in flight beyond what fills its fetch slots, so one slow
+# URL holding up a batch never leaves the slots idle
+SPARE_BATCHES = 2
+
+# SourceManager caches filled in by the workers and saved by the parent
+SHARED_CACHES = ('robots', 'dns')
+
+
+def shard_by_host(pairs: List[Tuple[str, str]], shard_count: int) -> List[List[Tuple[int, str, str]]]:
+    """Split (category, url) pairs into shards so each host lives in exactly one shard"""
+    ring = HashRing(list(range(shard_count)))
+    shards: List[List[Tuple[int, str, str]]] = [[] for _ in range(shard_count)]
+    for seq, (category, url) in enumerate(pairs):
+        shards[ring.node_for(host_of(url))].append((seq, category, url))
+    return shards
+
+
+def _worker_main(index: int, shard: List[Tuple[int, str, str]], results: multiprocessing.Queue, options: Dict):
+    """Entry point of a worker process: its own event loop, session and scheduler"""
+    # Imported here so the parent module can import this one without a cycle
+    import aiohttp
+    from backlink_finder import BacklinkFinder, apply_scrape_options
+
+    finder = BacklinkFinder()
+    apply_scrape_options(finder, options)
+
+    async def run():
+        async with finder.source_manager.session() as session:
+            semaphore = asyncio.Semaphore(finder.source_manager.max_concurrent)
+
+            async def scrape_batch(batch):
+                sites = await finder.scrape_urls(session, [(category, url) for _, category, url in batch], semaphore)
+                results.put(('batch', [(seq, site) for (seq, _, _), site in zip(batch, sites)]))
+
+            batches = [shard[start:start + BATCH_SIZE] for start in range(0, len(shard), BATCH_SIZE)]
+            window = -(-finder.source_manager.max_concurrent // BATCH_SIZE) + SPARE_BATCHES
+            in_flight = set()
+            for batch in batches:
+                if len(in_flight) >= window:
+                    done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        task.result()
+                in_flight.add(asyncio.ensure_future(scrape_batch(batch)))
+            if in_flight:
+                for task in (await asyncio.wait(in_flight))[0]:
+                    task.result()
+        if finder.source_manager.parse_stage:
+            await finder.source_manager.parse_stage.close()
+        if finder.source_manager.link_graph:
+            finder.source_manager.link_graph.save()
+        if finder.source_manager.transport:
+            await finder.source_manager.transport.close()
+        # Every worker would rewrite the same cache files, so the parent merges and saves them
+        caches = {name: getattr(finder.source_manager, name).entries
+                  for name in SHARED_CACHES if getattr(finder.source_manager, name) is not None}
+        results.put(('caches', caches))
+        scheduler = finder.source_manager.retry_scheduler
+        results.put(('retries', (scheduler.run_retries, scheduler.stats, scheduler.given_up)))
+
+    try:
+        asyncio.run(run())
+        # Children leave through os._exit, which skips the atexit flush of queued writes
+        flush_json()
+    finally:
+        results.put(('done', index))
+
+
+def scrape_in_processes(pairs: List[Tuple[str, str]], processes: int, options: Dict,
+                        on_progress: Optional[Callable[[int], None]] = None,
+                        source_manager=None) -> List[Dict]:
+    """Scrape pairs across worker processes and merge the found sites in input order.
+
+    Robots and DNS entries the workers fetched are merged into source_manager's
+    caches (shards never share a host, so the entries never conflict), and
+    their retry counts into its retry scheduler. options['retry_budget'] is
+    split between the workers so the run as a whole stays within it.
+    """
+    results = multiprocessing.Queue()
+    workers = []
+    found: Dict[int, Dict] = {}
+    try:
+        shards = [shard for shard in shard_by_host(pairs, processes) if shard]
+        # --retry-budget covers the whole run, so each worker gets its share (the first ones take the remainder)
+        share, extra = divmod(options['retry_budget'], len(shards) or 1)
+        for shard in shards:
+            worker_options = dict(options, retry_budget=share + (len(workers) < extra))
+            # Not daemonic: a worker may start its own parser processes (--parse-executor process)
+            worker = multiprocessing.Process(target=_worker_main, args=(len(workers), shard, results, worker_options))
+            worker.start()
+            workers.append(worker)
+
+        finished = set()
+        # Workers seen dead without a 'done'; their last messages may still be in the pipe
+        dead = set()
+        while len(finished) < len(workers):
+            try:
+                kind, payload = results.get(timeout=5)
+            except queue_module.Empty:
+                # A worker that crashed never sends 'done'. Only one already dead before this
+                # wait came up empty is given up on, as everything it sent has been read by now
+                finished |= dead
+                dead = {i for i, worker in enumerate(workers) if i not in finished and not worker.is_alive()}
+                continue
+            if kind == 'done':
+                finished.add(payload)
+                continue
+            if kind == 'caches':
+                for name, entries in payload.items():
+                    cache = getattr(source_manager, name, None)
+                    if cache is not None:
+                        cache.entries.update(entries)
+                        cache.dirty = True
+                continue
+            if kind == 'retries':
+                if source_manager is not None:
+                    scheduler = source_manager.retry_scheduler
+                    run_retries, stats, given_up = payload
+                    scheduler.run_retries += run_retries
+                    for totals, counts in ((scheduler.stats, stats), (scheduler.given_up, given_up)):
+                        for reason, count in counts.items():
+                            totals[reason] = totals.get(reason, 0) + count
+                continue
+            for seq, site in payload:
+                if site:
+                    found[seq] = site
+            if on_progress:
+                on_progress(len(payload))
+    except BaseException:
+        # Non-daemonic workers would outlive an interrupted parent, so stop them here
+        for worker in workers:
+            worker.terminate()
+        raise
+    finally:
+        for worker in workers:
+            worker.join()
+    return [found[seq] for seq in sorted(found)]
@@ -0,0 +1,194 @@
+import hashlib
+import json
+import os
+import re
+from collections import Counter
+from itertools import combinations
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from bs4 import BeautifulSoup
+from bs4.element import NavigableString
+
+from persistence import write_json
+from site_records import netloc
+
+CLUSTERS_FILE = 'page_clusters.json'
+
+SHINGLE_WORDS = 4
+HASH_BITS = 64
+# Pages whose SimHashes differ in at most this many bits are near-duplicates. One
+# changed word in a 400-word page moves about 3 bits; unrelated pages sit 18 or more apart
+MAX_DISTANCE = 5
+# Pages with less text than this (script-rendered apps, error stubs) are never clustered
+MIN_WORDS = 10
+
+# Text under these tags is not page content
+INVISIBLE_TAGS = {'script', 'style', 'noscript', 'template', 'head'}
+
+WORD = re.compile(r'\w+')
+
+Fingerprint = Tuple[int, str]
+
+
+def page_text(soup: BeautifulSoup) -> str:
+    """Visible text of a parsed page"""
+    parts = []
+    for text in soup.find_all(string=True):
+        # Subclasses are comments, doctypes, CDATA and script or style bodies
+        if type(text) is not NavigableString or text.parent is None or text.parent.name in INVISIBLE_TAGS:
+            continue
+        parts.append(text)
+    return ' '.join(parts)
+
+
+def _hash64(data: str) -> int:
+    return int.from_bytes(hashlib.blake2b(data.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def simhash(shingles: Iterable[str]) -> int:
+    """64-bit SimHash of a set of shingles: bit i is set if most shingle hashes have bit i set"""
+    hashes = [_hash64(shingle) for shingle in set(shingles)]
+    if not hashes:
+        return 0
+    # Counting byte values first keeps the per-bit work to 8 x 256 instead of 64 per shingle
+    votes = [0] * HASH_BITS
+    for position in range(HASH_BITS // 8):
+        shift = position * 8
+        for value, count in Counter((h >> shift) & 0xFF for h in hashes).items():
+            for bit in range(8):
+                if value >> bit & 1:
+                    votes[shift + bit] += count
+    half = len(hashes) / 2
+    return sum(1 << bit for bit, vote in enumerate(votes) if vote > half)
+
+
+def fingerprint(text: str) -> Optional[Fingerprint]:
+    """(SimHash over word shingles, exact hash of the normalized text), or None for near-empty pages"""
+    words = WORD.findall(text.lower())
+    if len(words) < MIN_WORDS:
+        return None
+    exact = hashlib.blake2b(' '.join(words).encode('utf-8'), digest_size=16).hexdigest()
+    return simhash(' '.join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)), exact
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count('1')
+
+
+class NearDuplicateIndex:
+    """Groups pages into clusters of exact and near-duplicates as they are added.
+
+    Exact duplicates are found by the content hash. For near-duplicates the
+    SimHash is cut into max_distance + 2 blocks; two hashes within max_distance
+    bits of each other agree exactly on at least two blocks. Every pair of
+    blocks is a key into its own table, so a page is only compared with the
+    few representatives that share one, instead of with every page. The first
+    page of a cluster is its representative.
+    """
+
+    def __init__(self, max_distance: int = MAX_DISTANCE):
+        self.max_distance = max_distance
+        # Block widths covering all 64 bits, e.g. 10, 9, 9, 9, 9, 9, 9
+        blocks = max_distance + 2
+        self.block_bits = [HASH_BITS // blocks + (block < HASH_BITS % blocks) for block in range(blocks)]
+        self.pairs = list(combinations(range(blocks), 2))
+        self.exact: Dict[str, str] = {}
+        # Representatives' SimHashes and keys, by node number
+        self.values: List[int] = []
+        self.keys: List[str] = []
+        # Block-pair key -> node, or list of nodes when several share it; most keys
+        # have one node, and skipping a list for those keeps the tables small
+        self.tables: List[Dict[int, Union[int, List[int]]]] = [{} for _ in self.pairs]
+        self.representative: Dict[str, str] = {}
+
+    def _table_keys(self, value: int) -> List[int]:
+        blocks = []
+        for bits in self.block_bits:
+            blocks.append(value & ((1 << bits) - 1))
+            value >>= bits
+        return [blocks[i] << 32 | blocks[j] for i, j in self.pairs]
+
+    def find(self, value: int, exact: str) -> Optional[str]:
+        """Representative of the cluster a page with this fingerprint belongs to, if any"""
+        match = self.exact.get(exact)
+        if match is not None:
+            return match
+        for table, table_key in zip(self.tables, self._table_keys(value)):
+            entry = table.get(table_key)
+            if entry is None:
+                continue
+            for node in entry if isinstance(entry, list) else (entry,):
+                if hamming(value, self.values[node]) <= self.max_distance:
+                    return self.keys[node]
+        return None
+
+    def add(self, key: str, value: int, exact: str) -> Optional[str]:
+        """Add a page; returns the representative it duplicates, or None if it starts a new cluster"""
+        match = self.find(value, exact)
+        self.representative[key] = match or key
+        if match is None:
+            self.exact[exact] = key
+            node = len(self.values)
+            self.values.append(value)
+            self.keys.append(key)
+            for table, table_key in zip(self.tables, self._table_keys(value)):
+                entry = table.get(table_key)
+                if entry is None:
+                    table[table_key] = node
+                elif isinstance(entry, list):
+                    entry.append(node)
+                else:
+                    table[table_key] = [entry, node]
+        return match
+
+    def clusters(self) -> Dict[str, List[str]]:
+        """Representative -> members, for clusters with more than one page"""
+        groups: Dict[str, List[str]] = {}
+        for key, representative in self.representative.items():
+            if key != representative:
+                groups.setdefault(representative, []).append(key)
+        return groups
+
+
+def load_clusters(path: str = CLUSTERS_FILE) -> Dict[str, str]:
+    """Domain -> the domain it duplicates, as saved by cluster_sites"""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def cluster_sites(sites: List[Dict], path: Optional[str] = CLUSTERS_FILE) -> Tuple[List[Dict], Dict[str, str]]:
+    """Keep one site per cluster of duplicate pages and record the rest in path.
+
+    Sites carry the 'fingerprint' from parse_page; it is dropped from the kept
+    ones. Returns (kept sites, {duplicate domain: representative domain}).
+    """
+    index = NearDuplicateIndex()
+    kept = []
+    duplicates: Dict[str, str] = {}
+    for site in sites:
+        site = dict(site)
+        fingerprint = site.pop('fingerprint', None)
+        if fingerprint is None:
+            kept.append(site)
+            continue
+        representative = index.add(site['url'], *fingerprint)
+        if representative is None:
+            kept.append(site)
+            continue
+        domain, target = netloc(site['url']), netloc(representative)
+        if domain != target:
+            duplicates[domain] = target
+    if path:
+        clusters = load_clusters(path)
+        # This run's view replaces older entries for the domains it saw
+        for site in kept:
+            clusters.pop(netloc(site['url']), None)
+        clusters.update(duplicates)
+        if clusters:
+            write_json(path, clusters, indent=2)
+    return kept, duplicates
@@ -0,0 +1,151 @@
+import asyncio
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+from bs4 import BeautifulSoup
+
+from link_graph import link_domain
+from near_duplicates import fingerprint, page_text
+
+# rel values that tell search engines not to pass authority through the link
+UNFOLLOWED_RELS = {'nofollow', 'ugc', 'sponsored'}
+
+
+def link_is_dofollow(soup: BeautifulSoup, link: str) -> bool:
+    """Check if a link on the page is dofollow"""
+    link_tag = soup.find('a', href=link)
+    if not link_tag:
+        return False
+    return 'nofollow' not in link_tag.get('rel', [])
+
+
+def outbound_domains(soup: BeautifulSoup, url: str) -> List[str]:
+    """Other domains the page passes authority to: absolute links without nofollow, ugc or sponsored"""
+    own = link_domain(urlsplit(url).hostname or '')
+    domains = set()
+    for tag in soup.find_all('a', href=True):
+        href = tag['href'].strip()
+        if not href.startswith(('http://', 'https://', '//')) or UNFOLLOWED_RELS.intersection(tag.get('rel', [])):
+            continue
+        try:
+            host = urlsplit(href).hostname
+        except ValueError:
+            continue
+        if host and '.' in host:
+            domains.add(link_domain(host))
+    domains.discard(own)
+    return sorted(domains)
+
+
+def parse_page(content: str, url: str) -> Dict:
+    """Parse a fetched page; runs inside the executor, so it must stay picklable and synchronous"""
+    soup = BeautifulSoup(content, 'html.parser')
+    title = soup.title.string if soup.title else url
+    return {
+        # Plain str so results cross process boundaries without dragging the tree along
+        'title': str(title) if title is not None else None,
+        'is_dofollow': link_is_dofollow(soup, url),
+        'links': outbound_domains(soup, url),
+        'fingerprint': fingerprint(page_text(soup)),
+    }
+
+
+class ParseStage:
+    """Parses fetched bodies on a thread or process pool, off the event loop.
+
+    Fetchers reserve a slot before downloading a page and give it back once the
+    page is parsed, so when parsing falls behind, fetching pauses instead of
+    piling up bodies in memory.
+    """
+
+    def __init__(self, workers: int = 2, queue_size: int = 32, executor: str = 'thread'):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.executor_kind = executor
+        self.executor: Optional[Executor] = None
+        self.queue: Optional[asyncio.Queue] = None
+        self.slots: Optional[asyncio.Semaphore] = None
+        self.consumers = []
+        self.started_at = None
+        self.stats = {
+            'parsed': 0,
+            'parse_busy': 0.0,
+            'backpressure_wait': 0.0,
+            'queue_depth_max': 0,
+            'queue_depth_total': 0,
+        }
+
+    def _start(self):
+        loop = asyncio.get_running_loop()
+        if self.executor_kind == 'process':
+            self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        else:
+            self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='parse')
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self.slots = asyncio.Semaphore(self.queue_size + self.workers)
+        self.consumers = [loop.create_task(self._consume()) for _ in range(self.workers)]
+        self.started_at = time.monotonic()
+
+    @asynccontextmanager
+    async def reserve(self):
+        """Hold a slot for one page from before its fetch until after its parse"""
+        if self.queue is None:
+            self._start()
+        waited = time.monotonic()
+        async with self.slots:
+            self.stats['backpressure_wait'] += time.monotonic() - waited
+            yield
+
+    async def parse(self, url: str, content: str) -> Dict:
+        """Queue a body for parsing and wait for the result"""
+        if self.queue is None:
+            self._start()
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((url, content, future))
+        depth = self.queue.qsize()
+        self.stats['queue_depth_total'] += depth
+        self.stats['queue_depth_max'] = max(self.stats['queue_depth_max'], depth)
+        return await future
+
+    async def _consume(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            url, content, future = await self.queue.get()
+            started = time.monotonic()
+            try:
+                page = await loop.run_in_executor(self.executor, parse_page, content, url)
+                if not future.done():
+                    future.set_result(page)
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            finally:
+                self.stats['parse_busy'] += time.monotonic() - started
+                self.stats['parsed'] += 1
+                self.queue.task_done()
+
+    def report(self, fetch_busy: float, fetch_slots: int) -> Dict:
+        """Queue depths and how busy each stage was, for sizing the two pools"""
+        elapsed = max(time.monotonic() - self.started_at, 1e-9) if self.started_at else 1e-9
+        parsed = max(self.stats['parsed'], 1)
+        return {
+            'parsed': self.stats['parsed'],
+            'queue_depth_avg': round(self.stats['queue_depth_total'] / parsed, 2),
+            'queue_depth_max': self.stats['queue_depth_max'],
+            'fetch_utilization': round(fetch_busy / (fetch_slots * elapsed), 3),
+            'parse_utilization': round(self.stats['parse_busy'] / (self.workers * elapsed), 3),
+            'backpressure_wait_s': round(self.stats['backpressure_wait'], 2),
+        }
+
+    async def close(self):
+        for consumer in self.consumers:
+            consumer.cancel()
+        await asyncio.gather(*self.consumers, return_exceptions=True)
+        self.consumers = []
+        if self.executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+        self.queue = None
@@ -0,0 +1,217 @@
+import atexit
+import json
+import os
+import signal
+import sys
+import tempfile
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# mkstemp creates 0600 files; written files should get the usual umask-based mode
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def dumps_json(data: Any, indent: Optional[int] = None) -> bytes:
+    """Serialise to UTF-8 JSON: compact (via orjson when installed) unless an indent is given"""
+    if indent is None:
+        if orjson is not None:
+            return orjson.dumps(data)
+        return json.dumps(data, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    return json.dumps(data, indent=indent).encode('utf-8')
+
+
+def atomic_write_bytes(path: str, payload: bytes):
+    """Write a file so readers see either the old contents or the new ones, never a torn file.
+
+    The data goes to a temp file in the same directory, is fsynced, and is then
+    renamed over the target.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix='.tmp', dir=directory)
+    try:
+        try:
+            mode = os.stat(path).st_mode & 0o777
+        except OSError:
+            mode = 0o666 & ~_UMASK
+        os.chmod(tmp_path, mode)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+    # Make the rename itself durable
+    try:
+        dir_fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+def atomic_write_json(path: str, data: Any, indent: Optional[int] = 4):
+    """Atomically write JSON on the calling thread"""
+    atomic_write_bytes(path, dumps_json(data, indent))
+
+
+class WriteBehindWriter:
+    """Coalesces JSON snapshots per path and writes them from a background thread.
+
+    submit() only records the latest data for a path and returns at once, so
+    callers (including the event loop) never wait on the disk. The writer
+    thread wakes every `interval` seconds, or as soon as `max_updates`
+    submissions are pending, serialises each dirty path once and writes it
+    atomically. Data is serialised on the writer thread, so hand over a
+    snapshot the caller will not mutate afterwards (a fresh list or a copy).
+    append() queues a line for a JSON-lines log instead; those are never
+    coalesced and are appended in submission order.
+    """
+
+    def __init__(self, interval: float = 1.0, max_updates: int = 50):
+        self.interval = interval
+        self.max_updates = max_updates
+        self.pending: Dict[str, Tuple[Any, Optional[int]]] = {}
+        self.appends: Dict[str, List[bytes]] = {}
+        self.updates = 0
+        self.writing = False
+        self.flush_requested = False
+        self.closed = False
+        self.error: Optional[BaseException] = None
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self._run, name='json-write-behind', daemon=True)
+        self.thread.start()
+
+    def submit(self, path: str, data: Any, indent: Optional[int] = None):
+        with self.condition:
+            if self.closed:
+                raise RuntimeError("write-behind writer is closed")
+            self.pending[path] = (data, indent)
+            self.updates += 1
+            if self.updates >= self.max_updates:
+                self.condition.notify_all()
+
+    def append(self, path: str, data: Any):
+        # Serialised here: log records are small and may be mutated by the caller
+        line = dumps_json(data) + b'\n'
+        with self.condition:
+            if self.closed:
+                raise RuntimeError("write-behind writer is closed")
+            self.appends.setdefault(path, []).append(line)
+            self.updates += 1
+            if self.updates >= self.max_updates:
+                self.condition.notify_all()
+
+    def _run(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(
+                    lambda: self.closed or self.flush_requested or self.updates >= self.max_updates,
+                    timeout=self.interval,
+                )
+                batch, self.pending = self.pending, {}
+                appends, self.appends = self.appends, {}
+                self.updates = 0
+                self.writing = True
+                stop = self.closed
+            self._write(batch, appends)
+            with self.condition:
+                self.writing = False
+                self.condition.notify_all()
+            if stop:
+                return
+
+    def _write(self, batch: Dict[str, Tuple[Any, Optional[int]]], appends: Dict[str, List[bytes]]):
+        for path, (data, indent) in batch.items():
+            try:
+                atomic_write_bytes(path, dumps_json(data, indent))
+            except Exception as e:
+                print(f"Error writing {path}: {e}", file=sys.stderr)
+                self.error = e
+        for path, lines in appends.items():
+            try:
+                with open(path, 'ab') as f:
+                    f.write(b''.join(lines))
+                    f.flush()
+                    os.fsync(f.fileno())
+            except Exception as e:
+                print(f"Error appending to {path}: {e}", file=sys.stderr)
+                self.error = e
+
+    def flush(self):
+        """Block until everything submitted so far is on disk; re-raises the last write error"""
+        with self.condition:
+            self.flush_requested = True
+            self.condition.notify_all()
+            self.condition.wait_for(lambda: not self.thread.is_alive()
+                                    or (not self.pending and not self.appends and not self.writing))
+            self.flush_requested = False
+            error, self.error = self.error, None
+        if error is not None:
+            raise error
+
+    def close(self):
+        """Write what is pending and stop the writer thread"""
+        with self.condition:
+            if self.closed:
+                return
+            self.closed = True
+            self.condition.notify_all()
+        self.thread.join()
+        # Anything submitted while the last batch was being written
+        if self.pending or self.appends:
+            self._write(self.pending, self.appends)
+            self.pending, self.appends = {}, {}
+
+
+_writer: Optional[WriteBehindWriter] = None
+_writer_lock = threading.Lock()
+
+
+def _exit_on_sigterm(signum, frame):
+    # SystemExit runs atexit handlers, so pending writes are flushed
+    sys.exit(128 + signum)
+
+
+def get_writer() -> WriteBehindWriter:
+    """The process-wide writer, flushed at interpreter exit.
+
+    Ctrl-C raises KeyboardInterrupt and SIGTERM is turned into SystemExit, so
+    both exit through atexit and flush pending writes.
+    """
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = WriteBehindWriter()
+            atexit.register(_writer.close)
+            if threading.current_thread() is threading.main_thread() \
+                    and signal.getsignal(signal.SIGTERM) == signal.SIG_DFL:
+                signal.signal(signal.SIGTERM, _exit_on_sigterm)
+        return _writer
+
+
+def write_json(path: str, data: Any, indent: Optional[int] = None):
+    """Queue data to be written to path in the background (compact unless indent is given)"""
+    get_writer().submit(path, data, indent)
+
+
+def append_json_line(path: str, data: Any):
+    """Queue data to be appended to the JSON-lines file at path in the background"""
+    get_writer().append(path, data)
+
+
+def flush_json():
+    """Wait for queued writes; scripts call this before reporting that files were saved"""
+    if _writer is not None:
+        _writer.flush()
@@ -0,0 +1,434 @@
+import argparse
+import base64
+import contextlib
+import gzip
+import hashlib
+import importlib
+import io
+import itertools
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+ARCHIVE_FILE = 'provider_fixtures.jsonl.gz'
+
+# Provider behind each host the metrics scripts call
+HOST_PROVIDERS = {
+    'www.websiteseochecker.com': 'websiteseochecker',
+    'smallseotools.com': 'smallseotools',
+    'linkgraph.io': 'linkgraph',
+    'seositecheckup.com': 'seositecheckup',
+    'www.semrush.com': 'semrush',
+    'api.webcheck.io': 'webcheck',
+    'api.seodataapi.com': 'seodataapi',
+    'api.domcop.com': 'domcop',
+    'api.dataforseo.com': 'dataforseo',
+}
+
+# Query parameters that carry credentials; never written to an archive
+SECRET_PARAMS = {'api_key', 'apikey', 'key', 'access_token'}
+
+
+def normalize_url(url: str) -> str:
+    """The URL without credential parameters, as fixtures are keyed"""
+    parts = urlsplit(url)
+    query = [(name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+             if name.lower() not in SECRET_PARAMS]
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query), ''))
+
+
+def provider_for(url: str) -> str:
+    return HOST_PROVIDERS.get(urlsplit(url).netloc, urlsplit(url).netloc)
+
+
+def body_text(body) -> str:
+    """A request body as stored in fixtures (latin-1, so any bytes round-trip)"""
+    if body is None:
+        return ''
+    if isinstance(body, bytes):
+        return body.decode('latin-1')
+    return body
+
+
+class FixtureArchive:
+    """Recorded request/response pairs, saved as gzipped JSON lines.
+
+    Responses are looked up by method, URL and body, then by method and URL
+    alone (for form pages fetched before every POST). Several responses for
+    the same key are served in turn.
+    """
+
+    def __init__(self, entries: Optional[List[Dict]] = None):
+        self.entries: List[Dict] = []
+        self.exact: Dict[Tuple[str, str, str], List[Dict]] = {}
+        self.by_url: Dict[Tuple[str, str], List[Dict]] = {}
+        self.turns: Dict[tuple, Iterator[Dict]] = {}
+        self.lock = threading.Lock()
+        for entry in entries or []:
+            self.add(entry)
+
+    def add(self, entry: Dict):
+        with self.lock:
+            self.entries.append(entry)
+            self.exact.setdefault((entry['method'], entry['url'], entry['body']), []).append(entry)
+            self.by_url.setdefault((entry['method'], entry['url']), []).append(entry)
+            self.turns.clear()
+
+    def record(self, request: requests.PreparedRequest, status: int, headers: Dict[str, str], content: bytes):
+        self.add({
+            'provider': provider_for(request.url),
+            'method': request.method,
+            'url': normalize_url(request.url),
+            'body': body_text(request.body),
+            'status': status,
+            'content_type': headers.get('Content-Type', ''),
+            'content': base64.b64encode(content).decode('ascii'),
+        })
+
+    def lookup(self, method: str, url: str, body: str) -> Optional[Dict]:
+        url = normalize_url(url)
+        for key, index in (((method, url, body), self.exact), ((method, url), self.by_url)):
+            entries = index.get(key)
+            if entries:
+                with self.lock:
+                    turn = self.turns.get(key)
+                    if turn is None:
+                        turn = self.turns[key] = itertools.cycle(entries)
+                    return next(turn)
+        return None
+
+    def save(self, path: str):
+        with gzip.open(path, 'wt', encoding='utf-8') as f:
+            for entry in self.entries:
+                f.write(json.dumps(entry, separators=(',', ':')) + '\n')
+
+    @classmethod
+    def load(cls, path: str) -> 'FixtureArchive':
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            return cls([json.loads(line) for line in f if line.strip()])
+
+
+@contextlib.contextmanager
+def intercept(handler: Callable[[Callable, HTTPAdapter, requests.PreparedRequest, dict], requests.Response]):
+    """Route every request made through `requests` to handler(send, adapter, request, kwargs)"""
+    original = HTTPAdapter.send
+
+    def send(adapter, request, **kwargs):
+        return handler(original, adapter, request, kwargs)
+
+    HTTPAdapter.send = send
+    try:
+        yield
+    finally:
+        HTTPAdapter.send = original
+
+
+def make_response(request: requests.PreparedRequest, status: int, content: bytes, content_type: str) -> requests.Response:
+    response = requests.Response()
+    response.status_code = status
+    response._content = content
+    response.headers = CaseInsensitiveDict({'Content-Type': content_type})
+    response.encoding = 'utf-8'
+    response.url = request.url
+    response.request = request
+    return response
+
+
+# Offline stand-ins for the providers, for recording an archive without network
+# access. Each domain gets a stable answer; some providers have no data for some
+# domains, so the scripts fall through their provider chains as they would live.
+
+def _domain_number(domain: str, salt: str) -> int:
+    return int(hashlib.md5(f"{salt}:{domain}".encode()).hexdigest()[:8], 16)
+
+
+def _request_domain(request: requests.PreparedRequest) -> str:
+    fields = dict(parse_qsl(urlsplit(request.url).query))
+    fields.update(parse_qsl(body_text(request.body)))
+    if 'domain' in fields or 'url' in fields:
+        return fields.get('domain') or fields['url']
+    return urlsplit(request.url).path.rstrip('/').rsplit('/', 1)[-1]
+
+
+def _page(body: str, size: int = 30000) -> bytes:
+    """body inside roughly size bytes of ordinary page markup"""
+    item = '<li><a href="/category/{0}">Category {0}</a></li>'
+    paragraph = '<p class="text">Check the authority of any website with our free tool. Result {0} of many.</p>'
+    chrome = []
+    length = 0
+    for i in itertools.count():
+        chunk = (item if i % 3 else paragraph).format(i)
+        chrome.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            break
+    half = len(chrome) // 2
+    return (f"<!DOCTYPE html><html><head><title>Checker</title></head><body><ul>{''.join(chrome[:half])}</ul>"
+            f"{body}<div>{''.join(chrome[half:])}</div></body></html>").encode()
+
+
+def synthetic_response(request: requests.PreparedRequest) -> Tuple[int, bytes, str]:
+    """(status, content, content type) a provider might plausibly return"""
+    provider = provider_for(request.url)
+    html = 'text/html; charset=utf-8'
+    if request.method == 'GET' and provider in ('websiteseochecker', 'smallseotools', 'linkgraph'):
+        return 200, _page('<form method="post"><input type="hidden" name="token" value="abc123">'
+                          '<input name="domain"></form>'), html
+    domain = _request_domain(request)
+    n = _domain_number(domain, provider)
+    da, pa, spam = 10 + n % 80, 5 + (n >> 8) % 80, (n >> 16) % 15
+    has_data = (n >> 24) % 10
+    if provider == 'websiteseochecker':
+        if has_data < 4:
+            return 200, _page('<p>No data found for this domain</p>'), html
+        return 200, _page(f'<table class="result-table"><tr><td>Domain Authority</td><td>{da}</td></tr>'
+                          f'<tr><td>Page Authority</td><td>{pa}</td></tr>'
+                          f'<tr><td>Spam Score</td><td>{spam}%</td></tr></table>'), html
+    if provider == 'smallseotools':
+        if has_data < 5:
+            return 200, _page('<div class="error">Please try again later</div>'), html
+        return 200, _page(f'<div class="resultBox"><div class="da-score">{da}</div>'
+                          f'<div class="pa-score">{pa}</div></div>'), html
+    if provider == 'linkgraph':
+        payload = {'success': True, 'data': {'da': da, 'pa': pa}} if has_data >= 5 else {'success': False}
+        return 200, json.dumps(payload).encode(), 'application/json'
+    if provider == 'seositecheckup':
+        if has_data < 5:
+            return 200, _page('<h2>SEO audit</h2>'), html
+        return 200, _page(f'<div class="domain-authority">Domain Authority: {da}</div>'
+                          f'<div class="page-authority">Page Authority: {pa}</div>'), html
+    if provider == 'semrush':
+        return 200, _page(f'<div class="authority-score">{da}</div>'), html
+    if provider == 'webcheck':
+        if has_data < 3:
+            return 404, b'{"error": "domain not found"}', 'application/json'
+        payload = {'domain_authority': da, 'page_authority': pa, 'spam_factors': ['x'] * (spam // 2)}
+        return 200, json.dumps(payload).encode(), 'application/json'
+    return 404, b'not found', 'text/plain'
+
+
+def record(module_name: str, archive: FixtureArchive, limit: int, input_path: str, synthetic: bool,
+           verbose: bool = False):
+    """Run a metrics script's fetch_and_update_metrics and capture every request it makes"""
+    module = importlib.import_module(module_name)
+
+    def capture(send, adapter, request, kwargs):
+        if synthetic:
+            status, content, content_type = synthetic_response(request)
+            response = make_response(request, status, content, content_type)
+        else:
+            response = send(adapter, request, **kwargs)
+        archive.record(request, response.status_code, response.headers, response.content)
+        return response
+
+    # Live providers keep the script's own delay between domains
+    options = {'delay': 0} if synthetic else {}
+    with tempfile.TemporaryDirectory() as tmp, intercept(capture), \
+            contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO()):
+        module.fetch_and_update_metrics(limit=limit, input_path=input_path,
+                                        output_path=os.path.join(tmp, 'out.json'), **options)
+
+
+class ReplayServer:
+    """Serves an archive over local HTTP with configurable latency, failures and rate limiting.
+
+    Requests arrive as /<scheme>/<host>/<path> (see redirect()). Failures are
+    503s drawn from a seeded generator; over the rate limit the server answers
+    429 with Retry-After. Unknown requests get 404.
+
+    Each provider has its own token bucket of rate_limit requests per second,
+    as each real API limits callers separately. A request is admitted or
+    refused on arrival, like at an API gateway, and the latency is then added
+    to every response, 429s and 503s included.
+    """
+
+    def __init__(self, archive: FixtureArchive, latency: float = 0.0, jitter: float = 0.0,
+                 failure_rate: float = 0.0, rate_limit: float = 0.0, seed: int = 0):
+        self.archive = archive
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.rate_limit = rate_limit
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        # provider -> (tokens, time of the last refill)
+        self.buckets: Dict[str, Tuple[float, float]] = {}
+        # (provider, status) -> responses sent
+        self.stats: Dict[Tuple[str, int], int] = {}
+        self.httpd: Optional[ThreadingHTTPServer] = None
+
+    def _admit(self, provider: str) -> Tuple[bool, float]:
+        """(allowed by the provider's rate limit, random draw for failures)"""
+        with self.lock:
+            draw = self.random.random()
+            if not self.rate_limit:
+                return True, draw
+            now = time.monotonic()
+            tokens, refilled = self.buckets.get(provider, (self.rate_limit, now))
+            tokens = min(self.rate_limit, tokens + (now - refilled) * self.rate_limit)
+            allowed = tokens >= 1
+            self.buckets[provider] = (tokens - 1 if allowed else tokens, now)
+            return allowed, draw
+
+    def respond(self, method: str, path: str, body: str) -> Tuple[int, bytes, str, str]:
+        """(status, content, content type, provider) for a request to the server"""
+        scheme, _, rest = path.lstrip('/').partition('/')
+        url = f"{scheme}://{rest}"
+        provider = provider_for(url)
+        allowed, draw = self._admit(provider)
+        with self.lock:
+            delay = self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay:
+            time.sleep(delay)
+        if not allowed:
+            return 429, b'rate limited', 'text/plain', provider
+        if draw < self.failure_rate:
+            return 503, b'service unavailable', 'text/plain', provider
+        entry = self.archive.lookup(method, url, body)
+        if entry is None:
+            return 404, b'no fixture', 'text/plain', provider
+        return entry['status'], base64.b64decode(entry['content']), entry['content_type'], provider
+
+    def start(self, port: int = 0) -> str:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _handle(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length).decode('latin-1') if length else ''
+                status, content, content_type, provider = server.respond(self.command, self.path, body)
+                with server.lock:
+                    server.stats[(provider, status)] = server.stats.get((provider, status), 0) + 1
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(content)))
+                if status == 429:
+                    self.send_header('Retry-After', '1')
+                self.end_headers()
+                self.wfile.write(content)
+
+            do_GET = do_POST = do_PUT = do_DELETE = _handle
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self.httpd.daemon_threads = True
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def stop(self):
+        if self.httpd:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+
+
+@contextlib.contextmanager
+def redirect(base_url: str):
+    """Send every `requests` call to a replay server instead of the real host"""
+    def forward(send, adapter, request, kwargs):
+        parts = urlsplit(request.url)
+        request = request.copy()
+        request.url = f"{base_url}/{parts.scheme}/{parts.netloc}{parts.path}" + (f"?{parts.query}" if parts.query else '')
+        return send(adapter, request, **kwargs)
+
+    with intercept(forward):
+        yield
+
+
+def count_domains(input_path: str, limit: Optional[int]) -> int:
+    """Distinct domains the scripts look up for a --limit, in file order"""
+    with open(input_path) as f:
+        data = json.load(f)
+    domains = dict.fromkeys(item['domain'] for items in data.values() for item in items
+                            if item.get('url') and item.get('domain'))
+    return min(len(domains), limit) if limit else len(domains)
+
+
+def bench(module_name: str, server: ReplayServer, limit: Optional[int], input_path: str, verbose: bool) -> Dict:
+    module = importlib.import_module(module_name)
+    base_url = server.start()
+    try:
+        with tempfile.TemporaryDirectory() as tmp, redirect(base_url):
+            start = time.perf_counter()
+            with contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO()):
+                module.fetch_and_update_metrics(limit=limit, input_path=input_path,
+                                                output_path=os.path.join(tmp, 'out.json'), delay=0)
+            seconds = time.perf_counter() - start
+    finally:
+        server.stop()
+    domains = count_domains(input_path, limit)
+    calls = sum(server.stats.values())
+    return {'domains': domains, 'seconds': seconds, 'calls': calls,
+            'domains_per_s': domains / seconds if seconds else 0.0,
+            'calls_per_domain': calls / domains if domains else 0.0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Record metrics provider traffic and replay it locally for benchmarks')
+    parser.add_argument('--archive', default=ARCHIVE_FILE, help='Compressed fixture archive')
+    parser.add_argument('--module', default='free_metrics', choices=['free_metrics', 'real_metrics'])
+    parser.add_argument('--input', default='sources_with_metrics.json')
+    parser.add_argument('--limit', type=int, default=50, help='Domains to run through the script')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    record_parser = sub.add_parser('record', help='Run the script against the providers and save what they return')
+    record_parser.add_argument('--synthetic', action='store_true',
+                               help='Answer with generated provider responses instead of going online')
+    record_parser.add_argument('--verbose', action='store_true', help="Show the script's own output")
+
+    for name, help_text in (('serve', 'Serve the archive until interrupted'),
+                            ('bench', 'Run the script against the replay server and report throughput')):
+        command = sub.add_parser(name, help=help_text)
+        command.add_argument('--latency', type=float, default=0.05, help='Seconds added to every response')
+        command.add_argument('--jitter', type=float, default=0.0, help='Extra random latency, up to this many seconds')
+        command.add_argument('--failure-rate', type=float, default=0.0, help='Fraction of requests answered with 503')
+        command.add_argument('--rate-limit', type=float, default=0.0, help='Requests per second per provider before 429s (0: none)')
+        command.add_argument('--seed', type=int, default=0)
+        command.add_argument('--port', type=int, default=0)
+        command.add_argument('--verbose', action='store_true', help="Show the script's own output")
+    args = parser.parse_args()
+
+    if args.command == 'record':
+        archive = FixtureArchive()
+        record(args.module, archive, args.limit, args.input, args.synthetic, args.verbose)
+        archive.save(args.archive)
+        by_provider: Dict[str, int] = {}
+        for entry in archive.entries:
+            by_provider[entry['provider']] = by_provider.get(entry['provider'], 0) + 1
+        print(f"Recorded {len(archive.entries)} responses to {args.archive}: {by_provider}")
+        return
+
+    server = ReplayServer(FixtureArchive.load(args.archive), args.latency, args.jitter,
+                          args.failure_rate, args.rate_limit, args.seed)
+    if args.command == 'serve':
+        print(f"Replaying {len(server.archive.entries)} responses on {server.start(args.port)}/<scheme>/<host>/<path>")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            server.stop()
+        return
+
+    result = bench(args.module, server, args.limit, args.input, args.verbose)
+    print(f"{args.module}: {result['domains']} domains in {result['seconds']:.2f}s "
+          f"({result['domains_per_s']:.1f} domains/s), {result['calls']} calls "
+          f"({result['calls_per_domain']:.2f} per domain)")
+    for (provider, status), count in sorted(server.stats.items()):
+        print(f"- {provider:<20} {status}: {count}")
+
+
+if __name__ == "__main__":
+    main()
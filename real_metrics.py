@@ -6,6 +6,9 @@ import base64
 import argparse
 from urllib.parse import urlparse
 from dotenv import load_dotenv
+from persistence import flush_json, write_json
+from near_duplicates import load_clusters
+from refresh_planner import RefreshPlanner, parse_quotas
 
 # Load environment variables from .env file
 load_dotenv()
@@ -198,19 +201,67 @@ def get_dataforseo_metrics(domain):
         print(f"Exception fetching DataForSEO metrics for {domain}: {e}")
         return None
 
-def fetch_and_update_metrics(limit=None):
+# APIs in order of preference, with the environment variables each needs
+REAL_PROVIDERS = [
+    ('dataforseo', get_dataforseo_metrics, ('DATAFORSEO_LOGIN', 'DATAFORSEO_PASSWORD')),
+    ('webcheck', get_webcheck_metrics, ()),
+    ('seodataapi', get_seodataapi_metrics, ('SEODATAAPI_KEY',)),
+    ('domcop', get_domcop_api_metrics, ('DOMCOP_API_KEY',)),
+]
+
+def available_providers():
+    """Names of the APIs whose keys are configured"""
+    return [name for name, _, env in REAL_PROVIDERS if all(os.getenv(var) for var in env)]
+
+def fetch_domain_metrics(domain, quota=None):
+    """
+    Try each configured API in turn, skipping any whose daily quota is used up.
+    Returns (source, metrics), or (None, None) if none had data.
+    """
+    available = available_providers()
+    for name, fetch, _ in REAL_PROVIDERS:
+        if name not in available:
+            continue
+        if quota:
+            if not quota.allow(name):
+                continue
+            quota.spend(name)
+        metrics = fetch(domain)
+        if metrics:
+            return name, metrics
+    return None, None
+
+def fetch_and_update_metrics(limit=None, plan=False, quotas=None, input_path='sources_with_metrics.json',
+                             output_path='sources_with_real_metrics.json', delay=1):
     """
     Fetch real metrics for domains in sources_with_metrics.json
     and update with real data where possible
     
     Args:
         limit: Optional limit on how many domains to process (for testing)
+        plan: Refresh the most valuable stale domains first (see refresh_planner),
+            keeping earlier real metrics; limit is then the run's budget
+        quotas: Daily call limits per API, used with plan
+        input_path, output_path: Metrics file to start from and file to write
+        delay: Seconds to wait between domains
     """
     try:
         # Load existing data
-        with open('sources_with_metrics.json', 'r') as f:
+        with open(input_path, 'r') as f:
             data = json.load(f)
         
+        if plan:
+            planner = RefreshPlanner(quotas=quotas)
+            planner.carry_forward(data, output_path)
+            by_source = planner.refresh(data, fetch_domain_metrics, available_providers(), budget=limit, delay=delay)
+            write_json(output_path, data)
+            flush_json()
+            print(f"\nDone! Results saved to {output_path}")
+            print("\nLookups by source:")
+            for source, count in sorted(by_source.items()):
+                print(f"- {source}: {count} domains")
+            return True
+        
         total_domains = 0
         updated_domains = 0
         processed_domains = 0
@@ -218,6 +269,8 @@ def fetch_and_update_metrics(limit=None):
         # Create a dictionary to cache metrics for domains we've already checked
         # to avoid redundant API calls for the same domain
         domain_metrics_cache = {}
+        # Duplicate pages found while scraping share their representative's metrics
+        clusters = load_clusters()
         
         # Process each category
         for category, items in data.items():
@@ -227,7 +280,7 @@ def fetch_and_update_metrics(limit=None):
                 if not item.get('url') or not item.get('domain'):
                     continue
                 
-                domain = item['domain']
+                domain = clusters.get(item['domain'], item['domain'])
                 total_domains += 1
                 
                 # Skip if we've already processed this domain
@@ -247,23 +300,7 @@ def fetch_and_update_metrics(limit=None):
                 print(f"Fetching metrics for {domain}... ({i+1}/{len(items)})")
                 
                 # Try each API in order of preference
-                metrics = None
-                
-                # Try DataForSEO first if credentials are available
-                if os.getenv("DATAFORSEO_LOGIN") and os.getenv("DATAFORSEO_PASSWORD"):
-                    metrics = get_dataforseo_metrics(domain)
-                
-                # Try WebCheck if DataForSEO failed
-                if not metrics:
-                    metrics = get_webcheck_metrics(domain)
-                
-                # Try SEODataAPI if WebCheck failed
-                if not metrics and os.getenv("SEODATAAPI_KEY"):
-                    metrics = get_seodataapi_metrics(domain)
-                
-                # Try DomCop if all others failed
-                if not metrics and os.getenv("DOMCOP_API_KEY"):
-                    metrics = get_domcop_api_metrics(domain)
+                _, metrics = fetch_domain_metrics(domain)
                 
                 # If we got metrics, update the item
                 if metrics:
@@ -275,18 +312,18 @@ def fetch_and_update_metrics(limit=None):
                     print(f"× Failed to get metrics for {domain}, keeping simulated metrics")
                 
                 # Add a small delay to avoid hitting API rate limits
-                time.sleep(1)
+                time.sleep(delay)
             
             # Break out of the categories loop if we've hit the limit
             if limit and processed_domains >= limit:
                 break
         
         # Save the updated data
-        with open('sources_with_real_metrics.json', 'w') as f:
-            json.dump(data, f, indent=4)
+        write_json(output_path, data)
+        flush_json()
         
         print(f"\nDone! Updated {updated_domains} out of {processed_domains} domains processed.")
-        print(f"Results saved to sources_with_real_metrics.json")
+        print(f"Results saved to {output_path}")
         
         # Add a user-friendly message about the next steps
         print("\n=====================================================")
@@ -329,10 +366,14 @@ if __name__ == "__main__":
     # Set up command line arguments
     parser = argparse.ArgumentParser(description='Fetch real SEO metrics for domains')
     parser.add_argument('--limit', type=int, help='Limit the number of domains to process (for testing)')
+    parser.add_argument('--plan', action='store_true',
+                        help='Refresh the most valuable stale domains first; --limit is the day\'s budget')
+    parser.add_argument('--quota', action='append', default=[], metavar='NAME=CALLS',
+                        help='Daily call limit for an API, used with --plan (repeatable)')
     args = parser.parse_args()
     
     create_env_template()
     
     # Try to fetch metrics, even if we don't have API keys
     # We'll use WebCheck.io which doesn't require a key
-    fetch_and_update_metrics(limit=args.limit) 
\ No newline at end of file
+    fetch_and_update_metrics(limit=args.limit, plan=args.plan, quotas=parse_quotas(args.quota)) 
\ No newline at end of file
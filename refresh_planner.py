@@ -0,0 +1,250 @@
+import argparse
+import json
+import os
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from near_duplicates import load_clusters
+from persistence import write_json
+
+STATE_FILE = 'refresh_state.json'
+
+# How far a metric from each source can be trusted. Offline generators (and
+# metrics with no source, such as the simulated ones in sources_with_metrics.json)
+# are worth nothing, so their domains are always due for a real lookup
+SOURCE_QUALITY = {
+    'dataforseo': 1.0,
+    'seodataapi': 0.9,
+    'domcop': 0.9,
+    'webcheck': 0.8,
+    'websiteseochecker': 0.6,
+    'smallseotools': 0.6,
+    'linkgraph': 0.6,
+    'seositecheckup': 0.6,
+    'semrush': 0.6,
+    'link_graph': 0.5,
+}
+
+# Categories whose links are worth more to users; anything else weighs 1.0
+CATEGORY_WEIGHTS = {
+    'edu_domains': 1.3,
+    'news_sites': 1.2,
+    'blog_platforms': 1.1,
+    'social_bookmarking': 0.8,
+    'local_directories': 0.8,
+}
+
+# Calls per UTC day; conservative defaults for the keyed free tiers, override with --quota
+DEFAULT_QUOTAS = {
+    'dataforseo': 100,
+    'seodataapi': 100,
+    'domcop': 100,
+}
+
+Metrics = Dict
+FetchDomain = Callable[[str, 'QuotaTracker'], Tuple[Optional[str], Optional[Metrics]]]
+
+
+def today() -> str:
+    return time.strftime('%Y-%m-%d', time.gmtime())
+
+
+def parse_quotas(values: Iterable[str]) -> Dict[str, int]:
+    """Parse NAME=CALLS arguments into a quota dict on top of the defaults"""
+    quotas = dict(DEFAULT_QUOTAS)
+    for value in values:
+        name, _, calls = value.partition('=')
+        if not name or not calls.isdigit():
+            raise ValueError(f"expected NAME=CALLS, got {value!r}")
+        quotas[name] = int(calls)
+    return quotas
+
+
+def source_quality(metrics: Optional[Metrics]) -> float:
+    return SOURCE_QUALITY.get((metrics or {}).get('source'), 0.0)
+
+
+class QuotaTracker:
+    """Calls made today per provider, against a daily limit (no limit if a provider is not listed)"""
+
+    def __init__(self, limits: Dict[str, int], used: Optional[Dict[str, int]] = None, day: Optional[str] = None):
+        self.limits = limits
+        self.day = day or today()
+        self.used: Dict[str, int] = dict(used or {})
+        self._roll()
+
+    def _roll(self):
+        if self.day != today():
+            self.day = today()
+            self.used = {}
+
+    def remaining(self, provider: str) -> Optional[int]:
+        self._roll()
+        if provider not in self.limits:
+            return None
+        return max(0, self.limits[provider] - self.used.get(provider, 0))
+
+    def allow(self, provider: str) -> bool:
+        return self.remaining(provider) != 0
+
+    def spend(self, provider: str, calls: int = 1):
+        self._roll()
+        self.used[provider] = self.used.get(provider, 0) + calls
+
+    def exhausted(self, providers: Sequence[str]) -> bool:
+        return not any(self.allow(provider) for provider in providers)
+
+    def to_json(self) -> Dict:
+        return {'day': self.day, 'used': self.used}
+
+
+class RefreshPlanner:
+    """Decides which domains to refresh first when API calls are limited.
+
+    A domain's priority is its value (current DA, spam score and category)
+    times how much it needs a refresh: metrics from a trusted source fetched
+    recently need little, while old, low-quality or generated metrics need a
+    full refresh. Domains looked up less than `min_age_days` ago are skipped.
+    Fetch times and today's quota use are kept in refresh_state.json.
+    """
+
+    def __init__(self, quotas: Optional[Dict[str, int]] = None, state_path: str = STATE_FILE,
+                 max_age_days: float = 30, min_age_days: float = 1, clusters: Optional[Dict[str, str]] = None):
+        self.state_path = state_path
+        # Duplicate domain -> representative (see near_duplicates); duplicates ride on their representative
+        self.clusters = load_clusters() if clusters is None else clusters
+        self.max_age = max_age_days * 86400
+        self.min_age = min_age_days * 86400
+        state = self._load_state()
+        # domain -> [unix time of the last lookup, source that answered or None]
+        self.fetched: Dict[str, List] = state.get('fetched', {})
+        quota = state.get('quota', {})
+        self.quota = QuotaTracker(DEFAULT_QUOTAS if quotas is None else quotas, quota.get('used'), quota.get('day'))
+
+    def _load_state(self) -> Dict:
+        if not os.path.exists(self.state_path):
+            return {}
+        try:
+            with open(self.state_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save(self):
+        write_json(self.state_path, {'fetched': dict(self.fetched), 'quota': self.quota.to_json()})
+
+    def age(self, domain: str, now: float) -> Optional[float]:
+        entry = self.fetched.get(domain)
+        return None if entry is None else now - entry[0]
+
+    def priority(self, domain: str, metrics: Optional[Metrics], category: str, now: float) -> float:
+        age = self.age(domain, now)
+        if age is not None and age < self.min_age:
+            return 0.0
+        metrics = metrics or {}
+        value = CATEGORY_WEIGHTS.get(category, 1.0)
+        value *= 0.25 + 0.75 * min(metrics.get('da', 0), 100) / 100
+        value *= 1 - min(metrics.get('spam_score', 0), 14) / 28
+        freshness = 0.0 if age is None else max(0.0, 1 - age / self.max_age)
+        return value * (1 - source_quality(metrics) * freshness)
+
+    def plan(self, data: Dict[str, List[Dict]], budget: Optional[int] = None) -> List[Tuple[str, float]]:
+        """Domains worth refreshing, most valuable first, as (domain, priority)"""
+        now = time.time()
+        best: Dict[str, float] = {}
+        for category, items in data.items():
+            for item in items:
+                domain = item.get('domain')
+                if not item.get('url') or not domain:
+                    continue
+                domain = self.clusters.get(domain, domain)
+                score = self.priority(domain, item.get('metrics'), category, now)
+                if score > best.get(domain, 0.0):
+                    best[domain] = score
+        ranked = sorted(best.items(), key=lambda pair: pair[1], reverse=True)
+        return ranked[:budget] if budget else ranked
+
+    @staticmethod
+    def carry_forward(data: Dict[str, List[Dict]], previous_path: str) -> int:
+        """Copy real metrics from an earlier output file over the simulated ones; returns domains copied"""
+        if not os.path.exists(previous_path):
+            return 0
+        try:
+            with open(previous_path) as f:
+                previous = json.load(f)
+        except (OSError, ValueError):
+            return 0
+        real = {item['domain']: item['metrics'] for items in previous.values() for item in items
+                if item.get('domain') and source_quality(item.get('metrics')) > 0}
+        for items in data.values():
+            for item in items:
+                if item.get('domain') in real:
+                    item['metrics'] = real[item['domain']]
+        return len(real)
+
+    def refresh(self, data: Dict[str, List[Dict]], fetch_domain: FetchDomain, providers: Sequence[str],
+                budget: Optional[int] = None, delay: float = 0.0) -> Dict[str, int]:
+        """Look up planned domains until the budget or every provider's quota runs out.
+
+        fetch_domain(domain, quota) tries the providers it is allowed to and
+        returns (source, metrics) or (None, None). Found metrics replace those
+        of every entry for the domain. Returns lookups by source.
+        """
+        by_source: Dict[str, int] = {}
+        planned = self.plan(data, budget)
+        print(f"Planned {len(planned)} domains for refresh")
+        results: Dict[str, Metrics] = {}
+        for done, (domain, score) in enumerate(planned):
+            if self.quota.exhausted(providers):
+                print(f"Daily quota used up for {', '.join(providers)}; stopping after {done} domains")
+                break
+            print(f"Fetching metrics for {domain} (priority {score:.3f})... ({done + 1}/{len(planned)})")
+            source, metrics = fetch_domain(domain, self.quota)
+            self.fetched[domain] = [time.time(), source]
+            if metrics:
+                metrics = dict(metrics)
+                metrics.setdefault('source', source)
+                results[domain] = metrics
+                print(f"✓ Updated metrics for {domain}: DA={metrics['da']}, PA={metrics['pa']}, Spam={metrics['spam_score']} (Source: {source})")
+            else:
+                print(f"× Failed to get metrics for {domain}, keeping existing metrics")
+            by_source[source or 'none'] = by_source.get(source or 'none', 0) + 1
+            if delay:
+                time.sleep(delay)
+
+        for items in data.values():
+            for item in items:
+                domain = self.clusters.get(item.get('domain'), item.get('domain'))
+                if domain in results:
+                    item['metrics'] = results[domain]
+        self.save()
+        return by_source
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Show which domains the next metrics refresh would look up')
+    parser.add_argument('--input', default='sources_with_metrics.json')
+    parser.add_argument('--previous', default='sources_with_real_metrics.json',
+                        help='Earlier output whose real metrics are kept')
+    parser.add_argument('--limit', type=int, default=20, help='Number of domains to show')
+    parser.add_argument('--quota', action='append', default=[], metavar='NAME=CALLS',
+                        help='Daily call limit for a provider (repeatable)')
+    args = parser.parse_args()
+
+    planner = RefreshPlanner(quotas=parse_quotas(args.quota))
+    with open(args.input) as f:
+        data = json.load(f)
+    planner.carry_forward(data, args.previous)
+
+    now = time.time()
+    for domain, score in planner.plan(data, args.limit):
+        age = planner.age(domain, now)
+        age_text = 'never' if age is None else f"{age / 86400:.1f}d ago"
+        print(f"{score:.3f}  {domain:<40} last fetched {age_text}")
+    print("\nQuota left today:")
+    for provider in sorted(planner.quota.limits):
+        print(f"- {provider}: {planner.quota.remaining(provider)}/{planner.quota.limits[provider]}")
+
+
+if __name__ == "__main__":
+    main()
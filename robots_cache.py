@@ -0,0 +1,185 @@
+import asyncio
+import gzip
+import io
+import json
+import os
+import time
+import xml.etree.ElementTree as ET
+from typing import Dict, List, Optional, Tuple
+from urllib.robotparser import RobotFileParser
+
+import aiohttp
+
+from persistence import write_json
+from streaming_fetch import read_limited
+from url_record import url_record
+
+USER_AGENT = '*'
+
+# Cap on a single sitemap document after decompression (the sitemap protocol limit)
+MAX_SITEMAP_BYTES = 50 * 1024 * 1024
+
+# robots.txt beyond this is ignored (Google reads the first 500 KiB)
+MAX_ROBOTS_BYTES = 512 * 1024
+
+
+class RobotsCache:
+    """Per-host robots.txt rules, fetched once per host and persisted between runs.
+
+    Missing or unreadable robots.txt files allow everything, as crawlers
+    conventionally do; those entries are kept for a shorter time so a
+    temporary outage does not stick.
+    """
+
+    def __init__(self, path: str = 'robots_cache.json', ttl: float = 24 * 3600, error_ttl: float = 3600):
+        self.path = path
+        self.ttl = ttl
+        self.error_ttl = error_ttl
+        self.entries: Dict[str, Dict] = self._load()
+        self.parsers: Dict[str, RobotFileParser] = {}
+        self.pending: Dict[str, asyncio.Future] = {}
+        self.dirty = False
+
+    def _load(self) -> Dict[str, Dict]:
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save(self):
+        if self.dirty:
+            write_json(self.path, dict(self.entries))
+            self.dirty = False
+
+    @staticmethod
+    def origin(url: str) -> str:
+        return url_record(url).origin
+
+    def _fresh(self, origin: str) -> bool:
+        entry = self.entries.get(origin)
+        if not entry:
+            return False
+        ttl = self.ttl if entry['status'] < 500 else self.error_ttl
+        return time.time() - entry['fetched'] < ttl
+
+    async def ensure(self, session: aiohttp.ClientSession, url: str):
+        """Make sure the rules for url's host are loaded, fetching robots.txt at most once"""
+        origin = self.origin(url)
+        if self._fresh(origin):
+            return
+        if origin in self.pending:
+            await self.pending[origin]
+            return
+        future = asyncio.get_running_loop().create_future()
+        self.pending[origin] = future
+        try:
+            status, body = await self._fetch(session, f"{origin}/robots.txt")
+            self.entries[origin] = {'fetched': time.time(), 'status': status, 'body': body}
+            self.parsers.pop(origin, None)
+            self.dirty = True
+        finally:
+            del self.pending[origin]
+            future.set_result(None)
+
+    async def _fetch(self, session: aiohttp.ClientSession, robots_url: str) -> Tuple[int, str]:
+        try:
+            async with session.get(robots_url, timeout=aiohttp.ClientTimeout(total=10)) as response:
+                if response.status == 200:
+                    # content.read(n) returns only what is buffered, so read chunks up to the cap
+                    body = await read_limited(response.content.iter_chunked(64 * 1024), MAX_ROBOTS_BYTES)
+                    return 200, body.decode('utf-8', 'replace')
+                return response.status, ''
+        except Exception:
+            # Network errors are treated like a server error: allow, and check again sooner
+            return 599, ''
+
+    def _parser(self, origin: str) -> Optional[RobotFileParser]:
+        if origin not in self.parsers:
+            entry = self.entries.get(origin)
+            if not entry or entry['status'] != 200:
+                return None
+            parser = RobotFileParser()
+            parser.parse(entry['body'].splitlines())
+            self.parsers[origin] = parser
+        return self.parsers[origin]
+
+    def can_fetch(self, url: str) -> bool:
+        parser = self._parser(self.origin(url))
+        return parser is None or parser.can_fetch(USER_AGENT, url)
+
+    def crawl_delay(self, url: str) -> Optional[float]:
+        parser = self._parser(self.origin(url))
+        if parser is None:
+            return None
+        delay = parser.crawl_delay(USER_AGENT)
+        if delay is None:
+            rate = parser.request_rate(USER_AGENT)
+            if rate:
+                return rate.seconds / max(rate.requests, 1)
+            return None
+        return float(delay)
+
+    def sitemaps(self, url: str) -> List[str]:
+        parser = self._parser(self.origin(url))
+        return list(parser.site_maps() or []) if parser else []
+
+
+class HostRateLimiter:
+    """Spaces out requests to the same host; waiting happens before a concurrency slot is taken"""
+
+    def __init__(self):
+        self.next_allowed: Dict[str, float] = {}
+
+    async def wait(self, url: str, delay: float):
+        host = url_record(url).host
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        start = max(now, self.next_allowed.get(host, 0.0))
+        self.next_allowed[host] = start + delay
+        if start > now:
+            await asyncio.sleep(start - now)
+
+
+def parse_sitemap(content: bytes) -> Tuple[List[str], List[str]]:
+    """Return (page URLs, child sitemap URLs) from a sitemap or sitemap index, gzipped or not"""
+    if content[:2] == b'\x1f\x8b':
+        # Read through the stream so a decompression bomb stops at the cap
+        with gzip.GzipFile(fileobj=io.BytesIO(content)) as f:
+            content = f.read(MAX_SITEMAP_BYTES)
+    try:
+        root = ET.fromstring(content)
+    except ET.ParseError:
+        return [], []
+    # Ignore the namespace so slightly non-conforming sitemaps still parse
+    locs = [element.text.strip() for element in root.iter() if element.tag.endswith('loc') and element.text]
+    if root.tag.endswith('sitemapindex'):
+        return [], locs
+    return locs, []
+
+
+async def fetch_sitemap_urls(session: aiohttp.ClientSession, sitemap_url: str, max_urls: int = 10000,
+                             max_depth: int = 2) -> List[str]:
+    """Collect page URLs from a sitemap, following sitemap indexes up to max_depth levels"""
+    urls: List[str] = []
+    queue = [(sitemap_url, 0)]
+    visited = set()
+    while queue and len(urls) < max_urls:
+        current, depth = queue.pop(0)
+        if current in visited:
+            continue
+        visited.add(current)
+        try:
+            async with session.get(current, timeout=aiohttp.ClientTimeout(total=30)) as response:
+                if response.status != 200:
+                    continue
+                content = await read_limited(response.content.iter_chunked(64 * 1024), MAX_SITEMAP_BYTES)
+        except Exception:
+            continue
+        pages, children = parse_sitemap(content)
+        urls.extend(pages[:max_urls - len(urls)])
+        if depth < max_depth:
+            queue.extend((child, depth + 1) for child in children)
+    return urls
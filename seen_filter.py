@@ -0,0 +1,127 @@
+import hashlib
+import math
+import mmap
+import os
+import struct
+from typing import Iterable, Optional, Union
+
+# Inputs smaller than this are deduped with a plain set: exact, and small enough not to matter
+EXACT_THRESHOLD = 100_000
+
+HEADER = struct.Struct('<8sQIQ')  # magic, bit count, hash count, items added
+MAGIC = b'BLOOMv1\0'
+
+
+class ExactSet:
+    """Exact "have we seen this" set with the same interface as BloomFilter"""
+
+    def __init__(self, items: Iterable[str] = ()):
+        self.items = set(items)
+
+    def add(self, item: str) -> bool:
+        """Add an item; True if it was not there before"""
+        if item in self.items:
+            return False
+        self.items.add(item)
+        return True
+
+    def __contains__(self, item: str) -> bool:
+        return item in self.items
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class BloomFilter:
+    """Bloom filter over strings, in a bytearray or a memory-mapped file.
+
+    Sized for `capacity` items at `fp_rate` false positives; at 0.1% that is
+    about 1.8 bytes per item. A file-backed filter keeps its parameters in a
+    small header and is reopened as-is on the next run.
+    """
+
+    def __init__(self, capacity: int = 1_000_000, fp_rate: float = 0.001, path: Optional[str] = None):
+        self.path = path
+        self.file = None
+        self.mmap = None
+        if path and os.path.exists(path) and os.path.getsize(path) >= HEADER.size:
+            self._open(path)
+            return
+
+        capacity = max(capacity, 1)
+        self.num_bits = max(8, int(math.ceil(-capacity * math.log(fp_rate) / (math.log(2) ** 2))))
+        self.num_hashes = max(1, int(round(self.num_bits / capacity * math.log(2))))
+        self.count = 0
+        size = (self.num_bits + 7) // 8
+        if path:
+            with open(path, 'wb') as f:
+                f.write(HEADER.pack(MAGIC, self.num_bits, self.num_hashes, 0))
+                f.truncate(HEADER.size + size)
+            self._open(path)
+        else:
+            self.bits = bytearray(size)
+
+    def _open(self, path: str):
+        self.file = open(path, 'r+b')
+        self.mmap = mmap.mmap(self.file.fileno(), 0)
+        magic, self.num_bits, self.num_hashes, self.count = HEADER.unpack_from(self.mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a Bloom filter file")
+        # Bit offsets are applied after the header
+        self.bits = memoryview(self.mmap)[HEADER.size:]
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1, h2 = struct.unpack('<QQ', digest)
+        # Double hashing (Kirsch-Mitzenmacher) derives k positions from two hashes
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, item: str) -> bool:
+        """Add an item; True if it was (probably) not there before"""
+        bits = self.bits
+        new = False
+        for position in self._positions(item):
+            byte, mask = position >> 3, 1 << (position & 7)
+            if not bits[byte] & mask:
+                bits[byte] |= mask
+                new = True
+        if new:
+            self.count += 1
+        return new
+
+    def __contains__(self, item: str) -> bool:
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+    def __len__(self) -> int:
+        return self.count
+
+    def flush(self):
+        if self.mmap is not None:
+            HEADER.pack_into(self.mmap, 0, MAGIC, self.num_bits, self.num_hashes, self.count)
+            self.mmap.flush()
+
+    def close(self):
+        if self.mmap is not None:
+            self.flush()
+            self.bits.release()
+            self.mmap.close()
+            self.file.close()
+            self.mmap = None
+
+
+def make_seen_set(expected: int, fp_rate: float = 0.001, path: Optional[str] = None,
+                  items: Iterable[str] = ()) -> Union[ExactSet, BloomFilter]:
+    """Pick an exact set for small inputs and a Bloom filter for large or persistent ones"""
+    if path is None and expected < EXACT_THRESHOLD:
+        return ExactSet(items)
+    seen = BloomFilter(expected, fp_rate, path)
+    for item in items:
+        seen.add(item)
+    return seen
@@ -2,9 +2,16 @@ import subprocess
 import sys
 import os
 
-def install_dependencies():
+def optional_requirements():
+    """Packages listed in requirements-optional.txt, for the features that can use them"""
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'requirements-optional.txt')
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith('#')]
+
+def install_dependencies(optional=False):
     """
-    Install all required dependencies for the backlink finder tools
+    Install all required dependencies for the backlink finder tools,
+    and with optional the extras from requirements-optional.txt
     """
     print("Installing required dependencies...\n")
     
@@ -23,6 +30,8 @@ def install_dependencies():
         "beautifulsoup4>=4.9.0",
         "tqdm>=4.66.2"
     ]
+    if optional:
+        requirements += optional_requirements()
     
     # Install each package
     for package in requirements:
@@ -69,4 +78,4 @@ DOMCOP_API_KEY=your_key_here
     return True
 
 if __name__ == "__main__":
-    install_dependencies() 
\ No newline at end of file
+    install_dependencies(optional='--optional' in sys.argv[1:]) 
\ No newline at end of file
@@ -0,0 +1,305 @@
+import json
+import sys
+from array import array
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional
+from urllib.parse import urlsplit
+
+SITE_KEYS = ('site_name', 'url', 'niche', 'type', 'description')
+METRIC_KEYS = ('da', 'pa', 'spam_score')
+
+# Stored in a metric column when the entry has no metrics at all
+NO_METRIC = 255
+
+
+def netloc(url: str) -> str:
+    # urlsplit rather than url_record: rows are decoded by the million and need no site type
+    return urlsplit(url).netloc
+
+
+def derived_description(niche: str, url: str) -> str:
+    """Description scrape_urls gives every site it finds"""
+    return f"{niche} site with dofollow links - {netloc(url)}"
+
+
+@dataclass
+class SiteRecord:
+    """One backlink opportunity; description is derived unless the entry set its own"""
+
+    __slots__ = ('site_name', 'url', 'niche', 'type', 'description_override')
+
+    site_name: str
+    url: str
+    niche: str
+    type: str
+    description_override: Optional[str]
+
+    @property
+    def description(self) -> str:
+        if self.description_override is not None:
+            return self.description_override
+        return derived_description(self.niche, self.url)
+
+    @classmethod
+    def from_dict(cls, site: Dict) -> 'SiteRecord':
+        description = site['description']
+        if description == derived_description(site['niche'], site['url']):
+            description = None
+        return cls(site['site_name'], site['url'], site['niche'], site['type'], description)
+
+    def to_dict(self) -> Dict:
+        return {
+            'site_name': self.site_name,
+            'url': self.url,
+            'niche': self.niche,
+            'type': self.type,
+            'description': self.description,
+        }
+
+
+class CodeColumn:
+    """Column of a few distinct strings, stored as one-byte codes (two bytes past 256 values)"""
+
+    def __init__(self):
+        self.values: List[str] = []
+        self.index: Dict[str, int] = {}
+        self.codes = array('B')
+
+    def _code(self, value: str) -> int:
+        code = self.index.get(value)
+        if code is None:
+            code = self.index[value] = len(self.values)
+            self.values.append(sys.intern(value))
+            if code == 256:
+                self.codes = array('H', self.codes)
+        return code
+
+    def append(self, value: str):
+        self.codes.append(self._code(value))
+
+    def set(self, row: int, value: str):
+        self.codes[row] = self._code(value)
+
+    def __getitem__(self, row: int) -> str:
+        return self.values[self.codes[row]]
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+
+class StringColumn:
+    """Column of arbitrary strings packed into one UTF-8 buffer with an offset array.
+
+    About 8 bytes of overhead per string instead of roughly 60 for a str in a list.
+    """
+
+    def __init__(self):
+        self.data = bytearray()
+        self.offsets = array('Q', [0])
+
+    def append(self, value: str):
+        self.data += value.encode('utf-8', 'surrogatepass')
+        self.offsets.append(len(self.data))
+
+    def __getitem__(self, row: int) -> str:
+        return self.data[self.offsets[row]:self.offsets[row + 1]].decode('utf-8', 'surrogatepass')
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+
+class SiteTable:
+    """Columnar store for backlink_sites.json.
+
+    Niche and type are code columns, names and URLs are packed string
+    columns, and only descriptions that differ from the derived one are kept.
+    Entries that do not have exactly the usual five keys are kept verbatim,
+    so loading and saving a file reproduces it exactly.
+    """
+
+    def __init__(self):
+        self.site_names = StringColumn()
+        self.urls = StringColumn()
+        self.niches = CodeColumn()
+        self.types = CodeColumn()
+        self.descriptions: Dict[int, str] = {}
+        self.irregular: Dict[int, Dict] = {}
+
+    def append(self, site: Dict):
+        row = len(self)
+        if tuple(site) != SITE_KEYS or not all(isinstance(site[key], str) for key in SITE_KEYS):
+            self.irregular[row] = site
+            site = dict.fromkeys(SITE_KEYS, '')
+        else:
+            record = SiteRecord.from_dict(site)
+            if record.description_override is not None:
+                self.descriptions[row] = record.description_override
+        self.site_names.append(site['site_name'])
+        self.urls.append(site['url'])
+        self.niches.append(site['niche'])
+        self.types.append(site['type'])
+
+    def extend(self, sites):
+        for site in sites:
+            self.append(site)
+
+    def __len__(self) -> int:
+        return len(self.urls)
+
+    def __bool__(self) -> bool:
+        return len(self) > 0
+
+    def record(self, row: int) -> SiteRecord:
+        if row in self.irregular:
+            site = self.irregular[row]
+            return SiteRecord(*(str(site.get(key) or '') for key in SITE_KEYS))
+        return SiteRecord(self.site_names[row], self.urls[row], self.niches[row], self.types[row],
+                          self.descriptions.get(row))
+
+    def row_dict(self, row: int) -> Dict:
+        if row in self.irregular:
+            return self.irregular[row]
+        return self.record(row).to_dict()
+
+    def __iter__(self) -> Iterator[SiteRecord]:
+        for row in range(len(self)):
+            yield self.record(row)
+
+    def rows_in_niche(self, niche: str) -> List[int]:
+        """Rows whose niche matches, case-insensitively, comparing codes rather than strings"""
+        niche = niche.lower()
+        wanted = {code for code, value in enumerate(self.niches.values) if value.lower() == niche}
+        rows = [row for row, code in enumerate(self.niches.codes) if code in wanted and row not in self.irregular]
+        rows += [row for row in self.irregular if self.record(row).niche.lower() == niche]
+        return sorted(rows)
+
+    def to_json(self) -> List[Dict]:
+        return [self.row_dict(row) for row in range(len(self))]
+
+    @classmethod
+    def from_json(cls, sites: List[Dict]) -> 'SiteTable':
+        table = cls()
+        table.extend(sites)
+        return table
+
+    @classmethod
+    def load(cls, path: str) -> 'SiteTable':
+        with open(path) as f:
+            return cls.from_json(json.load(f))
+
+
+class MetricsTable:
+    """Columnar store for sources_with_metrics.json ({category: [{url, domain, metrics}]}).
+
+    DA, PA and spam score live in array('B') columns, the domain is derived
+    from the URL unless it differs, and the metrics source (if any) is a code
+    column. Entries of any other shape are kept verbatim for an exact round trip.
+    """
+
+    def __init__(self):
+        self.categories: List[str] = []
+        self.category = CodeColumn()
+        self.urls = StringColumn()
+        self.domains: Dict[int, str] = {}
+        self.metrics = {key: array('B') for key in METRIC_KEYS}
+        self.source = CodeColumn()
+        self.irregular: Dict[int, Dict] = {}
+
+    def __len__(self) -> int:
+        return len(self.urls)
+
+    @staticmethod
+    def _columnar_metrics(metrics) -> bool:
+        if metrics is None:
+            return True
+        if not isinstance(metrics, dict):
+            return False
+        keys = tuple(metrics)
+        if keys not in (METRIC_KEYS, METRIC_KEYS + ('source',)):
+            return False
+        if len(keys) == 4 and not (isinstance(metrics['source'], str) and metrics['source']):
+            return False
+        return all(type(metrics[key]) is int and 0 <= metrics[key] < NO_METRIC for key in METRIC_KEYS)
+
+    @classmethod
+    def _columnar(cls, entry: Dict) -> bool:
+        if tuple(entry) != ('url', 'domain', 'metrics') or not isinstance(entry['url'], str):
+            return False
+        if not isinstance(entry['domain'], str):
+            return False
+        return cls._columnar_metrics(entry['metrics'])
+
+    def _store_metrics(self, row: int, metrics: Optional[Dict]):
+        for key in METRIC_KEYS:
+            self.metrics[key][row] = NO_METRIC if metrics is None else metrics[key]
+        # An empty code means "no source key" (empty sources are stored verbatim)
+        self.source.set(row, (metrics or {}).get('source', ''))
+
+    def append(self, category: str, entry: Dict):
+        if category not in self.categories:
+            self.categories.append(category)
+        row = len(self)
+        self.category.append(category)
+        if not self._columnar(entry):
+            self.irregular[row] = entry
+            entry = {'url': '', 'domain': '', 'metrics': None}
+        self.urls.append(entry['url'])
+        if entry['domain'] != netloc(entry['url']):
+            self.domains[row] = entry['domain']
+        for key in METRIC_KEYS:
+            self.metrics[key].append(NO_METRIC)
+        self.source.append('')
+        self._store_metrics(row, entry['metrics'])
+
+    def url(self, row: int):
+        if row in self.irregular:
+            return self.irregular[row].get('url')
+        return self.urls[row]
+
+    def domain(self, row: int):
+        if row in self.irregular:
+            return self.irregular[row].get('domain')
+        return self.domains.get(row, netloc(self.urls[row]))
+
+    def set_metrics(self, row: int, metrics: Optional[Dict]):
+        """Replace a row's metrics; metrics the columns cannot hold make the row verbatim"""
+        if row not in self.irregular and self._columnar_metrics(metrics):
+            self._store_metrics(row, metrics)
+            return
+        entry = dict(self.row_dict(row))
+        entry['metrics'] = metrics
+        self.irregular[row] = entry
+
+    def row_dict(self, row: int) -> Dict:
+        if row in self.irregular:
+            return self.irregular[row]
+        url = self.urls[row]
+        if self.metrics['da'][row] == NO_METRIC:
+            metrics = None
+        else:
+            metrics = {key: self.metrics[key][row] for key in METRIC_KEYS}
+            source = self.source[row]
+            if source:
+                metrics['source'] = source
+        return {'url': url, 'domain': self.domains.get(row, netloc(url)), 'metrics': metrics}
+
+    def to_json(self) -> Dict[str, List[Dict]]:
+        data: Dict[str, List[Dict]] = {category: [] for category in self.categories}
+        for row in range(len(self)):
+            data[self.category[row]].append(self.row_dict(row))
+        return data
+
+    @classmethod
+    def from_json(cls, data: Dict[str, List[Dict]]) -> 'MetricsTable':
+        table = cls()
+        for category, entries in data.items():
+            if category not in table.categories:
+                table.categories.append(category)
+            for entry in entries:
+                table.append(category, entry)
+        return table
+
+    @classmethod
+    def load(cls, path: str) -> 'MetricsTable':
+        with open(path) as f:
+            return cls.from_json(json.load(f))
@@ -0,0 +1,158 @@
+import bisect
+import json
+import os
+import re
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, Iterator, List, Optional, Set, Tuple
+
+RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'site_rules.json')
+
+# Texts are joined with this for batch scans; keywords may not contain it, so no match spans two texts
+SEPARATOR = '\n'
+
+
+class KeywordMatcher:
+    """Finds every labelled keyword contained in a string, in one regex pass.
+
+    All keywords are compiled into a single trie-shaped pattern inside a
+    lookahead, so overlapping keywords are all found and the work per
+    character follows the trie, not the number of keywords. Each keyword ends
+    in an empty group; the last group closed at a position is the longest
+    keyword starting there, and the shorter keywords along its path (its
+    prefix closure) are precomputed per group.
+    """
+
+    def __init__(self, keywords: Dict[str, Iterable[str]]):
+        self.labels: Dict[str, Set[str]] = {}
+        for label, words in keywords.items():
+            for word in words:
+                word = word.lower()
+                if not word or SEPARATOR in word:
+                    raise ValueError(f"invalid keyword {word!r} for {label}")
+                self.labels.setdefault(word, set()).add(label)
+
+        trie: Dict = {}
+        for word in self.labels:
+            node = trie
+            for char in word:
+                node = node.setdefault(char, {})
+            node[''] = word
+
+        # Group 0 is the whole match, which carries no keyword
+        self.group_keywords: List[FrozenSet[str]] = [frozenset()]
+        pattern = self._compile(trie, ())
+        # Case-sensitive on purpose: IGNORECASE makes every scan about 3x slower, and domains are lowercased anyway
+        self.regex = re.compile(f"(?=(?:{pattern}))") if pattern else None
+
+    def _compile(self, node: Dict, path: tuple) -> str:
+        branches = []
+        for char in sorted(key for key in node if key):
+            child = node[char]
+            branch = re.escape(char)
+            words = path
+            if '' in child:
+                words = path + (child[''],)
+                self.group_keywords.append(frozenset(words))
+                branch += '()'
+            rest = self._compile(child, words)
+            if rest:
+                branch += f"(?:{rest})?" if '' in child else f"(?:{rest})"
+            branches.append(branch)
+        return '|'.join(branches)
+
+    def keywords(self, text: str) -> Set[str]:
+        """Distinct keywords contained in text, which should be lowercase like the keywords"""
+        found: Set[str] = set()
+        if self.regex is not None:
+            for match in self.regex.finditer(text):
+                found |= self.group_keywords[match.lastindex]
+        return found
+
+    def scan_many(self, texts: List[str]) -> Iterator[Tuple[int, int]]:
+        """(text index, group) for every match in texts, from a single scan over all of them"""
+        if self.regex is None or not texts:
+            return
+        starts = []
+        position = 0
+        for text in texts:
+            starts.append(position)
+            position += len(text) + len(SEPARATOR)
+        for match in self.regex.finditer(SEPARATOR.join(texts)):
+            yield bisect.bisect_right(starts, match.start()) - 1, match.lastindex
+
+    def keywords_many(self, texts: List[str]) -> List[Set[str]]:
+        """keywords() for many texts"""
+        found: List[Set[str]] = [set() for _ in texts]
+        for index, group in self.scan_many(texts):
+            found[index] |= self.group_keywords[group]
+        return found
+
+    def labels_for(self, keywords: Iterable[str]) -> Set[str]:
+        return {label for keyword in keywords for label in self.labels[keyword]}
+
+    def counts(self, keywords: Iterable[str]) -> Dict[str, int]:
+        """Number of distinct matched keywords per label"""
+        counts: Dict[str, int] = {}
+        for keyword in keywords:
+            for label in self.labels[keyword]:
+                counts[label] = counts.get(label, 0) + 1
+        return counts
+
+
+class SiteTypeRules:
+    """Ordered site type rules: the first type with a matching keyword wins"""
+
+    def __init__(self, order: List[Dict], default: str):
+        self.order = [rule['type'] for rule in order]
+        self.default = default
+        self.matcher = KeywordMatcher({rule['type']: rule['keywords'] for rule in order})
+        # Best (lowest) rule position implied by each regex group, so a match costs one comparison
+        rank = {site_type: position for position, site_type in enumerate(self.order)}
+        self.group_rank = [min((rank[label] for label in self.matcher.labels_for(keywords)), default=len(self.order))
+                           for keywords in self.matcher.group_keywords]
+        self.types = self.order + [default]
+
+    def classify(self, domain: str) -> str:
+        return self.classify_many([domain])[0]
+
+    def classify_many(self, domains: List[str]) -> List[str]:
+        best = [len(self.order)] * len(domains)
+        group_rank = self.group_rank
+        for index, group in self.matcher.scan_many(domains):
+            if group_rank[group] < best[index]:
+                best[index] = group_rank[group]
+        return [self.types[position] for position in best]
+
+
+class KeywordScores:
+    """Weighted keyword signals for a domain: weight times the number of distinct keywords matched"""
+
+    def __init__(self, groups: Dict[str, Dict]):
+        self.weights = {name: group['weight'] for name, group in groups.items()}
+        self.matcher = KeywordMatcher({name: group['keywords'] for name, group in groups.items()})
+
+    def _score(self, keywords: Set[str]) -> Dict[str, float]:
+        counts = self.matcher.counts(keywords)
+        return {name: counts.get(name, 0) * weight for name, weight in self.weights.items()}
+
+    def score(self, domain: str) -> Dict[str, float]:
+        return self._score(self.matcher.keywords(domain))
+
+    def score_many(self, domains: List[str]) -> List[Dict[str, float]]:
+        return [self._score(keywords) for keywords in self.matcher.keywords_many(domains)]
+
+
+def load_rules(path: Optional[str] = None) -> Dict:
+    with open(path or RULES_PATH) as f:
+        return json.load(f)
+
+
+@lru_cache(maxsize=None)
+def site_type_rules() -> SiteTypeRules:
+    rules = load_rules()['site_types']
+    return SiteTypeRules(rules['order'], rules['default'])
+
+
+@lru_cache(maxsize=None)
+def domain_keyword_scores() -> KeywordScores:
+    return KeywordScores(load_rules()['domain_keywords'])
@@ -1,20 +1,91 @@
 import json
+import argparse
 import asyncio
 import aiohttp
 from bs4 import BeautifulSoup
-from typing import List, Dict
+from typing import Callable, List, Dict, Optional, Tuple
 from urllib.parse import urljoin, urlparse
 import pandas as pd
 from rich.console import Console
 from rich.progress import Progress
+from fetch_scheduler import FetchError, RetryScheduler, classify_exception, classify_status
+from source_store import SourceIndex
+from crawl_frontier import CrawlFrontier, classify_host
+from robots_cache import RobotsCache, fetch_sitemap_urls
+from persistence import flush_json
 
 console = Console()
 
+class Finder:
+    """A discovery source: pages to fetch, and how to pull candidate links out of them"""
+    
+    def __init__(self, name: str, category: str, pages: List[str], extract: Callable[[str], List[str]]):
+        self.name = name
+        self.category = category
+        self.pages = pages
+        self.extract = extract
+
+# Registered discovery sources, by name
+FINDERS: Dict[str, Finder] = {}
+
+def register_finder(name: str, category: str, pages: List[str]):
+    """Register a link extractor as a discovery source for a sources.json category.
+    
+    The extractor receives a page's HTML and returns candidate URLs. It runs in a
+    worker thread, so it must not touch the event loop.
+    """
+    def decorator(extract: Callable[[str], List[str]]):
+        FINDERS[name] = Finder(name, category, pages, extract)
+        return extract
+    return decorator
+
+def _page_links(content: str) -> List[str]:
+    soup = BeautifulSoup(content, 'html.parser')
+    return [link.get('href', '') for link in soup.find_all('a')]
+
+@register_finder('edu_domains', 'edu_domains', [
+    "https://en.wikipedia.org/wiki/List_of_state_universities_in_the_United_States",
+    "https://en.wikipedia.org/wiki/List_of_private_colleges_and_universities_in_the_United_States",
+    "https://en.wikipedia.org/wiki/List_of_land-grant_universities"
+])
+def extract_edu_links(content: str) -> List[str]:
+    """Find .edu domains in a page"""
+    edu_urls = []
+    for href in _page_links(content):
+        if '.edu' in href and href.startswith('http'):
+            edu_urls.append(href)
+        elif '.edu' in href and href.startswith('//'):
+            edu_urls.append(f"https:{href}")
+    return edu_urls
+
+@register_finder('forums', 'forums', [
+    "https://www.google.com/search?q=list+of+forums+by+category",
+    "https://www.google.com/search?q=popular+discussion+forums",
+    "https://www.google.com/search?q=niche+specific+forums",
+    "https://www.google.com/search?q=professional+forums+list"
+])
+def extract_forum_links(content: str) -> List[str]:
+    """Find forum sites in a page"""
+    return [href for href in _page_links(content)
+            if any(term in href.lower() for term in ['forum', 'community', 'discuss']) and href.startswith('http')]
+
+@register_finder('blog_platforms', 'blog_platforms', [
+    "https://www.google.com/search?q=list+of+blog+platforms",
+    "https://www.google.com/search?q=blog+directories+list",
+    "https://www.google.com/search?q=submit+guest+post+blogs"
+])
+def extract_blog_links(content: str) -> List[str]:
+    """Find blog platforms and directories in a page"""
+    return [href for href in _page_links(content)
+            if any(term in href.lower() for term in ['blog', 'wordpress', 'medium', 'tumblr']) and href.startswith('http')]
+
 class SourceExpander:
     def __init__(self):
         self.delay = 2
         self.max_concurrent = 5
         self.sources = self.load_sources()
+        self.index = SourceIndex(self.sources)
+        self.retry_scheduler = RetryScheduler()
             
     def load_sources(self) -> Dict[str, List[str]]:
         try:
@@ -25,10 +96,9 @@ class SourceExpander:
             return {}
             
     def save_sources(self):
-        with open('sources.json', 'w') as f:
-            json.dump(self.sources, f, indent=4)
+        self.index.save('sources.json')
             
-    async def fetch_with_delay(self, session: aiohttp.ClientSession, url: str, semaphore: asyncio.Semaphore) -> str:
+    async def fetch_with_delay(self, session: aiohttp.ClientSession, url: str, semaphore: asyncio.Semaphore, delay: Optional[float] = None) -> str:
         """Fetch URL content with rate limiting"""
         async with semaphore:
             try:
@@ -37,84 +107,57 @@ class SourceExpander:
                     'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
                     'Accept-Language': 'en-US,en;q=0.5',
                 }
-                await asyncio.sleep(self.delay)
+                await asyncio.sleep(self.delay if delay is None else delay)
                 async with session.get(url, headers=headers, timeout=30) as response:
                     if response.status == 200:
                         return await response.text()
+                    error = classify_status(url, response.status, response.headers)
             except Exception as e:
-                console.print(f"[red]Error fetching {url}: {str(e)}")
+                error = classify_exception(url, e)
+        # Transient failures are retried by the scheduler, outside the semaphore
+        if error.retryable:
+            raise error
+        console.print(f"[red]Error fetching {url}: {error.reason}")
         return ""
 
-    async def find_edu_domains(self, session: aiohttp.ClientSession, semaphore: asyncio.Semaphore) -> List[str]:
-        """Find .edu domains from various sources"""
-        edu_urls = []
+    async def discover(self, session: aiohttp.ClientSession, semaphore: asyncio.Semaphore, finders: List[Finder]) -> Dict[str, List[str]]:
+        """Run finders concurrently; returns the new URLs found by each finder, by name"""
+        loop = asyncio.get_running_loop()
         
-        # List of sources for finding .edu domains
-        sources = [
-            "https://en.wikipedia.org/wiki/List_of_state_universities_in_the_United_States",
-            "https://en.wikipedia.org/wiki/List_of_private_colleges_and_universities_in_the_United_States",
-            "https://en.wikipedia.org/wiki/List_of_land-grant_universities"
-        ]
+        # A page shared by several finders is fetched once
+        finders_by_page: Dict[str, List[Finder]] = {}
+        for finder in finders:
+            for page in finder.pages:
+                finders_by_page.setdefault(page, []).append(finder)
         
-        for url in sources:
-            content = await self.fetch_with_delay(session, url, semaphore)
-            if content:
-                soup = BeautifulSoup(content, 'html.parser')
-                for link in soup.find_all('a'):
-                    href = link.get('href', '')
-                    if '.edu' in href and href.startswith('http'):
-                        edu_urls.append(href)
-                    elif '.edu' in href and href.startswith('//'):
-                        edu_urls.append(f"https:{href}")
-                    
-        return list(set(edu_urls))
+        async def fetch_and_extract(page: str) -> Dict[str, List[str]]:
+            content = await self.fetch_with_delay(session, page, semaphore)
+            if not content:
+                return {}
+            # Link extraction parses the whole page, so keep it off the event loop
+            extracted = await asyncio.gather(*[
+                loop.run_in_executor(None, finder.extract, content) for finder in finders_by_page[page]
+            ])
+            return {finder.name: links for finder, links in zip(finders_by_page[page], extracted)}
+        
+        pages = list(finders_by_page)
+        found: Dict[str, Dict[str, None]] = {finder.name: {} for finder in finders}
+        for result in await self.retry_scheduler.run(pages, fetch_and_extract):
+            for name, links in (result or {}).items():
+                found[name].update(dict.fromkeys(links))
+        return {name: list(links) for name, links in found.items()}
+
+    async def find_edu_domains(self, session: aiohttp.ClientSession, semaphore: asyncio.Semaphore) -> List[str]:
+        """Find .edu domains from various sources"""
+        return (await self.discover(session, semaphore, [FINDERS['edu_domains']]))['edu_domains']
 
     async def find_forum_sites(self, session: aiohttp.ClientSession, semaphore: asyncio.Semaphore) -> List[str]:
         """Find forum sites from various sources"""
-        forum_urls = []
-        
-        # List of sources for finding forums
-        sources = [
-            "https://www.google.com/search?q=list+of+forums+by+category",
-            "https://www.google.com/search?q=popular+discussion+forums",
-            "https://www.google.com/search?q=niche+specific+forums",
-            "https://www.google.com/search?q=professional+forums+list"
-        ]
-        
-        for url in sources:
-            content = await self.fetch_with_delay(session, url, semaphore)
-            if content:
-                soup = BeautifulSoup(content, 'html.parser')
-                for link in soup.find_all('a'):
-                    href = link.get('href', '')
-                    if any(term in href.lower() for term in ['forum', 'community', 'discuss']):
-                        if href.startswith('http'):
-                            forum_urls.append(href)
-                        
-        return list(set(forum_urls))
+        return (await self.discover(session, semaphore, [FINDERS['forums']]))['forums']
 
     async def find_blog_platforms(self, session: aiohttp.ClientSession, semaphore: asyncio.Semaphore) -> List[str]:
         """Find blog platforms and directories"""
-        blog_urls = []
-        
-        # List of sources for finding blog platforms
-        sources = [
-            "https://www.google.com/search?q=list+of+blog+platforms",
-            "https://www.google.com/search?q=blog+directories+list",
-            "https://www.google.com/search?q=submit+guest+post+blogs"
-        ]
-        
-        for url in sources:
-            content = await self.fetch_with_delay(session, url, semaphore)
-            if content:
-                soup = BeautifulSoup(content, 'html.parser')
-                for link in soup.find_all('a'):
-                    href = link.get('href', '')
-                    if any(term in href.lower() for term in ['blog', 'wordpress', 'medium', 'tumblr']):
-                        if href.startswith('http'):
-                            blog_urls.append(href)
-                        
-        return list(set(blog_urls))
+        return (await self.discover(session, semaphore, [FINDERS['blog_platforms']]))['blog_platforms']
 
     async def expand_sources(self):
         """Expand sources for each category"""
@@ -123,33 +166,132 @@ class SourceExpander:
         async with aiohttp.ClientSession() as session:
             semaphore = asyncio.Semaphore(self.max_concurrent)
             
-            # Expand .edu domains
-            edu_domains = await self.find_edu_domains(session, semaphore)
-            self.sources['edu_domains'].extend(edu_domains)
-            self.sources['edu_domains'] = list(set(self.sources['edu_domains']))
-            console.print(f"[green]Found {len(edu_domains)} new .edu domains")
-            
-            # Expand forum sites
-            forum_sites = await self.find_forum_sites(session, semaphore)
-            self.sources['forums'].extend(forum_sites)
-            self.sources['forums'] = list(set(self.sources['forums']))
-            console.print(f"[green]Found {len(forum_sites)} new forum sites")
+            # All finders share one scheduler, so the slowest source bounds the run
+            finders = list(FINDERS.values())
+            found = await self.discover(session, semaphore, finders)
             
-            # Expand blog platforms
-            blog_sites = await self.find_blog_platforms(session, semaphore)
-            self.sources['blog_platforms'].extend(blog_sites)
-            self.sources['blog_platforms'] = list(set(self.sources['blog_platforms']))
-            console.print(f"[green]Found {len(blog_sites)} new blog platforms")
+            total_new = 0
+            for finder in finders:
+                added = self.index.merge(finder.category, found[finder.name])
+                console.print(f"[green]Found {len(added)} new {finder.category} sources via {finder.name}")
+                total_new += len(added)
             
             # Save updated sources
             self.save_sources()
             
-            total_new = len(edu_domains) + len(forum_sites) + len(blog_sites)
             console.print(f"[green]Added {total_new} new sources in total")
 
+    async def seed_from_sitemaps(self, session: aiohttp.ClientSession, frontier: CrawlFrontier,
+                                 robots: RobotsCache, pages_per_host: int):
+        """Queue pages listed in the sitemaps of the seed hosts, one hop away from the seeds"""
+        origins = {RobotsCache.origin(page) for finder in FINDERS.values() for page in finder.pages}
+        
+        async def seed(origin: str):
+            await robots.ensure(session, origin)
+            sitemap_urls = robots.sitemaps(origin) or [f"{origin}/sitemap.xml"]
+            for sitemap_url in sitemap_urls:
+                for page in await fetch_sitemap_urls(session, sitemap_url, max_urls=pages_per_host):
+                    frontier.add(page, 1)
+        
+        await asyncio.gather(*(seed(origin) for origin in origins))
+    
+    async def crawl(self, max_pages: int = 500, max_depth: int = 2, pages_per_host: int = 20,
+                    sitemaps: bool = False):
+        """Crawl outward from the finder pages, feeding new .edu, forum and blog hosts into sources.json"""
+        console.print("[cyan]Starting crawl...")
+        frontier = CrawlFrontier(max_depth=max_depth, max_pages_per_host=pages_per_host, host_delay=self.delay)
+        robots = RobotsCache()
+        for finder in FINDERS.values():
+            for page in finder.pages:
+                frontier.add(page, 0)
+        
+        loop = asyncio.get_running_loop()
+        crawled = 0
+        active = 0
+        
+        async def crawl_worker(session: aiohttp.ClientSession, semaphore: asyncio.Semaphore):
+            nonlocal crawled, active
+            while crawled < max_pages:
+                # Claim the page before waiting, so concurrent workers cannot overshoot max_pages
+                crawled += 1
+                item = await frontier.get()
+                if item is None:
+                    crawled -= 1
+                    # Other workers may still add links; stop only once they are idle too
+                    if not active:
+                        return
+                    await asyncio.sleep(0.5)
+                    continue
+                
+                url, depth = item
+                active += 1
+                await robots.ensure(session, url)
+                if not robots.can_fetch(url):
+                    crawled -= 1
+                    active -= 1
+                    continue
+                crawl_delay = robots.crawl_delay(url)
+                if crawl_delay:
+                    frontier.set_host_delay(url, crawl_delay)
+                try:
+                    # Per-host politeness is handled by the frontier, so no fixed delay here
+                    content = await self.fetch_with_delay(session, url, semaphore, delay=0)
+                except FetchError as e:
+                    console.print(f"[red]Error fetching {url}: {e.reason}")
+                    content = ""
+                try:
+                    if not content:
+                        continue
+                    links = await loop.run_in_executor(None, _anchor_links, content)
+                    for href, anchor in links:
+                        link = urljoin(url, href)
+                        category = classify_host(urlparse(link).netloc)
+                        if category:
+                            parsed = urlparse(link)
+                            self.index.merge(category, [f"{parsed.scheme}://{parsed.netloc}"])
+                        frontier.add(link, depth + 1, anchor)
+                finally:
+                    active -= 1
+        
+        try:
+            with Progress() as progress:
+                task = progress.add_task("[cyan]Crawling...", total=max_pages)
+                async with aiohttp.ClientSession() as session:
+                    semaphore = asyncio.Semaphore(self.max_concurrent)
+                    if sitemaps:
+                        await self.seed_from_sitemaps(session, frontier, robots, pages_per_host)
+                    workers = [asyncio.ensure_future(crawl_worker(session, semaphore)) for _ in range(self.max_concurrent)]
+                    while not all(worker.done() for worker in workers):
+                        await asyncio.sleep(1)
+                        progress.update(task, completed=min(crawled, max_pages))
+                    await asyncio.gather(*workers)
+        finally:
+            frontier.close()
+            robots.save()
+            added = dict(self.index.added)
+            self.save_sources()
+        
+        console.print(f"[green]Crawled {crawled} pages, {len(frontier)} still queued; added {added}")
+
+def _anchor_links(content: str) -> List[Tuple[str, str]]:
+    soup = BeautifulSoup(content, 'html.parser')
+    return [(link.get('href', ''), link.get_text(' ', strip=True)) for link in soup.find_all('a') if link.get('href')]
+
 async def main():
+    parser = argparse.ArgumentParser(description='Discover new backlink sources')
+    parser.add_argument('--crawl', action='store_true', help='Crawl outward from the finder pages instead of a single hop')
+    parser.add_argument('--max-pages', type=int, default=500, help='Pages to crawl in this run')
+    parser.add_argument('--max-depth', type=int, default=2, help='Links to follow away from the finder pages')
+    parser.add_argument('--pages-per-host', type=int, default=20, help='Maximum pages crawled on any single host')
+    parser.add_argument('--sitemaps', action='store_true', help='Also queue pages from the seed hosts\' sitemaps')
+    args = parser.parse_args()
+    
     expander = SourceExpander()
-    await expander.expand_sources()
+    if args.crawl:
+        await expander.crawl(args.max_pages, args.max_depth, args.pages_per_host, sitemaps=args.sitemaps)
+    else:
+        await expander.expand_sources()
 
 if __name__ == "__main__":
-    asyncio.run(main()) 
\ No newline at end of file
+    asyncio.run(main()) 
+    flush_json()
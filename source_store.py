@@ -0,0 +1,51 @@
+import time
+from typing import Dict, List
+
+from persistence import append_json_line, write_json
+from seen_filter import ExactSet
+from url_record import url_record
+
+
+def canonical_url(url: str) -> str:
+    """Normalised form used to compare URLs: lowercase scheme and host, no default port,
+    fragment or trailing slash"""
+    return url_record(url).canonical
+
+
+class SourceIndex:
+    """Per-category canonical URL sets over sources.json.
+
+    Merging appends only unseen URLs, keeps existing order, and costs time in
+    proportion to the number of new URLs rather than the size of the file.
+    The sets are exact whatever their size: a Bloom filter false positive here
+    would silently drop a new source.
+    """
+
+    def __init__(self, sources: Dict[str, List[str]]):
+        self.sources = sources
+        self.seen = {
+            category: ExactSet(canonical_url(url) for url in urls)
+            for category, urls in sources.items()
+        }
+        self.added: Dict[str, int] = {}
+
+    def merge(self, category: str, urls: List[str]) -> List[str]:
+        """Append new URLs to a category (creating it if needed); returns what was added"""
+        existing = self.sources.setdefault(category, [])
+        if category not in self.seen:
+            self.seen[category] = ExactSet()
+        seen = self.seen[category]
+        added = []
+        for url in urls:
+            if seen.add(canonical_url(url)):
+                existing.append(url)
+                added.append(url)
+        self.added[category] = self.added.get(category, 0) + len(added)
+        return added
+
+    def save(self, path: str = 'sources.json', log_path: str = 'sources_runs.jsonl'):
+        """Queue an atomic rewrite of the sources file and an append of this run's added counts"""
+        # Kept indented: sources.json is checked in and edited by hand
+        write_json(path, {category: list(urls) for category, urls in self.sources.items()}, indent=4)
+        append_json_line(log_path, {'time': int(time.time()), 'added': self.added})
+        self.added = {}
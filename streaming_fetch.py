@@ -0,0 +1,86 @@
+import codecs
+import re
+from typing import AsyncIterator, Optional
+
+# Content types we are willing to download and parse
+HTML_CONTENT_TYPES = ('text/html', 'application/xhtml+xml')
+
+# <meta charset="..."> or <meta http-equiv="Content-Type" content="...; charset=...">
+META_CHARSET_RE = re.compile(rb'<meta[^>]+charset\s*=\s*["\']?\s*([A-Za-z0-9_.:-]+)', re.IGNORECASE)
+
+# The HTML spec requires the charset declaration within the first 1024 bytes;
+# be a little more generous for pages with long comments before it
+META_SNIFF_BYTES = 4096
+
+BOMS = (
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+)
+
+try:
+    from charset_normalizer import from_bytes as detect_charset
+except ImportError:
+    detect_charset = None
+
+
+def is_html(content_type: Optional[str]) -> bool:
+    """Check a Content-Type header; a missing header is given the benefit of the doubt"""
+    if not content_type:
+        return True
+    return content_type.split(';', 1)[0].strip().lower() in HTML_CONTENT_TYPES
+
+
+async def read_limited(body: AsyncIterator[bytes], max_bytes: int) -> bytes:
+    """Read at most max_bytes from a body's chunk stream, leaving the rest on the wire"""
+    chunks = []
+    received = 0
+    async for chunk in body:
+        chunks.append(chunk)
+        received += len(chunk)
+        if received >= max_bytes:
+            break
+    return b''.join(chunks)[:max_bytes]
+
+
+def _known_codec(name: Optional[str]) -> Optional[str]:
+    if not name:
+        return None
+    try:
+        return codecs.lookup(name.strip().lower()).name
+    except LookupError:
+        return None
+
+
+def sniff_charset(raw: bytes, header_charset: Optional[str] = None) -> Optional[str]:
+    """Find the declared encoding: header first, then BOM, then <meta>"""
+    charset = _known_codec(header_charset)
+    if charset:
+        return charset
+    for bom, name in BOMS:
+        if raw.startswith(bom):
+            return name
+    match = META_CHARSET_RE.search(raw, 0, META_SNIFF_BYTES)
+    if match:
+        return _known_codec(match.group(1).decode('ascii', 'ignore'))
+    return None
+
+
+def decode_body(raw: bytes, header_charset: Optional[str] = None) -> str:
+    """Decode a (possibly truncated) body without running detection when a charset is declared"""
+    charset = sniff_charset(raw, header_charset)
+    if charset:
+        return raw.decode(charset, errors='replace')
+
+    # Undeclared: UTF-8 is by far the most common, and a truncated final
+    # character must not count as invalid
+    try:
+        return codecs.getincrementaldecoder('utf-8')().decode(raw, final=False)
+    except UnicodeDecodeError:
+        pass
+
+    if detect_charset is not None:
+        best = detect_charset(raw).best()
+        if best is not None:
+            return str(best)
+    return raw.decode('cp1252', errors='replace')
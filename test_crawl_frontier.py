@@ -0,0 +1,45 @@
+import json
+import os
+import tempfile
+
+from crawl_frontier import CrawlFrontier
+from persistence import flush_json
+
+
+def make_frontier(tmp: str) -> CrawlFrontier:
+    return CrawlFrontier(max_pages_per_host=3, host_delay=0, seen_capacity=10_000,
+                         seen_path=os.path.join(tmp, 'seen.bloom'), frontier_path=os.path.join(tmp, 'frontier.json'))
+
+
+def test_resume_keeps_the_per_host_cap():
+    """Pages crawled before an interruption still count towards --pages-per-host after resuming"""
+    with tempfile.TemporaryDirectory() as tmp:
+        frontier = make_frontier(tmp)
+        for page in range(3):
+            assert frontier.add(f"https://forum.example.com/t/{page}", 0)
+        assert not frontier.add('https://forum.example.com/t/3', 0)
+        frontier.pop()
+        frontier.pop()
+        frontier.close()
+        flush_json()
+
+        resumed = make_frontier(tmp)
+        assert len(resumed) == 1
+        assert not resumed.add('https://forum.example.com/t/4', 0)
+        assert resumed.add('https://other.example.com/', 0)
+        resumed.seen.close()
+
+
+def test_resume_from_a_list_snapshot():
+    with tempfile.TemporaryDirectory() as tmp:
+        with open(os.path.join(tmp, 'frontier.json'), 'w') as f:
+            json.dump([['https://blog.example.com/a', 1, 5.0]], f)
+        frontier = make_frontier(tmp)
+        assert frontier.pop()[0] == ('https://blog.example.com/a', 1)
+        frontier.seen.close()
+
+
+if __name__ == "__main__":
+    for check in (test_resume_keeps_the_per_host_cap, test_resume_from_a_list_snapshot):
+        check()
+        print(f"✓ {check.__name__}")
@@ -0,0 +1,115 @@
+import asyncio
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+
+from distributed import HttpLeaseClient, LeaseStore, run_worker, serve_coordinator
+
+SOURCES = {
+    'edu': [f"https://site{i}.edu/page" for i in range(12)],
+    'blog': [f"https://blog{i}.example.com/post/{j}" for i in range(6) for j in range(2)],
+}
+
+
+def source_order():
+    return [url for urls in SOURCES.values() for url in urls]
+
+
+def stub_scrape(worker_id: str, delay: float = 0.0):
+    """scrape_urls stand-in: URLs ending in /1 find nothing, the others a result naming the worker"""
+
+    async def scrape_urls(pairs):
+        if delay:
+            await asyncio.sleep(delay)
+        return [None if url.endswith('/1') else {'url': url, 'niche': category, 'worker': worker_id}
+                for category, url in pairs]
+
+    return scrape_urls
+
+
+def _worker_process(path: str, worker_id: str, completed):
+    store = LeaseStore(path)
+    completed.put((worker_id, asyncio.run(run_worker(store, worker_id, stub_scrape(worker_id, 0.02), idle_poll=0.05))))
+
+
+def test_local_worker_processes_drain_the_queue_in_source_order():
+    """Two worker processes sharing one SQLite file complete every shard; results come back in source order"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'queue.db')
+        store = LeaseStore(path)
+        store.load(SOURCES, shard_count=8)
+        shards = sum(store.progress().values())
+
+        completed = multiprocessing.Queue()
+        workers = [multiprocessing.Process(target=_worker_process, args=(path, f"worker-{i}", completed))
+                   for i in range(2)]
+        for worker in workers:
+            worker.start()
+        counts = dict(completed.get(timeout=60) for _ in workers)
+        for worker in workers:
+            worker.join()
+
+        assert sum(counts.values()) == shards, counts
+        assert store.progress() == {'pending': 0, 'leased': 0, 'done': shards}
+        merged = store.merged_results()
+        assert [site['url'] for site in merged] == [url for url in source_order() if not url.endswith('/1')]
+        assert {site['worker'] for site in merged} <= set(counts)
+
+
+def test_expired_lease_is_reassigned_and_late_complete_rejected():
+    with tempfile.TemporaryDirectory() as tmp:
+        store = LeaseStore(os.path.join(tmp, 'queue.db'))
+        store.load({'edu': ['https://one.edu/a', 'https://one.edu/b']}, shard_count=1)
+
+        first = store.lease('a', ttl=0.05)
+        assert store.lease('b', ttl=10) is None
+        time.sleep(0.1)
+        second = store.lease('b', ttl=10)
+        assert second['shard'] == first['shard'] and second['urls'] == first['urls']
+
+        assert not store.heartbeat('a', first['shard'], 10)
+        assert not store.complete('a', first['shard'], [(1, {'url': 'https://one.edu/a', 'worker': 'a'})])
+        assert store.complete('b', second['shard'], [(1, {'url': 'https://one.edu/a', 'worker': 'b'})])
+        assert store.merged_results() == [{'url': 'https://one.edu/a', 'worker': 'b'}]
+        assert store.progress()['done'] == 1
+
+
+def test_stalled_worker_loses_its_shard_over_http():
+    """A worker that stalls past its lease has the shard reassigned and its late results dropped"""
+    with tempfile.TemporaryDirectory() as tmp:
+        store = LeaseStore(os.path.join(tmp, 'queue.db'))
+        store.load({'edu': ['https://one.edu/a', 'https://one.edu/b']}, shard_count=1)
+        server = serve_coordinator(store, '127.0.0.1', 0)
+        client = HttpLeaseClient(f"http://127.0.0.1:{server.server_address[1]}")
+        counts = {}
+
+        async def stalled(pairs):
+            # Blocks the whole event loop, heartbeats included, well past the 0.3 s lease
+            time.sleep(0.8)
+            return [{'url': url, 'worker': 'stalled'} for _, url in pairs]
+
+        def rescuer():
+            time.sleep(0.45)
+            counts['rescuer'] = asyncio.run(run_worker(client, 'rescuer', stub_scrape('rescuer'), ttl=10, idle_poll=0.05))
+
+        thread = threading.Thread(target=rescuer)
+        thread.start()
+        try:
+            counts['stalled'] = asyncio.run(run_worker(client, 'stalled', stalled, ttl=0.3, idle_poll=0.05))
+            thread.join()
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        assert counts == {'stalled': 0, 'rescuer': 1}
+        assert [site['worker'] for site in store.merged_results()] == ['rescuer', 'rescuer']
+
+
+if __name__ == "__main__":
+    for check in (test_local_worker_processes_drain_the_queue_in_source_order,
+                  test_expired_lease_is_reassigned_and_late_complete_rejected,
+                  test_stalled_worker_loses_its_shard_over_http):
+        check()
+        print(f"✓ {check.__name__}")
@@ -0,0 +1,127 @@
+import asyncio
+import time
+
+from aiohttp import web
+
+from backlink_finder import BacklinkFinder
+from dns_stage import DnsStage, StubBackend
+
+LIVE = ['192.0.2.10']
+
+
+def stage_for(records, latency: float = 0.0, canary=None, **options) -> DnsStage:
+    """A stage answering from records, without a cache file"""
+    return DnsStage(StubBackend(records, latency=latency), path=None, canary=canary, **options)
+
+
+def test_dead_hosts_get_no_http_attempts():
+    """URLs on NXDOMAIN hosts are dropped before fetching; live hosts connect to the address the stage found"""
+
+    async def page(request):
+        return web.Response(text=f'<html><head><title>Live</title></head><body><a href="{request.url}">self</a></body></html>',
+                            content_type='text/html')
+
+    async def run():
+        app = web.Application()
+        app.router.add_get('/{tail:.*}', page)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        try:
+            finder = BacklinkFinder()
+            manager = finder.source_manager
+            manager.delay = 0
+            manager.robots = None
+            manager.dns = stage_for({'live.test': ['127.0.0.1']})
+            attempted = []
+            fetch = manager.fetch_with_delay
+
+            async def counting_fetch(session, url, semaphore):
+                attempted.append(url)
+                return await fetch(session, url, semaphore)
+
+            manager.fetch_with_delay = counting_fetch
+            live, dead = f"http://live.test:{port}/a", f"http://dead.test:{port}/a"
+            async with manager.session() as session:
+                sites = await finder.scrape_urls(session, [('edu', dead), ('edu', live), ('edu', dead + 'b')],
+                                                 asyncio.Semaphore(5))
+            assert attempted == [live], attempted
+            assert sites[0] is None and sites[2] is None
+            assert sites[1] and sites[1]['url'] == live
+            assert manager.dns.stats['dead'] == 1
+        finally:
+            await runner.cleanup()
+
+    asyncio.run(run())
+
+
+def test_negative_entries_expire():
+    """A not-found answer is cached for negative_ttl, then the host is looked up again"""
+    stage = stage_for({}, negative_ttl=0.2)
+
+    async def run():
+        assert await stage.resolve('gone.test') == []
+        assert await stage.resolve('gone.test') == []
+        assert stage.backend.queries == 1
+        time.sleep(0.25)
+        stage.backend.records['gone.test'] = LIVE
+        assert [address for _, address in await stage.resolve('gone.test')] == LIVE
+        assert stage.backend.queries == 2
+
+    asyncio.run(run())
+
+
+def test_canary_fallback():
+    """When the canary does not resolve either, not-found answers are failures and nothing is skipped"""
+
+    async def run():
+        broken = stage_for({}, canary='example.com')
+        assert await broken.resolve('gone.test') is None
+        assert await broken.unresolvable(['https://gone.test/', 'https://other.test/']) == set()
+        assert broken.stats['dead'] == 0
+        assert not broken.entries
+
+        working = stage_for({'example.com': LIVE}, canary='example.com')
+        assert await working.resolve('gone.test') == []
+        assert await working.unresolvable(['https://gone.test/', 'https://example.com/']) == {'https://gone.test/'}
+
+    asyncio.run(run())
+
+
+def test_concurrent_callers_share_one_query():
+    stage = stage_for({'shared.test': LIVE}, latency=0.05)
+
+    async def run():
+        answers = await asyncio.gather(*(stage.resolve('shared.test') for _ in range(20)))
+        assert stage.backend.queries == 1
+        assert all(answer == answers[0] for answer in answers)
+        assert not stage.pending
+
+    asyncio.run(run())
+
+
+def test_cancelled_caller_does_not_cancel_the_shared_lookup():
+    """Cancelling whichever caller started the lookup leaves the others with the answer"""
+    stage = stage_for({'shared.test': LIVE}, latency=0.1)
+
+    async def run():
+        first = asyncio.ensure_future(stage.resolve('shared.test'))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(stage.resolve('shared.test'))
+        await asyncio.sleep(0.02)
+        first.cancel()
+        assert [address for _, address in await second] == LIVE
+        assert first.cancelled()
+        assert stage.backend.queries == 1
+        assert stage.cached('shared.test')
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    for check in (test_dead_hosts_get_no_http_attempts, test_negative_entries_expire, test_canary_fallback,
+                  test_concurrent_callers_share_one_query, test_cancelled_caller_does_not_cancel_the_shared_lookup):
+        check()
+        print(f"✓ {check.__name__}")
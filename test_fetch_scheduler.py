@@ -0,0 +1,56 @@
+import asyncio
+
+from fetch_scheduler import FetchError, RetryScheduler
+
+
+def run(scheduler: RetryScheduler, urls, outcomes):
+    """Run the scheduler over urls; outcomes maps a URL to a list of errors to raise before it succeeds"""
+    attempts = {}
+
+    async def worker(url):
+        attempts[url] = attempts.get(url, 0) + 1
+        pending = outcomes.get(url, [])
+        if pending:
+            raise pending.pop(0)
+        return f"{url} ok"
+
+    return asyncio.run(scheduler.run(urls, worker)), attempts
+
+
+def test_duplicate_urls_keep_their_places():
+    urls = ['https://a.test/x', 'https://b.test/y', 'https://a.test/x']
+    results, _ = run(RetryScheduler(base_delay=0.01), urls, {})
+    assert results == ['https://a.test/x ok', 'https://b.test/y ok', 'https://a.test/x ok']
+
+
+def test_given_up_reasons():
+    unavailable = lambda url: FetchError(url, 'HTTP 503', True, status=503)
+    scheduler = RetryScheduler(max_attempts=3, base_delay=0.01, max_retries_per_host=1)
+    urls = ['https://b.test/1', 'https://b.test/2', 'https://c.test/1', 'https://d.test/gone']
+    outcomes = {url: [unavailable(url)] * 5 for url in urls[:3]}
+    outcomes['https://d.test/gone'] = [FetchError('https://d.test/gone', 'HTTP 404', False)]
+    results, _ = run(scheduler, urls, outcomes)
+    assert results == [None] * 4
+    assert scheduler.given_up == {'HTTP 503, host retry budget used up': 3, 'HTTP 404, not retryable': 1}
+
+
+def test_long_retry_after_gives_up_instead_of_retrying_early():
+    scheduler = RetryScheduler(base_delay=0.01, max_delay=60)
+    slow = 'https://slow.test/'
+    soon = 'https://soon.test/'
+    outcomes = {
+        slow: [FetchError(slow, 'HTTP 429', True, status=429, retry_after=300)],
+        soon: [FetchError(soon, 'HTTP 429', True, status=429, retry_after=0.05)],
+    }
+    results, attempts = run(scheduler, [slow, soon], outcomes)
+    assert results == [None, f"{soon} ok"]
+    assert attempts == {slow: 1, soon: 2}
+    assert scheduler.given_up == {'HTTP 429, Retry-After 300s is over the 60s limit': 1}
+    assert scheduler.run_retries == 1
+
+
+if __name__ == "__main__":
+    for check in (test_duplicate_urls_keep_their_places, test_given_up_reasons,
+                  test_long_retry_after_gives_up_instead_of_retrying_early):
+        check()
+        print(f"✓ {check.__name__}")
@@ -0,0 +1,32 @@
+import os
+import subprocess
+import sys
+import tempfile
+
+SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'generate_websites.py')
+
+
+def run_twice(*args: str, output: str = 'sources.json') -> bytes:
+    """Run the generator in two fresh directories with the same arguments; returns the first output"""
+    outputs = []
+    for _ in range(2):
+        with tempfile.TemporaryDirectory() as tmp:
+            subprocess.run([sys.executable, SCRIPT, *args], cwd=tmp, check=True, capture_output=True)
+            with open(os.path.join(tmp, output), 'rb') as f:
+                outputs.append(f.read())
+    assert outputs[0] == outputs[1], f"{args} wrote different files"
+    return outputs[0]
+
+
+def test_same_seed_same_sources():
+    assert run_twice('--count', '50', '--seed', '3')
+
+
+def test_same_seed_same_stream():
+    assert run_twice('--count', '50', '--seed', '3', '--stream', 'sites.jsonl', output='sites.jsonl')
+
+
+if __name__ == "__main__":
+    for check in (test_same_seed_same_sources, test_same_seed_same_stream):
+        check()
+        print(f"✓ {check.__name__}")
@@ -0,0 +1,92 @@
+import copy
+import json
+import os
+import tempfile
+
+from metrics_engine import MetricsEngine, Provider
+from persistence import flush_json
+from site_records import MetricsTable
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Edge cases: missing metrics, a domain that differs from the URL, and shapes the columns
+# cannot hold (floats, key order, 255, empty source, extra keys), all written back exactly
+ODD_ENTRIES = {
+    'odd': [
+        {'url': 'https://a.example.org/', 'domain': 'a.example.org', 'metrics': None},
+        {'url': 'https://b.example.org/', 'domain': 'www.b.example.org', 'metrics': {'da': 10, 'pa': 20, 'spam_score': 1}},
+        {'url': 'https://c.example.org/', 'domain': 'c.example.org', 'metrics': {'da': 10.5, 'pa': 20, 'spam_score': 1}},
+        {'url': 'https://d.example.org/', 'domain': 'd.example.org', 'metrics': {'pa': 20, 'da': 10, 'spam_score': 1}},
+        {'url': 'https://e.example.org/', 'domain': 'e.example.org', 'metrics': {'da': 255, 'pa': 0, 'spam_score': 0}},
+        {'url': 'https://f.example.org/', 'domain': 'f.example.org', 'metrics': {'da': 1, 'pa': 2, 'spam_score': 3, 'source': ''}},
+        {'url': 'https://g.example.org/', 'domain': 'g.example.org', 'metrics': {'da': 1, 'pa': 2, 'spam_score': 3, 'source': 'moz'}},
+        {'url': 'https://h.example.org/', 'domain': 'h.example.org', 'metrics': {'da': 1, 'pa': 2, 'spam_score': 3}, 'note': 'x'},
+        {'url': '', 'domain': 'i.example.org', 'metrics': None},
+        {'domain': 'j.example.org'},
+    ],
+    'empty': [],
+}
+
+
+def test_json_round_trip():
+    with open(os.path.join(HERE, 'sources_with_metrics.json')) as f:
+        data = json.load(f)
+    data.update(copy.deepcopy(ODD_ENTRIES))
+    table = MetricsTable.from_json(data)
+    assert json.dumps(table.to_json()) == json.dumps(data)
+    # Most rows fit the columns; the odd ones are kept verbatim
+    assert len(table.irregular) < len(ODD_ENTRIES['odd'])
+
+
+def test_set_metrics():
+    table = MetricsTable.from_json(copy.deepcopy(ODD_ENTRIES))
+    table.set_metrics(0, {'da': 40, 'pa': 41, 'spam_score': 2, 'source': 'moz'})
+    table.set_metrics(1, {'da': 40.5, 'pa': 41, 'spam_score': 2})
+    table.set_metrics(7, None)
+    rows = table.to_json()['odd']
+    assert rows[0] == {'url': 'https://a.example.org/', 'domain': 'a.example.org',
+                       'metrics': {'da': 40, 'pa': 41, 'spam_score': 2, 'source': 'moz'}}
+    assert rows[1] == {'url': 'https://b.example.org/', 'domain': 'www.b.example.org',
+                       'metrics': {'da': 40.5, 'pa': 41, 'spam_score': 2}}
+    assert rows[7] == {'url': 'https://h.example.org/', 'domain': 'h.example.org', 'metrics': None, 'note': 'x'}
+
+
+def fake_metrics(domain: str):
+    if domain.startswith('c.'):
+        return None
+    # A float for one domain, so its row has to leave the columns
+    return {'da': 30.5 if domain.startswith('b.') else len(domain), 'pa': 7, 'spam_score': 1}
+
+
+def test_engine_run_matches_the_dict_update():
+    """MetricsEngine.run over the table writes what updating the nested dicts in place would"""
+    with open(os.path.join(HERE, 'sources_with_metrics.json')) as f:
+        data = json.load(f)
+    data = {category: items[:20] for category, items in data.items()}
+    data.update(copy.deepcopy(ODD_ENTRIES))
+
+    expected = copy.deepcopy(data)
+    for items in expected.values():
+        for item in items:
+            metrics = fake_metrics(item['domain']) if item.get('domain') else None
+            if metrics and any(other.get('url') and other.get('domain') == item['domain']
+                               for others in data.values() for other in others):
+                item['metrics'] = dict(metrics, source='fake')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        input_path, output_path = os.path.join(tmp, 'in.json'), os.path.join(tmp, 'out.json')
+        with open(input_path, 'w') as f:
+            json.dump(data, f)
+        engine = MetricsEngine([Provider('fake', 0, fake_metrics, delay=0)], cache_path=None, clusters={})
+        by_source = engine.run(input_path, output_path)
+        flush_json()
+        with open(output_path) as f:
+            written = json.load(f)
+    assert written == expected
+    assert by_source['none'] == 1
+
+
+if __name__ == "__main__":
+    for check in (test_json_round_trip, test_set_metrics, test_engine_run_matches_the_dict_update):
+        check()
+        print(f"✓ {check.__name__}")
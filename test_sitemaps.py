@@ -0,0 +1,93 @@
+import asyncio
+import gzip
+import os
+import tempfile
+
+import aiohttp
+from aiohttp import web
+
+from robots_cache import RobotsCache, fetch_sitemap_urls
+
+URL_COUNT = 20000
+CHUNK = 8192
+
+
+def sitemap_xml(count: int) -> bytes:
+    urls = ''.join(f"<url><loc>https://example.edu/page/{i}</loc></url>" for i in range(count))
+    return (f'<?xml version="1.0" encoding="UTF-8"?>'
+            f'<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{urls}</urlset>').encode()
+
+
+async def send_in_chunks(request: web.Request, body: bytes, content_type: str, **headers) -> web.StreamResponse:
+    """Write the body a chunk at a time, so the client sees it arrive over several reads"""
+    response = web.StreamResponse(headers={'Content-Type': content_type, **headers})
+    await response.prepare(request)
+    for start in range(0, len(body), CHUNK):
+        await response.write(body[start:start + CHUNK])
+        await asyncio.sleep(0)
+    await response.write_eof()
+    return response
+
+
+async def serve(routes):
+    app = web.Application()
+    for path, handler in routes.items():
+        app.router.add_get(path, handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+def test_chunked_and_gzipped_sitemaps():
+    """A sitemap spread over many network chunks, plain, gzipped and gzip-encoded, yields every URL"""
+    body = sitemap_xml(URL_COUNT)
+    assert len(body) > 100 * CHUNK
+
+    async def run():
+        runner, base = await serve({
+            '/sitemap.xml': lambda request: send_in_chunks(request, body, 'application/xml'),
+            '/sitemap.xml.gz': lambda request: send_in_chunks(request, gzip.compress(body), 'application/gzip'),
+            '/encoded.xml': lambda request: send_in_chunks(request, gzip.compress(body), 'application/xml',
+                                                           **{'Content-Encoding': 'gzip'}),
+        })
+        try:
+            async with aiohttp.ClientSession() as session:
+                for path in ('/sitemap.xml', '/sitemap.xml.gz', '/encoded.xml'):
+                    urls = await fetch_sitemap_urls(session, base + path, max_urls=URL_COUNT)
+                    assert len(urls) == URL_COUNT, (path, len(urls))
+                    assert urls[-1] == f"https://example.edu/page/{URL_COUNT - 1}"
+        finally:
+            await runner.cleanup()
+
+    asyncio.run(run())
+
+
+def test_large_robots_txt():
+    """Rules near the end of a robots.txt larger than one chunk still apply"""
+    filler = ''.join(f"# comment line {i}\n" for i in range(5000))
+    body = f"User-agent: *\n{filler}Disallow: /private/\nCrawl-delay: 7\n".encode()
+    assert len(body) > 10 * CHUNK
+
+    async def run():
+        runner, base = await serve({'/robots.txt': lambda request: send_in_chunks(request, body, 'text/plain')})
+        try:
+            with tempfile.TemporaryDirectory() as tmp:
+                cache = RobotsCache(path=os.path.join(tmp, 'robots.json'))
+                async with aiohttp.ClientSession() as session:
+                    await cache.ensure(session, base + '/')
+                assert not cache.can_fetch(base + '/private/page')
+                assert cache.can_fetch(base + '/public/page')
+                assert cache.crawl_delay(base + '/') == 7.0
+        finally:
+            await runner.cleanup()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    for check in (test_chunked_and_gzipped_sitemaps, test_large_robots_txt):
+        check()
+        print(f"✓ {check.__name__}")
@@ -0,0 +1,30 @@
+import json
+import os
+import tempfile
+
+from persistence import flush_json
+from source_store import SourceIndex
+
+
+def test_save_writes_sources_and_appends_the_run_log():
+    with tempfile.TemporaryDirectory() as tmp:
+        path, log_path = os.path.join(tmp, 'sources.json'), os.path.join(tmp, 'sources_runs.jsonl')
+        index = SourceIndex({'edu': ['https://a.edu/']})
+        index.merge('edu', ['https://b.edu/'])
+        index.save(path, log_path)
+        index.merge('forums', ['https://forum.example.com/', 'https://a.edu/'])
+        index.save(path, log_path)
+        flush_json()
+
+        with open(path) as f:
+            assert json.load(f) == {'edu': ['https://a.edu/', 'https://b.edu/'],
+                                    'forums': ['https://forum.example.com/', 'https://a.edu/']}
+        with open(log_path) as f:
+            runs = [json.loads(line) for line in f]
+        assert [run['added'] for run in runs] == [{'edu': 1}, {'forums': 2}]
+
+
+if __name__ == "__main__":
+    for check in (test_save_writes_sources_and_appends_the_run_log,):
+        check()
+        print(f"✓ {check.__name__}")
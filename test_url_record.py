@@ -0,0 +1,69 @@
+import asyncio
+import os
+import tempfile
+
+from aiohttp import web
+
+from backlink_finder import BacklinkFinder
+from dns_stage import DnsStage, StubBackend
+from multiprocess_scrape import shard_by_host
+from robots_cache import RobotsCache
+from source_store import SourceIndex
+from url_record import url_record
+
+MALFORMED = 'http://[bad/x'
+
+
+def test_malformed_url_record():
+    record = url_record(MALFORMED)
+    assert record.host == '' and record.hostname == ''
+    assert record.canonical == MALFORMED
+    assert url_record('https://Example.edu:443/a/').canonical == 'https://example.edu/a'
+
+
+def test_malformed_url_in_other_stages():
+    """Sharding and the sources index accept a malformed entry instead of raising"""
+    shards = shard_by_host([('edu', MALFORMED), ('edu', 'https://example.edu/')], 2)
+    assert sorted(url for shard in shards for _, _, url in shard) == sorted([MALFORMED, 'https://example.edu/'])
+    index = SourceIndex({'edu': [MALFORMED]})
+    assert index.merge('edu', [MALFORMED, 'http://[bad/y']) == ['http://[bad/y']
+
+
+def test_malformed_url_does_not_stop_the_scrape():
+    """With robots.txt and DNS checks on, a malformed URL fails alone and the others are still scraped"""
+
+    async def page(request):
+        return web.Response(text=f'<html><head><title>Ok</title></head><body><a href="{request.url}">self</a></body></html>',
+                            content_type='text/html')
+
+    async def run():
+        app = web.Application()
+        app.router.add_get('/{tail:.*}', page)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        try:
+            with tempfile.TemporaryDirectory() as tmp:
+                finder = BacklinkFinder()
+                manager = finder.source_manager
+                manager.delay = 0
+                manager.robots = RobotsCache(path=os.path.join(tmp, 'robots.json'))
+                manager.dns = DnsStage(StubBackend({'live.test': ['127.0.0.1']}), path=None, canary=None)
+                live = f"http://live.test:{port}/a"
+                async with manager.session() as session:
+                    sites = await finder.scrape_urls(session, [('edu', MALFORMED), ('edu', live)], asyncio.Semaphore(5))
+                assert sites[0] is None
+                assert sites[1] and sites[1]['url'] == live
+        finally:
+            await runner.cleanup()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    for check in (test_malformed_url_record, test_malformed_url_in_other_stages,
+                  test_malformed_url_does_not_stop_the_scrape):
+        check()
+        print(f"✓ {check.__name__}")
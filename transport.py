@@ -0,0 +1,143 @@
+import socket
+from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Dict, Mapping, Optional
+
+import aiohttp
+
+from fetch_scheduler import FetchError, RETRYABLE_STATUSES
+from streaming_fetch import decode_body, read_limited
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+
+class TransportResponse:
+    """Status, headers and body stream of one response, whichever HTTP library produced it"""
+
+    def __init__(self, status: int, headers: Mapping[str, str], charset: Optional[str], http_version: str,
+                 iter_chunks: Callable[[int], AsyncIterator[bytes]]):
+        self.status = status
+        self.headers = headers
+        self.charset = charset
+        self.http_version = http_version
+        self._iter_chunks = iter_chunks
+
+    async def read(self, max_bytes: Optional[int] = None, chunk_size: int = 16384) -> bytes:
+        """Read the body, or at most max_bytes of it, leaving the rest on the wire"""
+        if max_bytes is None:
+            return b''.join([chunk async for chunk in self._iter_chunks(chunk_size)])
+        return await read_limited(self._iter_chunks(chunk_size), max_bytes)
+
+    async def text(self) -> str:
+        return decode_body(await self.read(), self.charset)
+
+
+class Transport(ABC):
+    """A way of sending GET requests; SourceManager fetches pages through one of these"""
+
+    name = ''
+
+    @abstractmethod
+    def request(self, url: str, headers: Optional[Dict[str, str]] = None, timeout: float = 30):
+        """Async context manager yielding a TransportResponse"""
+
+    async def close(self):
+        pass
+
+
+class AiohttpTransport(Transport):
+    """HTTP/1.1 over aiohttp: one connection per in-flight request to a host.
+
+    Wraps the caller's session when given one; otherwise opens its own on first use.
+    """
+
+    name = 'aiohttp'
+
+    def __init__(self, session: Optional[aiohttp.ClientSession] = None, limit_per_host: int = 0):
+        self.session = session
+        self.owns_session = session is None
+        self.limit_per_host = limit_per_host
+
+    @asynccontextmanager
+    async def request(self, url: str, headers: Optional[Dict[str, str]] = None, timeout: float = 30):
+        if self.session is None:
+            self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit_per_host=self.limit_per_host))
+        async with self.session.get(url, headers=headers, timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+            yield TransportResponse(response.status, response.headers, response.charset,
+                                    f"HTTP/{response.version.major}.{response.version.minor}",
+                                    response.content.iter_chunked)
+
+    async def close(self):
+        if self.owns_session and self.session is not None:
+            await self.session.close()
+            self.session = None
+
+
+class HttpxTransport(Transport):
+    """HTTP/2 over httpx: requests to the same host share one multiplexed connection.
+
+    Hosts that do not offer h2 during the TLS handshake fall back to HTTP/1.1.
+    With prior_knowledge, plain http:// URLs also speak HTTP/2 (h2c), which is
+    what local test servers usually offer. httpx errors are turned into
+    FetchErrors here, so the retry scheduler does not need to know about them.
+    """
+
+    name = 'httpx'
+
+    def __init__(self, max_connections: int = 100, prior_knowledge: bool = False):
+        if httpx is None:
+            raise ImportError("the httpx transport needs: pip install 'httpx[http2]'")
+        self.max_connections = max_connections
+        self.prior_knowledge = prior_knowledge
+        self.client = None
+
+    def _client(self):
+        if self.client is None:
+            self.client = httpx.AsyncClient(
+                http1=not self.prior_knowledge, http2=True, follow_redirects=True,
+                limits=httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections),
+            )
+        return self.client
+
+    @asynccontextmanager
+    async def request(self, url: str, headers: Optional[Dict[str, str]] = None, timeout: float = 30):
+        try:
+            async with self._client().stream('GET', url, headers=headers, timeout=timeout) as response:
+                yield TransportResponse(response.status_code, response.headers, response.charset_encoding,
+                                        response.http_version, response.aiter_bytes)
+        except httpx.HTTPError as e:
+            raise classify_httpx_exception(url, e) from e
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+
+def classify_httpx_exception(url: str, exc: Exception) -> FetchError:
+    """httpx counterpart of fetch_scheduler.classify_exception"""
+    if isinstance(exc, httpx.HTTPStatusError):
+        return FetchError(url, f"HTTP {exc.response.status_code}", exc.response.status_code in RETRYABLE_STATUSES,
+                          status=exc.response.status_code)
+    if isinstance(exc, httpx.ConnectError):
+        # Refused or reset connections recover; unknown hosts do not
+        cause = exc.__context__
+        while cause is not None and not isinstance(cause, socket.gaierror):
+            cause = cause.__context__
+        return FetchError(url, type(exc).__name__, cause is None)
+    if isinstance(exc, (httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError)):
+        return FetchError(url, type(exc).__name__, True)
+    return FetchError(url, type(exc).__name__, False)
+
+
+TRANSPORTS = {
+    'aiohttp': AiohttpTransport,
+    'httpx': HttpxTransport,
+}
+
+
+def make_transport(name: str, **kwargs) -> Transport:
+    return TRANSPORTS[name](**kwargs)
@@ -0,0 +1,92 @@
+import sys
+from functools import lru_cache
+from urllib.parse import urlparse, urlunparse
+
+from site_rules import site_type_rules
+
+DEFAULT_PORTS = {'http': ':80', 'https': ':443'}
+
+# Second-level labels under two-letter country TLDs where names are registered one
+# level deeper (example.co.uk, example.edu.au); a small stand-in for the public suffix list
+SECOND_LEVEL_LABELS = {'ac', 'co', 'com', 'edu', 'go', 'gov', 'ne', 'net', 'or', 'org'}
+
+
+def registrable_domain(hostname: str) -> str:
+    """The name someone registered: www.cs.example.ac.uk -> example.ac.uk"""
+    labels = hostname.split('.')
+    if len(labels) <= 2 or labels[-1].isdigit():
+        return hostname
+    if len(labels[-1]) == 2 and labels[-2] in SECOND_LEVEL_LABELS:
+        return '.'.join(labels[-3:])
+    return '.'.join(labels[-2:])
+
+
+class UrlRecord:
+    """A URL parsed once: its parts, canonical form, registrable domain and site type.
+
+    Records are immutable and come from url_record(), which memoizes them, so
+    the same URL seen by several stages is parsed and lowercased only once.
+    Host-like fields are interned, so the many URLs of one host share them.
+    A URL urlparse rejects (such as http://[bad/x) gets an empty host and
+    keeps its own text as the canonical form, so it fails at fetch time
+    like any other unusable URL instead of raising in every stage.
+    """
+
+    __slots__ = ('url', 'scheme', 'netloc', 'host', 'hostname', 'canonical_host', 'canonical',
+                 'domain', 'tld', 'site_type')
+
+    def __init__(self, url: str):
+        try:
+            parsed = urlparse(url.strip())
+        except ValueError:
+            for name in self.__slots__:
+                object.__setattr__(self, name, '')
+            object.__setattr__(self, 'url', url)
+            object.__setattr__(self, 'canonical', url.strip())
+            object.__setattr__(self, 'site_type', site_type_rules().classify(''))
+            return
+        scheme = sys.intern(parsed.scheme.lower())
+        host = parsed.netloc.lower()
+        canonical_host = host
+        if canonical_host.endswith(DEFAULT_PORTS.get(scheme, '\0')):
+            canonical_host = canonical_host[:-len(DEFAULT_PORTS[scheme])]
+        hostname = parsed.hostname or ''
+        values = {
+            'url': url,
+            'scheme': scheme,
+            'netloc': parsed.netloc,
+            'host': sys.intern(host),
+            'hostname': sys.intern(hostname),
+            'canonical_host': sys.intern(canonical_host),
+            'canonical': urlunparse((scheme, canonical_host, parsed.path.rstrip('/'), parsed.params, parsed.query, '')),
+            'domain': sys.intern(registrable_domain(hostname[4:] if hostname.startswith('www.') else hostname)),
+            'tld': sys.intern(hostname.rsplit('.', 1)[-1]),
+            'site_type': site_type_rules().classify(host),
+        }
+        for name, value in values.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"UrlRecord is immutable (tried to set {name})")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"UrlRecord is immutable (tried to delete {name})")
+
+    @property
+    def origin(self) -> str:
+        return f"{self.scheme}://{self.host}"
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, UrlRecord) and self.url == other.url
+
+    def __hash__(self) -> int:
+        return hash(self.url)
+
+    def __repr__(self) -> str:
+        return f"UrlRecord({self.url!r})"
+
+
+@lru_cache(maxsize=1 << 18)
+def url_record(url: str) -> UrlRecord:
+    """The parsed record for url, built once per distinct string"""
+    return UrlRecord(url)